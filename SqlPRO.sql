@@ -102,10 +102,46 @@ CREATE TABLE IF NOT EXISTS pedidos (
     hora_inicio_cocina TIMESTAMP NULL, -- Hora en que empieza a prepararse
     hora_fin_cocina TIMESTAMP NULL, -- Hora en que termina de prepararse
     -- *** FIN CAMPOS ***
+    version XID8 NOT NULL DEFAULT pg_current_xact_id(), -- Transacción que hizo el último cambio (cursor de /pedidos/cambios)
     FOREIGN KEY (mesa_numero) REFERENCES mesas(numero) ON DELETE SET NULL, -- Si se borra la mesa, el pedido queda sin mesa
     FOREIGN KEY (cliente_id) REFERENCES clientes(id) ON DELETE SET NULL -- Si se borra el cliente, el pedido queda sin cliente
 );
 
+-- Columna de versión para BDs creadas antes de /pedidos/cambios (requiere PostgreSQL 13+)
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS version XID8 NOT NULL DEFAULT pg_current_xact_id();
+
+-- Tabla: pedidos_eliminados
+-- Lápidas de los pedidos borrados, para que /pedidos/cambios pueda informar las eliminaciones.
+-- Se conservan 24 horas (ver borrar_lapidas_antiguas en el trigger de borrado).
+CREATE TABLE IF NOT EXISTS pedidos_eliminados (
+    pedido_id INTEGER NOT NULL,
+    version XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    eliminado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabla: pedidos_lapidas_purgadas
+-- Una sola fila: versión más alta de las lápidas ya borradas. Un cursor de /pedidos/cambios que no
+-- supera ese valor pudo perder eliminaciones, así que el endpoint le devuelve la lista completa.
+CREATE TABLE IF NOT EXISTS pedidos_lapidas_purgadas (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version XID8 NOT NULL
+);
+
+-- Tabla: pedido_items
+-- Una fila por línea de pedido, copia normalizada de pedidos.items (que se mantiene por compatibilidad).
+-- La escriben crear_pedido, actualizar_pedido y eliminar_ultimo_item en la misma transacción que `items`.
+CREATE TABLE IF NOT EXISTS pedido_items (
+    pedido_id INTEGER NOT NULL,
+    linea INTEGER NOT NULL, -- Posición del ítem dentro de pedidos.items (empieza en 1)
+    nombre VARCHAR(255), -- Nombre del plato en el menú
+    tipo VARCHAR(100),
+    precio NUMERIC NOT NULL DEFAULT 0,
+    cantidad INTEGER NOT NULL DEFAULT 1,
+    fecha TIMESTAMP NOT NULL, -- Copia de pedidos.fecha_hora para filtrar por fecha sin el JOIN
+    PRIMARY KEY (pedido_id, linea),
+    FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE
+);
+
 -- Tabla: reservas
 -- Almacena las reservas de mesas.
 CREATE TABLE IF NOT EXISTS reservas (
@@ -119,6 +155,30 @@ CREATE TABLE IF NOT EXISTS reservas (
     FOREIGN KEY (cliente_id) REFERENCES clientes(id) ON DELETE CASCADE -- Si se elimina el cliente, se elimina la reserva
 );
 
+-- Intervalo de cada reserva y regla de no solapamiento (también para BDs creadas antes).
+-- `periodo` es [inicio, fin) y se calcula solo; sin fin se asume 1 hora, como en crear_reserva.
+-- La restricción de exclusión (índice GiST por mesa y periodo) impide dos reservas de la misma
+-- mesa que se pisen, aunque lleguen a la vez desde dos terminales. Si la BD ya tiene reservas
+-- solapadas, el ALTER falla y hay que resolverlas antes. Es DEFERRABLE para que la reasignación
+-- de mesas (POST /reservas/reasignar) pueda intercambiar reservas dentro de una transacción.
+CREATE EXTENSION IF NOT EXISTS btree_gist; -- Para combinar `mesa_numero WITH =` en un índice GiST
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS periodo TSRANGE
+    GENERATED ALWAYS AS (tsrange(fecha_hora_inicio, COALESCE(fecha_hora_fin, fecha_hora_inicio + INTERVAL '1 hour'), '[)')) STORED;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservas_sin_solapamiento' AND NOT condeferrable) THEN
+        ALTER TABLE reservas DROP CONSTRAINT reservas_sin_solapamiento;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservas_sin_solapamiento') THEN
+        ALTER TABLE reservas ADD CONSTRAINT reservas_sin_solapamiento
+            EXCLUDE USING gist (mesa_numero WITH =, periodo WITH &&) DEFERRABLE INITIALLY IMMEDIATE;
+    END IF;
+END;
+$$;
+
+-- Tamaño del grupo (para asignar mesa automáticamente); NULL en reservas anteriores a la columna
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS personas INTEGER CHECK (personas > 0);
+
 -- Tabla: configuraciones (almacenada localmente en JSON, pero definida aquí por si acaso)
 -- Esta tabla se usa en configuraciones_backend.py.
 CREATE TABLE IF NOT EXISTS configuraciones (
@@ -129,6 +189,117 @@ CREATE TABLE IF NOT EXISTS configuraciones (
     fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Secuencias version_<tabla>
+-- Contador de cambios por tabla, mantenido por triggers. Los GET de menú, mesas, inventario,
+-- recetas y clientes lo usan como ETag para responder 304 sin repetir la consulta completa.
+-- Es una secuencia y no una fila: nextval no es transaccional ni bloquea, así que los escritores
+-- de una misma tabla no se esperan entre sí (ver leer_versiones_tablas para los no confirmados).
+-- El valor inicial es el instante de creación en ms, para que un ETag de otra BD no coincida.
+DROP TABLE IF EXISTS versiones_tablas;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['menu', 'mesas', 'pedidos', 'reservas', 'inventario', 'inventario_nombres',
+                             'recetas', 'clientes', 'mesa_estado'] LOOP
+        IF to_regclass('version_' || t) IS NULL THEN
+            EXECUTE format('CREATE SEQUENCE %I', 'version_' || t);
+            PERFORM setval('version_' || t, (EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) * 1000)::BIGINT);
+        END IF;
+    END LOOP;
+END $$;
+
+-- Tabla: ventas_diarias
+-- Resumen de ventas por día, hora y producto de los pedidos Entregado/Pagado (hora y día de `fecha_hora`).
+-- La mantiene el trigger trigger_ventas_diarias; reconstruir con SELECT reconstruir_ventas_diarias();
+CREATE TABLE IF NOT EXISTS ventas_diarias (
+    fecha DATE NOT NULL,
+    hora SMALLINT NOT NULL, -- 0..23
+    producto VARCHAR(255) NOT NULL, -- '' para ítems sin nombre
+    unidades INTEGER NOT NULL DEFAULT 0,
+    ingresos NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, hora, producto)
+);
+
+-- Tabla: pedidos_diarios
+-- Datos por pedido (no por producto) de los mismos pedidos: cantidad y tiempos de cocina.
+CREATE TABLE IF NOT EXISTS pedidos_diarios (
+    fecha DATE PRIMARY KEY,
+    pedidos INTEGER NOT NULL DEFAULT 0,
+    pedidos_cocina INTEGER NOT NULL DEFAULT 0, -- Pedidos con hora_inicio_cocina y hora_fin_cocina
+    minutos_cocina NUMERIC NOT NULL DEFAULT 0 -- Suma de (hora_fin_cocina - hora_inicio_cocina) en minutos
+);
+
+-- Tabla: contadores_app
+-- Último numero_app entregado cada día a los pedidos de la mesa virtual (99). Se incrementa con
+-- INSERT ... ON CONFLICT DO UPDATE ... RETURNING: el bloqueo de la fila del día hace que dos pedidos
+-- simultáneos nunca reciban el mismo número, y si la transacción se revierte el número se reutiliza.
+CREATE TABLE IF NOT EXISTS contadores_app (
+    fecha DATE PRIMARY KEY,
+    ultimo INTEGER NOT NULL DEFAULT 0
+);
+
+-- Continuar la numeración de hoy si ya hay pedidos de la app (BDs anteriores al contador)
+INSERT INTO contadores_app (fecha, ultimo)
+SELECT CURRENT_DATE, COALESCE(MAX(numero_app), 0)
+FROM pedidos
+WHERE mesa_numero = 99 AND fecha_hora >= CURRENT_DATE
+ON CONFLICT (fecha) DO NOTHING;
+
+-- Tabla: reservas_ocupacion
+-- Mapa de bits por día y mesa: 96 franjas de 15 minutos (bit 1 = 00:00-00:15), 1 = reservada.
+-- Solo hay fila para los días con alguna reserva en esa mesa. La mantiene trigger_reservas_ocupacion;
+-- reconstruir con SELECT reconstruir_reservas_ocupacion();
+CREATE TABLE IF NOT EXISTS reservas_ocupacion (
+    fecha DATE NOT NULL,
+    mesa_numero INTEGER NOT NULL,
+    franjas BIT(96) NOT NULL,
+    PRIMARY KEY (fecha, mesa_numero),
+    FOREIGN KEY (mesa_numero) REFERENCES mesas(numero) ON DELETE CASCADE
+);
+
+-- Tabla: mesa_estado
+-- Estado de cada mesa para la grilla de mesas (GET /mesas): pedidos activos y próxima reserva.
+-- La mantienen los triggers de pedidos, reservas y mesas; reconstruir con SELECT reconstruir_mesa_estado();
+CREATE TABLE IF NOT EXISTS mesa_estado (
+    mesa_numero INTEGER PRIMARY KEY,
+    pedidos_activos INTEGER NOT NULL DEFAULT 0, -- Pedidos Pendiente / En preparacion / Listo
+    reserva_id INTEGER, -- Primera reserva que empieza hoy o después (NULL si no hay)
+    reserva_cliente_id INTEGER,
+    reserva_inicio TIMESTAMP,
+    reserva_fin TIMESTAMP,
+    FOREIGN KEY (mesa_numero) REFERENCES mesas(numero) ON DELETE CASCADE
+);
+
+-- Tabla: movimientos_inventario
+-- Libro de movimientos de stock, solo de inserción: cada cambio de inventario.cantidad_disponible
+-- deja una fila (la escribe el trigger registrar_movimientos_inventario, no la aplicación).
+-- `cantidad` es el cambio (positivo entra, negativo sale) y `saldo` el stock que quedó, así el stock
+-- en un momento dado es el saldo del último movimiento anterior. Sin FK a inventario: la historia
+-- de un ingrediente eliminado se conserva.
+CREATE TABLE IF NOT EXISTS movimientos_inventario (
+    id BIGSERIAL PRIMARY KEY,
+    ingrediente_id INTEGER NOT NULL,
+    fecha_hora TIMESTAMP NOT NULL DEFAULT clock_timestamp()::timestamp,
+    tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('inicial', 'consumo', 'reposicion', 'ajuste', 'merma', 'baja')),
+    cantidad DECIMAL(10, 2) NOT NULL,
+    saldo DECIMAL(10, 2) NOT NULL,
+    pedido_id INTEGER, -- Pedido que consumió el stock (tipo 'consumo')
+    nota TEXT
+);
+
+-- Tabla: inventario_snapshots
+-- Foto diaria del stock: la toma el backend a HORA_SNAPSHOT_INVENTARIO (SnapshotsInventario en
+-- movimientos_inventario.py); a mano con SELECT tomar_snapshot_inventario(); o python movimientos_inventario.py snapshot.
+-- Sirve de punto de partida para el stock histórico cuando los movimientos viejos se archivan.
+CREATE TABLE IF NOT EXISTS inventario_snapshots (
+    fecha_hora TIMESTAMP NOT NULL,
+    ingrediente_id INTEGER NOT NULL,
+    cantidad DECIMAL(10, 2) NOT NULL,
+    PRIMARY KEY (ingrediente_id, fecha_hora)
+);
+
 -- 4. Índices (para mejorar rendimiento en consultas frecuentes)
 
 -- Índice en pedidos por estado y fecha_hora (para reportes y vistas activas)
@@ -143,15 +314,42 @@ CREATE INDEX IF NOT EXISTS idx_pedidos_fecha ON pedidos (fecha_hora);
 -- Índice en pedidos por mesa_numero (para vistas de mesas)
 CREATE INDEX IF NOT EXISTS idx_pedidos_mesa ON pedidos (mesa_numero);
 
--- Índice en inventario por cantidad_disponible y cantidad_minima_alerta (para alertas de stock)
+-- Índices en líneas de pedido por plato y fecha (análisis de productos y consultas por plato)
+CREATE INDEX IF NOT EXISTS idx_pedido_items_nombre_fecha ON pedido_items (nombre, fecha);
+CREATE INDEX IF NOT EXISTS idx_pedido_items_fecha ON pedido_items (fecha);
+
+-- Índice en pedidos por fin de cocina (detalle de /reportes/eficiencia_cocina)
+CREATE INDEX IF NOT EXISTS idx_pedidos_fin_cocina ON pedidos (hora_fin_cocina) WHERE hora_fin_cocina IS NOT NULL;
+
+-- Índice en pedidos por versión (para /pedidos/cambios)
+CREATE INDEX IF NOT EXISTS idx_pedidos_version ON pedidos (version);
+
+-- Índices en lápidas de pedidos (consulta por versión y limpieza por antigüedad)
+CREATE INDEX IF NOT EXISTS idx_pedidos_eliminados_version ON pedidos_eliminados (version);
+CREATE INDEX IF NOT EXISTS idx_pedidos_eliminados_fecha ON pedidos_eliminados (eliminado_en);
+
+-- Índice en inventario por cantidad_disponible y cantidad_minima_alerta (alertas con umbral fijo: cantidad_disponible <= X)
 CREATE INDEX IF NOT EXISTS idx_inventario_stock ON inventario (cantidad_disponible, cantidad_minima_alerta);
 
+-- Índice parcial con solo los ingredientes en alerta (GET /inventario/alertas): contiene unas pocas
+-- filas y su condición coincide con la de la consulta, así que no se recorre el inventario
+CREATE INDEX IF NOT EXISTS idx_inventario_alertas ON inventario (nombre) WHERE cantidad_disponible <= cantidad_minima_alerta;
+
+-- Índice en movimientos_inventario por ingrediente y fecha (último movimiento antes de un momento: stock histórico)
+CREATE INDEX IF NOT EXISTS idx_movimientos_inventario_ingrediente ON movimientos_inventario (ingrediente_id, fecha_hora DESC, id DESC);
+
+-- Índice en movimientos_inventario por fecha (consumo de un rango de fechas)
+CREATE INDEX IF NOT EXISTS idx_movimientos_inventario_fecha ON movimientos_inventario (fecha_hora);
+
 -- Índice en reservas por fecha_hora_inicio (para vistas de reservas)
 CREATE INDEX IF NOT EXISTS idx_reservas_fecha_inicio ON reservas (fecha_hora_inicio);
 
 -- Índice en reservas por fecha_hora_inicio y fecha_hora_fin (para disponibilidad de mesas)
 CREATE INDEX IF NOT EXISTS idx_reservas_fecha_hora ON reservas (fecha_hora_inicio, fecha_hora_fin);
 
+-- Índice en reservas por mesa y fecha_hora_inicio (próxima reserva de cada mesa en mesa_estado)
+CREATE INDEX IF NOT EXISTS idx_reservas_mesa_inicio ON reservas (mesa_numero, fecha_hora_inicio);
+
 -- Índice en clientes por nombre (para búsqueda rápida)
 CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes (nombre);
 
@@ -160,11 +358,12 @@ CREATE INDEX IF NOT EXISTS idx_menu_tipo ON menu (tipo);
 
 -- 5. Triggers para actualizar `updated_at` y `fecha_actualizacion` automáticamente (mejora integridad y facilita reportes)
 
--- Trigger para actualizar `updated_at` en `pedidos` antes de cada UPDATE
+-- Trigger para actualizar `updated_at` y `version` en `pedidos` antes de cada UPDATE
 CREATE OR REPLACE FUNCTION actualizar_fecha_pedido()
 RETURNS TRIGGER AS $$
 BEGIN
     NEW.updated_at = CURRENT_TIMESTAMP;
+    NEW.version = pg_current_xact_id();
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
@@ -174,6 +373,48 @@ CREATE TRIGGER trigger_actualizar_fecha_pedido
     FOR EACH ROW
     EXECUTE FUNCTION actualizar_fecha_pedido();
 
+-- Trigger para dejar una lápida en `pedidos_eliminados` por cada pedido borrado
+CREATE OR REPLACE FUNCTION registrar_pedido_eliminado()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO pedidos_eliminados (pedido_id) VALUES (OLD.id);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_registrar_pedido_eliminado ON pedidos;
+CREATE TRIGGER trigger_registrar_pedido_eliminado
+    AFTER DELETE ON pedidos
+    FOR EACH ROW
+    EXECUTE FUNCTION registrar_pedido_eliminado();
+
+-- Limpieza de lápidas con más de 24 horas (una vez por sentencia de borrado, no por fila).
+-- Guarda la versión más alta borrada en pedidos_lapidas_purgadas: /pedidos/cambios responde con la
+-- lista completa a los cursores que no la superan. Solo escribe esa fila cuando de verdad borró algo.
+CREATE OR REPLACE FUNCTION borrar_lapidas_antiguas()
+RETURNS TRIGGER AS $$
+DECLARE
+    purgada XID8;
+BEGIN
+    WITH borradas AS (
+        DELETE FROM pedidos_eliminados WHERE eliminado_en < CURRENT_TIMESTAMP - INTERVAL '24 hours'
+        RETURNING version
+    )
+    SELECT version INTO purgada FROM borradas ORDER BY version DESC LIMIT 1;
+    IF purgada IS NOT NULL THEN
+        INSERT INTO pedidos_lapidas_purgadas (id, version) VALUES (TRUE, purgada)
+        ON CONFLICT (id) DO UPDATE SET version = GREATEST(pedidos_lapidas_purgadas.version, EXCLUDED.version);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_borrar_lapidas_antiguas ON pedidos;
+CREATE TRIGGER trigger_borrar_lapidas_antiguas
+    AFTER DELETE ON pedidos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION borrar_lapidas_antiguas();
+
 -- Trigger para actualizar `fecha_actualizacion` en `inventario` antes de cada UPDATE
 CREATE OR REPLACE FUNCTION actualizar_fecha_inventario()
 RETURNS TRIGGER AS $$
@@ -202,6 +443,609 @@ CREATE TRIGGER trigger_actualizar_fecha_receta
     FOR EACH ROW
     EXECUTE FUNCTION actualizar_fecha_receta();
 
+-- Notificaciones de cambios (LISTEN/NOTIFY) para el flujo de eventos /eventos (eventos_backend.py)
+-- Trigger por sentencia: un solo NOTIFY por tabla y transacción (PostgreSQL descarta los duplicados),
+-- así un pedido que descuenta varios ingredientes genera un único evento de inventario.
+CREATE OR REPLACE FUNCTION notificar_cambio()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify(
+        'restaurante_eventos',
+        json_build_object('tabla', COALESCE(TG_ARGV[0], TG_TABLE_NAME), 'operacion', TG_OP)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_notificar_pedidos ON pedidos;
+CREATE TRIGGER trigger_notificar_pedidos
+    AFTER INSERT OR UPDATE OR DELETE ON pedidos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_mesas ON mesas;
+CREATE TRIGGER trigger_notificar_mesas
+    AFTER INSERT OR UPDATE OR DELETE ON mesas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_reservas ON reservas;
+CREATE TRIGGER trigger_notificar_reservas
+    AFTER INSERT OR UPDATE OR DELETE ON reservas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_inventario ON inventario;
+CREATE TRIGGER trigger_notificar_inventario
+    AFTER INSERT OR UPDATE OR DELETE ON inventario
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_recetas ON recetas;
+CREATE TRIGGER trigger_notificar_recetas
+    AFTER INSERT OR UPDATE OR DELETE ON recetas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_ingredientes_recetas ON ingredientes_recetas;
+CREATE TRIGGER trigger_notificar_ingredientes_recetas
+    AFTER INSERT OR UPDATE OR DELETE ON ingredientes_recetas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio('recetas'); -- Se notifica como cambio de recetas
+
+DROP TRIGGER IF EXISTS trigger_notificar_clientes ON clientes;
+CREATE TRIGGER trigger_notificar_clientes
+    AFTER INSERT OR UPDATE OR DELETE ON clientes
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_notificar_menu ON menu;
+CREATE TRIGGER trigger_notificar_menu
+    AFTER INSERT OR UPDATE OR DELETE ON menu
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_cambio();
+
+-- Evento 'inventario_alertas' cuando un ingrediente cruza su nivel de alerta (cantidad_minima_alerta)
+-- en cualquier sentido: pedidos que descuentan stock, ediciones del inventario, reposiciones.
+-- Un solo evento por sentencia con los ingredientes que cruzaron; nada si ninguno cruzó.
+CREATE OR REPLACE FUNCTION notificar_alertas_inventario()
+RETURNS TRIGGER AS $$
+DECLARE
+    cruces JSON;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT json_agg(json_build_object('id', n.id, 'nombre', n.nombre, 'bajo', TRUE) ORDER BY n.nombre)
+        INTO cruces
+        FROM nuevos n
+        WHERE n.cantidad_disponible <= n.cantidad_minima_alerta;
+    ELSE
+        SELECT json_agg(json_build_object('id', n.id, 'nombre', n.nombre, 'bajo', n.cantidad_disponible <= n.cantidad_minima_alerta) ORDER BY n.nombre)
+        INTO cruces
+        FROM nuevos n
+        JOIN anteriores a ON a.id = n.id
+        WHERE (a.cantidad_disponible <= a.cantidad_minima_alerta) <> (n.cantidad_disponible <= n.cantidad_minima_alerta);
+    END IF;
+    IF cruces IS NOT NULL THEN
+        PERFORM pg_notify(
+            'restaurante_eventos',
+            json_build_object('tabla', 'inventario_alertas', 'operacion', TG_OP, 'ingredientes', cruces)::text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Las tablas de transición no admiten varios eventos en un mismo trigger: uno para INSERT y otro para UPDATE
+DROP TRIGGER IF EXISTS trigger_alertas_inventario_insert ON inventario;
+CREATE TRIGGER trigger_alertas_inventario_insert
+    AFTER INSERT ON inventario
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_alertas_inventario();
+
+DROP TRIGGER IF EXISTS trigger_alertas_inventario_update ON inventario;
+CREATE TRIGGER trigger_alertas_inventario_update
+    AFTER UPDATE ON inventario
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_alertas_inventario();
+
+-- Evento 'inventario_stock' con las cantidades nuevas de los ingredientes cuyo stock cambió, para
+-- recalcular en memoria solo los platos afectados (disponibilidad_menu.py). Si cambian muchos a la
+-- vez se envía sin detalle (el payload de NOTIFY tiene límite) y el backend recarga todo.
+CREATE OR REPLACE FUNCTION notificar_stock_inventario()
+RETURNS TRIGGER AS $$
+DECLARE
+    total INTEGER;
+    cambios JSON;
+BEGIN
+    SELECT COUNT(*), json_agg(json_build_object('id', n.id, 'cantidad', n.cantidad_disponible))
+    INTO total, cambios
+    FROM nuevos n
+    JOIN anteriores a ON a.id = n.id
+    WHERE n.cantidad_disponible <> a.cantidad_disponible;
+    IF total > 0 THEN
+        PERFORM pg_notify(
+            'restaurante_eventos',
+            json_build_object('tabla', 'inventario_stock', 'operacion', TG_OP, 'cambios', CASE WHEN total <= 100 THEN cambios END)::text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_stock_inventario ON inventario;
+CREATE TRIGGER trigger_stock_inventario
+    AFTER UPDATE ON inventario
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notificar_stock_inventario();
+
+-- Libro de movimientos: una fila por ingrediente cuyo stock cambió en la sentencia. El motivo lo
+-- indica la aplicación antes de escribir, con variables de la transacción (movimientos_inventario.py):
+--   restaurante.motivo_inventario ('consumo', 'reposicion', 'merma'...; por defecto 'ajuste'),
+--   restaurante.pedido_inventario y restaurante.nota_inventario.
+-- fecha_hora usa clock_timestamp(): el bloqueo de la fila de inventario ordena los movimientos de un
+-- mismo ingrediente aunque las transacciones hayan empezado en otro orden.
+CREATE OR REPLACE FUNCTION registrar_movimientos_inventario()
+RETURNS TRIGGER AS $$
+DECLARE
+    motivo_actual TEXT := NULLIF(current_setting('restaurante.motivo_inventario', true), '');
+    pedido_actual INTEGER := NULLIF(current_setting('restaurante.pedido_inventario', true), '')::integer;
+    nota_actual TEXT := NULLIF(current_setting('restaurante.nota_inventario', true), '');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO movimientos_inventario (ingrediente_id, tipo, cantidad, saldo, nota)
+        SELECT n.id, 'inicial', n.cantidad_disponible, n.cantidad_disponible, nota_actual
+        FROM nuevos n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO movimientos_inventario (ingrediente_id, tipo, cantidad, saldo, pedido_id, nota)
+        SELECT n.id, COALESCE(motivo_actual, 'ajuste'), n.cantidad_disponible - a.cantidad_disponible,
+               n.cantidad_disponible, pedido_actual, nota_actual
+        FROM nuevos n
+        JOIN anteriores a ON a.id = n.id
+        WHERE n.cantidad_disponible <> a.cantidad_disponible
+        ORDER BY n.id;
+    ELSE
+        INSERT INTO movimientos_inventario (ingrediente_id, tipo, cantidad, saldo, nota)
+        SELECT a.id, 'baja', -a.cantidad_disponible, 0, nota_actual
+        FROM anteriores a;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Un trigger por evento (tablas de transición). En un INSERT ... ON CONFLICT DO UPDATE las filas
+-- insertadas llegan al de INSERT y las actualizadas al de UPDATE.
+DROP TRIGGER IF EXISTS trigger_movimientos_inventario_insert ON inventario;
+CREATE TRIGGER trigger_movimientos_inventario_insert
+    AFTER INSERT ON inventario
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION registrar_movimientos_inventario();
+
+DROP TRIGGER IF EXISTS trigger_movimientos_inventario_update ON inventario;
+CREATE TRIGGER trigger_movimientos_inventario_update
+    AFTER UPDATE ON inventario
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION registrar_movimientos_inventario();
+
+DROP TRIGGER IF EXISTS trigger_movimientos_inventario_delete ON inventario;
+CREATE TRIGGER trigger_movimientos_inventario_delete
+    AFTER DELETE ON inventario
+    REFERENCING OLD TABLE AS anteriores
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION registrar_movimientos_inventario();
+
+-- Foto del stock actual en inventario_snapshots. Devuelve cuántos ingredientes se guardaron.
+CREATE OR REPLACE FUNCTION tomar_snapshot_inventario()
+RETURNS INTEGER AS $$
+DECLARE
+    total INTEGER;
+BEGIN
+    INSERT INTO inventario_snapshots (fecha_hora, ingrediente_id, cantidad)
+    SELECT LOCALTIMESTAMP, id, cantidad_disponible
+    FROM inventario
+    ON CONFLICT (ingrediente_id, fecha_hora) DO NOTHING;
+    GET DIAGNOSTICS total = ROW_COUNT;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Versión por tabla para los ETag (secuencias version_<tabla>). Trigger por sentencia:
+-- un UPDATE que toca muchas filas suma una sola versión.
+-- nextval se ve en el acto, antes del COMMIT. Por eso el escritor toma además un advisory lock
+-- COMPARTIDO de la tabla hasta terminar la transacción: no bloquea a otros escritores (los
+-- compartidos no chocan entre sí) y le indica a leer_versiones_tablas que hay un cambio sin confirmar.
+CREATE OR REPLACE FUNCTION incrementar_version_tabla()
+RETURNS TRIGGER AS $$
+DECLARE
+    tabla TEXT := COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+BEGIN
+    PERFORM pg_advisory_xact_lock_shared(hashtext('version_' || tabla));
+    PERFORM nextval('version_' || tabla);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Versión actual de cada tabla pedida, o NULL si hay una transacción con cambios en ella sin
+-- confirmar (su versión ya subió pero sus datos aún no se ven: no se puede usar como ETag).
+-- Lee la secuencia ANTES de comprobar el lock: un escritor que empieza después no subió la versión leída.
+CREATE OR REPLACE FUNCTION leer_versiones_tablas(p_tablas TEXT[])
+RETURNS TABLE (tabla TEXT, version BIGINT) AS $$
+DECLARE
+    t TEXT;
+    valor BIGINT;
+BEGIN
+    FOREACH t IN ARRAY p_tablas LOOP
+        EXECUTE format('SELECT last_value FROM %I', 'version_' || t) INTO valor;
+        IF pg_try_advisory_lock(hashtext('version_' || t)) THEN
+            PERFORM pg_advisory_unlock(hashtext('version_' || t));
+        ELSE
+            valor := NULL;
+        END IF;
+        tabla := t;
+        version := valor;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_version_menu ON menu;
+CREATE TRIGGER trigger_version_menu
+    AFTER INSERT OR UPDATE OR DELETE ON menu
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+DROP TRIGGER IF EXISTS trigger_version_mesas ON mesas;
+CREATE TRIGGER trigger_version_mesas
+    AFTER INSERT OR UPDATE OR DELETE ON mesas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+DROP TRIGGER IF EXISTS trigger_version_pedidos ON pedidos;
+CREATE TRIGGER trigger_version_pedidos
+    AFTER INSERT OR UPDATE OR DELETE ON pedidos
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+DROP TRIGGER IF EXISTS trigger_version_reservas ON reservas;
+CREATE TRIGGER trigger_version_reservas
+    AFTER INSERT OR UPDATE OR DELETE ON reservas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+DROP TRIGGER IF EXISTS trigger_version_inventario ON inventario;
+CREATE TRIGGER trigger_version_inventario
+    AFTER INSERT OR UPDATE OR DELETE ON inventario
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+-- Las recetas solo muestran el nombre del ingrediente: no cambian cuando se descuenta stock
+DROP TRIGGER IF EXISTS trigger_version_inventario_nombres ON inventario;
+CREATE TRIGGER trigger_version_inventario_nombres
+    AFTER INSERT OR UPDATE OF nombre OR DELETE ON inventario
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla('inventario_nombres');
+
+DROP TRIGGER IF EXISTS trigger_version_recetas ON recetas;
+CREATE TRIGGER trigger_version_recetas
+    AFTER INSERT OR UPDATE OR DELETE ON recetas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+DROP TRIGGER IF EXISTS trigger_version_ingredientes_recetas ON ingredientes_recetas;
+CREATE TRIGGER trigger_version_ingredientes_recetas
+    AFTER INSERT OR UPDATE OR DELETE ON ingredientes_recetas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla('recetas');
+
+DROP TRIGGER IF EXISTS trigger_version_clientes ON clientes;
+CREATE TRIGGER trigger_version_clientes
+    AFTER INSERT OR UPDATE OR DELETE ON clientes
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+-- GET /mesas depende de mesa_estado y no de pedidos: editar los ítems de un pedido no invalida su ETag
+DROP TRIGGER IF EXISTS trigger_version_mesa_estado ON mesa_estado;
+CREATE TRIGGER trigger_version_mesa_estado
+    AFTER INSERT OR UPDATE OR DELETE ON mesa_estado
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_version_tabla();
+
+-- Resumen de ventas (tablas ventas_diarias y pedidos_diarios)
+-- Ítems del pedido como array JSONB, también si quedaron guardados como texto JSON
+CREATE OR REPLACE FUNCTION items_pedido(items JSONB)
+RETURNS JSONB AS $$
+    SELECT CASE jsonb_typeof(items)
+        WHEN 'array' THEN items
+        WHEN 'string' THEN (items #>> '{}')::jsonb
+        ELSE '[]'::jsonb
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Suma (signo = 1) o resta (signo = -1) un pedido del resumen
+CREATE OR REPLACE FUNCTION acumular_venta_pedido(p pedidos, signo INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p.fecha_hora IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO ventas_diarias (fecha, hora, producto, unidades, ingresos)
+    SELECT p.fecha_hora::date, EXTRACT(HOUR FROM p.fecha_hora)::smallint, COALESCE(item.nombre, ''),
+           signo * COUNT(*), signo * COALESCE(SUM(item.precio), 0)
+    FROM jsonb_to_recordset(items_pedido(p.items)) AS item(nombre TEXT, precio NUMERIC)
+    GROUP BY COALESCE(item.nombre, '')
+    ON CONFLICT (fecha, hora, producto) DO UPDATE
+    SET unidades = ventas_diarias.unidades + EXCLUDED.unidades,
+        ingresos = ventas_diarias.ingresos + EXCLUDED.ingresos;
+
+    INSERT INTO pedidos_diarios (fecha, pedidos, pedidos_cocina, minutos_cocina)
+    VALUES (
+        p.fecha_hora::date,
+        signo,
+        CASE WHEN p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NOT NULL THEN signo ELSE 0 END,
+        CASE WHEN p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NOT NULL
+             THEN signo * EXTRACT(EPOCH FROM (p.hora_fin_cocina - p.hora_inicio_cocina)) / 60.0 ELSE 0 END
+    )
+    ON CONFLICT (fecha) DO UPDATE
+    SET pedidos = pedidos_diarios.pedidos + EXCLUDED.pedidos,
+        pedidos_cocina = pedidos_diarios.pedidos_cocina + EXCLUDED.pedidos_cocina,
+        minutos_cocina = pedidos_diarios.minutos_cocina + EXCLUDED.minutos_cocina;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Un pedido cuenta como venta mientras está Entregado o Pagado: se suma al llegar a esos estados
+-- y se resta si sale de ellos, se borra o se modifica (se resta la versión vieja y se suma la nueva).
+CREATE OR REPLACE FUNCTION mantener_ventas_diarias()
+RETURNS TRIGGER AS $$
+DECLARE
+    contaba BOOLEAN := TG_OP <> 'INSERT' AND OLD.estado IN ('Entregado', 'Pagado');
+    cuenta BOOLEAN := TG_OP <> 'DELETE' AND NEW.estado IN ('Entregado', 'Pagado');
+BEGIN
+    -- Entregado -> Pagado sin otros cambios: el resumen no cambia
+    IF contaba AND cuenta
+       AND OLD.items = NEW.items
+       AND OLD.fecha_hora IS NOT DISTINCT FROM NEW.fecha_hora
+       AND OLD.hora_inicio_cocina IS NOT DISTINCT FROM NEW.hora_inicio_cocina
+       AND OLD.hora_fin_cocina IS NOT DISTINCT FROM NEW.hora_fin_cocina THEN
+        RETURN NULL;
+    END IF;
+    IF contaba THEN
+        PERFORM acumular_venta_pedido(OLD, -1);
+    END IF;
+    IF cuenta THEN
+        PERFORM acumular_venta_pedido(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_ventas_diarias ON pedidos;
+CREATE TRIGGER trigger_ventas_diarias
+    AFTER INSERT OR DELETE OR UPDATE OF estado, items, fecha_hora, hora_inicio_cocina, hora_fin_cocina ON pedidos
+    FOR EACH ROW
+    EXECUTE FUNCTION mantener_ventas_diarias();
+
+-- Recalcula el resumen completo desde pedidos (carga inicial o corrección).
+-- Bloquea las escrituras en pedidos mientras corre.
+CREATE OR REPLACE FUNCTION reconstruir_ventas_diarias()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE pedidos IN SHARE MODE;
+    DELETE FROM ventas_diarias;
+    DELETE FROM pedidos_diarios;
+
+    INSERT INTO ventas_diarias (fecha, hora, producto, unidades, ingresos)
+    SELECT p.fecha_hora::date, EXTRACT(HOUR FROM p.fecha_hora)::smallint, COALESCE(item.nombre, ''),
+           COUNT(*), COALESCE(SUM(item.precio), 0)
+    FROM pedidos p
+    CROSS JOIN LATERAL jsonb_to_recordset(items_pedido(p.items)) AS item(nombre TEXT, precio NUMERIC)
+    WHERE p.estado IN ('Entregado', 'Pagado') AND p.fecha_hora IS NOT NULL
+    GROUP BY 1, 2, 3;
+
+    INSERT INTO pedidos_diarios (fecha, pedidos, pedidos_cocina, minutos_cocina)
+    SELECT p.fecha_hora::date,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NOT NULL),
+           COALESCE(SUM(EXTRACT(EPOCH FROM (p.hora_fin_cocina - p.hora_inicio_cocina)) / 60.0)
+                    FILTER (WHERE p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NOT NULL), 0)
+    FROM pedidos p
+    WHERE p.estado IN ('Entregado', 'Pagado') AND p.fecha_hora IS NOT NULL
+    GROUP BY 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Estado de mesas (tabla mesa_estado)
+-- Cuenta de pedidos activos por mesa: solo cambia cuando un pedido entra o sale de los estados
+-- activos o cambia de mesa (editar ítems o notas no toca mesa_estado).
+CREATE OR REPLACE FUNCTION mantener_mesa_estado_pedidos()
+RETURNS TRIGGER AS $$
+DECLARE
+    estados_activos CONSTANT TEXT[] := ARRAY['Pendiente', 'En preparacion', 'Listo'];
+    mesa_anterior INTEGER;
+    mesa_nueva INTEGER;
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.estado = ANY(estados_activos) THEN
+        mesa_anterior := OLD.mesa_numero;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.estado = ANY(estados_activos) THEN
+        mesa_nueva := NEW.mesa_numero;
+    END IF;
+    IF mesa_anterior IS NOT DISTINCT FROM mesa_nueva THEN
+        RETURN NULL;
+    END IF;
+    IF mesa_anterior IS NOT NULL THEN
+        UPDATE mesa_estado SET pedidos_activos = pedidos_activos - 1 WHERE mesa_numero = mesa_anterior;
+    END IF;
+    IF mesa_nueva IS NOT NULL THEN
+        UPDATE mesa_estado SET pedidos_activos = pedidos_activos + 1 WHERE mesa_numero = mesa_nueva;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_mesa_estado_pedidos ON pedidos;
+CREATE TRIGGER trigger_mesa_estado_pedidos
+    AFTER INSERT OR DELETE OR UPDATE OF estado, mesa_numero ON pedidos
+    FOR EACH ROW
+    EXECUTE FUNCTION mantener_mesa_estado_pedidos();
+
+-- Próxima reserva (la primera que empieza hoy o después) de una mesa, o de todas si p_mesa es NULL.
+-- Como depende de la fecha actual, GET /mesas la vuelve a calcular cuando encuentra una reserva de días anteriores.
+CREATE OR REPLACE FUNCTION refrescar_reservas_mesa_estado(p_mesa INTEGER DEFAULT NULL)
+RETURNS VOID AS $$
+    UPDATE mesa_estado me
+    SET (reserva_id, reserva_cliente_id, reserva_inicio, reserva_fin) = (
+        SELECT r.id, r.cliente_id, r.fecha_hora_inicio, r.fecha_hora_fin
+        FROM reservas r
+        WHERE r.mesa_numero = me.mesa_numero
+        AND r.fecha_hora_inicio >= CURRENT_DATE
+        ORDER BY r.fecha_hora_inicio, r.id
+        LIMIT 1
+    )
+    WHERE p_mesa IS NULL OR me.mesa_numero = p_mesa;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION mantener_mesa_estado_reservas()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM refrescar_reservas_mesa_estado(OLD.mesa_numero);
+    END IF;
+    IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.mesa_numero IS DISTINCT FROM OLD.mesa_numero) THEN
+        PERFORM refrescar_reservas_mesa_estado(NEW.mesa_numero);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_mesa_estado_reservas ON reservas;
+CREATE TRIGGER trigger_mesa_estado_reservas
+    AFTER INSERT OR UPDATE OR DELETE ON reservas
+    FOR EACH ROW
+    EXECUTE FUNCTION mantener_mesa_estado_reservas();
+
+-- Ocupación de reservas por franjas de 15 minutos (tabla reservas_ocupacion)
+-- Bits de las franjas del día `dia` que toca el periodo [inicio, fin) de una reserva
+CREATE OR REPLACE FUNCTION franjas_reserva(periodo TSRANGE, dia DATE)
+RETURNS BIT(96) AS $$
+DECLARE
+    desde INTEGER;
+    hasta INTEGER;
+BEGIN
+    desde := FLOOR(EXTRACT(EPOCH FROM (GREATEST(lower(periodo), dia::timestamp) - dia::timestamp)) / 900);
+    hasta := CEIL(EXTRACT(EPOCH FROM (LEAST(upper(periodo), dia::timestamp + INTERVAL '1 day') - dia::timestamp)) / 900);
+    IF hasta <= desde THEN
+        RETURN REPEAT('0', 96)::BIT(96);
+    END IF;
+    RETURN RPAD(REPEAT('0', desde) || REPEAT('1', hasta - desde), 96, '0')::BIT(96);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Recalcula los mapas de una mesa entre dos días (ambos incluidos) a partir de sus reservas
+CREATE OR REPLACE FUNCTION recalcular_reservas_ocupacion(p_mesa INTEGER, p_desde DATE, p_hasta DATE)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM reservas_ocupacion WHERE mesa_numero = p_mesa AND fecha BETWEEN p_desde AND p_hasta;
+    INSERT INTO reservas_ocupacion (fecha, mesa_numero, franjas)
+    SELECT d.dia::date, p_mesa, bit_or(franjas_reserva(r.periodo, d.dia::date))
+    FROM generate_series(p_desde::timestamp, p_hasta::timestamp, INTERVAL '1 day') AS d(dia) -- TIMESTAMP (no timestamptz) para tsrange
+    JOIN reservas r ON r.mesa_numero = p_mesa
+        AND r.periodo && tsrange(d.dia, d.dia + INTERVAL '1 day', '[)')
+    GROUP BY d.dia;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION mantener_reservas_ocupacion()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- upper() es exclusivo: una reserva que termina a las 00:00 no ocupa el día siguiente
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM recalcular_reservas_ocupacion(OLD.mesa_numero, lower(OLD.periodo)::date, (upper(OLD.periodo) - INTERVAL '1 microsecond')::date);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM recalcular_reservas_ocupacion(NEW.mesa_numero, lower(NEW.periodo)::date, (upper(NEW.periodo) - INTERVAL '1 microsecond')::date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_reservas_ocupacion ON reservas;
+CREATE TRIGGER trigger_reservas_ocupacion
+    AFTER INSERT OR UPDATE OR DELETE ON reservas
+    FOR EACH ROW
+    EXECUTE FUNCTION mantener_reservas_ocupacion();
+
+-- Recalcula reservas_ocupacion desde cero (carga inicial o para corregir diferencias)
+CREATE OR REPLACE FUNCTION reconstruir_reservas_ocupacion()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE reservas IN SHARE MODE;
+    DELETE FROM reservas_ocupacion;
+    INSERT INTO reservas_ocupacion (fecha, mesa_numero, franjas)
+    SELECT d.dia::date, r.mesa_numero, bit_or(franjas_reserva(r.periodo, d.dia::date))
+    FROM reservas r
+    CROSS JOIN LATERAL generate_series(lower(r.periodo)::date, (upper(r.periodo) - INTERVAL '1 microsecond')::date, INTERVAL '1 day') AS d(dia)
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cada mesa nueva arranca con su fila en mesa_estado (al borrarla, la FK borra la fila)
+CREATE OR REPLACE FUNCTION crear_mesa_estado()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO mesa_estado (mesa_numero) VALUES (NEW.numero) ON CONFLICT (mesa_numero) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_crear_mesa_estado ON mesas;
+CREATE TRIGGER trigger_crear_mesa_estado
+    AFTER INSERT ON mesas
+    FOR EACH ROW
+    EXECUTE FUNCTION crear_mesa_estado();
+
+-- Recalcula mesa_estado desde cero (carga inicial o para corregir diferencias)
+CREATE OR REPLACE FUNCTION reconstruir_mesa_estado()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE pedidos, reservas IN SHARE MODE;
+    INSERT INTO mesa_estado (mesa_numero) SELECT numero FROM mesas ON CONFLICT (mesa_numero) DO NOTHING;
+    UPDATE mesa_estado me
+    SET pedidos_activos = (
+        SELECT COUNT(*)
+        FROM pedidos p
+        WHERE p.mesa_numero = me.mesa_numero
+        AND p.estado IN ('Pendiente', 'En preparacion', 'Listo')
+    );
+    PERFORM refrescar_reservas_mesa_estado(NULL);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Migración: copiar a pedido_items las líneas de los pedidos que aún no las tienen
+-- (BDs creadas antes de la tabla). Se puede ejecutar más de una vez.
+INSERT INTO pedido_items (pedido_id, linea, nombre, tipo, precio, cantidad, fecha)
+SELECT p.id, item.linea, item.valor->>'nombre', item.valor->>'tipo',
+       COALESCE((item.valor->>'precio')::numeric, 0), COALESCE((item.valor->>'cantidad')::integer, 1),
+       COALESCE(p.fecha_hora, CURRENT_TIMESTAMP)
+FROM pedidos p
+CROSS JOIN LATERAL jsonb_array_elements(items_pedido(p.items)) WITH ORDINALITY AS item(valor, linea)
+WHERE NOT EXISTS (SELECT 1 FROM pedido_items pi WHERE pi.pedido_id = p.id);
+
+-- Carga inicial de mesa_estado y reservas_ocupacion (se puede ejecutar más de una vez)
+SELECT reconstruir_mesa_estado();
+SELECT reconstruir_reservas_ocupacion();
+
+-- Migración: saldo inicial en el libro de movimientos de los ingredientes que aún no tienen ninguno
+-- (BDs creadas antes de la tabla). Se puede ejecutar más de una vez.
+INSERT INTO movimientos_inventario (ingrediente_id, tipo, cantidad, saldo, nota)
+SELECT i.id, 'inicial', i.cantidad_disponible, i.cantidad_disponible, 'Saldo al crear el libro de movimientos'
+FROM inventario i
+WHERE NOT EXISTS (SELECT 1 FROM movimientos_inventario m WHERE m.ingrediente_id = i.id);
+
 -- 6. Insertar datos de ejemplo para probar
 
 -- Clientes de ejemplo
@@ -0,0 +1,238 @@
+# agregaciones.py
+# Agregaciones de ventas calculadas en PostgreSQL para /reportes, /reportes/ventas_por_hora,
+# /analisis/productos y /reportes/eficiencia_cocina.
+# Los pedidos Entregado/Pagado se leen del resumen ventas_diarias / pedidos_diarios (mantenido por
+# el trigger trigger_ventas_diarias de SqlPRO.sql), así que un reporte anual suma como mucho
+# 365 x 24 filas por producto en lugar de recorrer todos los pedidos del año y sus ítems JSONB.
+# Otros estados (p. ej. 'Listo') y rangos que no son días completos se calculan sobre `pedidos`.
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Estados que acumula el resumen (deben coincidir con mantener_ventas_diarias() en SqlPRO.sql)
+ESTADOS_RESUMEN = ('Entregado', 'Pagado')
+
+
+def _es_dia(valor: Optional[str]) -> bool:
+    if valor is None:
+        return True
+    try:
+        datetime.strptime(valor, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+def _usa_resumen(estados: List[str], desde: Optional[str], hasta: Optional[str]) -> bool:
+    """El resumen sirve si el rango son días completos y se piden (al menos) los estados que acumula."""
+    return set(ESTADOS_RESUMEN) <= set(estados) and _es_dia(desde) and _es_dia(hasta)
+
+
+def _filtro_pedidos(estados: List[str], desde: Optional[str], hasta: Optional[str]):
+    condiciones = ["p.estado = ANY(%s)"]
+    params: List[Any] = [list(estados)]
+    if desde:
+        condiciones.append("p.fecha_hora >= %s")
+        params.append(desde)
+    if hasta:
+        condiciones.append("p.fecha_hora < %s")
+        params.append(hasta)
+    return " AND ".join(condiciones), params
+
+
+def _filtro_resumen(desde: Optional[str], hasta: Optional[str]):
+    condiciones = ["TRUE"]
+    params: List[Any] = []
+    if desde:
+        condiciones.append("fecha >= %s::date")
+        params.append(desde)
+    if hasta:
+        condiciones.append("fecha < %s::date")
+        params.append(hasta)
+    return " AND ".join(condiciones), params
+
+
+# === FUNCIÓN: contar_pedidos ===
+def contar_pedidos(cursor, estados: List[str], desde: Optional[str] = None, hasta: Optional[str] = None) -> int:
+    if not _usa_resumen(estados, desde, hasta):
+        condicion, params = _filtro_pedidos(estados, desde, hasta)
+        cursor.execute(f"SELECT COUNT(*) AS total FROM pedidos p WHERE {condicion}", params)
+        return cursor.fetchone()['total']
+
+    condicion, params = _filtro_resumen(desde, hasta)
+    cursor.execute(f"SELECT COALESCE(SUM(pedidos), 0) AS total FROM pedidos_diarios WHERE {condicion}", params)
+    total = int(cursor.fetchone()['total'])
+    otros = [e for e in estados if e not in ESTADOS_RESUMEN]
+    if otros:
+        total += contar_pedidos(cursor, otros, desde, hasta)
+    return total
+
+
+def _ventas_por_producto_pedidos(cursor, estados: List[str], desde: Optional[str], hasta: Optional[str]) -> List[Dict[str, Any]]:
+    # Sobre las líneas normalizadas (pedido_items), sin decodificar el JSONB de cada pedido
+    condicion, params = _filtro_pedidos(estados, desde, hasta)
+    cursor.execute(f"""
+        SELECT pi.nombre, COUNT(*) AS cantidad, COALESCE(SUM(pi.precio), 0) AS total
+        FROM pedidos p
+        JOIN pedido_items pi ON pi.pedido_id = p.id
+        WHERE {condicion}
+        GROUP BY pi.nombre
+    """, params)
+    return cursor.fetchall()
+
+
+# === FUNCIÓN: ventas_de_plato ===
+# Unidades e importe de un plato por día (usa el índice de pedido_items por nombre y fecha).
+def ventas_de_plato(cursor, nombre: str, estados: List[str], desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict[str, Any]]:
+    condiciones = ["pi.nombre = %s", "p.estado = ANY(%s)"]
+    params: List[Any] = [nombre, list(estados)]
+    if desde:
+        condiciones.append("pi.fecha >= %s")
+        params.append(desde)
+    if hasta:
+        condiciones.append("pi.fecha < %s")
+        params.append(hasta)
+    cursor.execute(f"""
+        SELECT pi.fecha::date AS fecha, COUNT(*) AS cantidad, COALESCE(SUM(pi.precio), 0) AS total
+        FROM pedido_items pi
+        JOIN pedidos p ON p.id = pi.pedido_id
+        WHERE {" AND ".join(condiciones)}
+        GROUP BY pi.fecha::date
+        ORDER BY fecha
+    """, params)
+    return [
+        {"fecha": row['fecha'].strftime("%Y-%m-%d"), "cantidad": row['cantidad'], "total": float(row['total'])}
+        for row in cursor.fetchall()
+    ]
+
+
+def _ventas_por_producto_resumen(cursor, desde: Optional[str], hasta: Optional[str]) -> List[Dict[str, Any]]:
+    condicion, params = _filtro_resumen(desde, hasta)
+    cursor.execute(f"""
+        SELECT NULLIF(producto, '') AS nombre, SUM(unidades) AS cantidad, SUM(ingresos) AS total
+        FROM ventas_diarias
+        WHERE {condicion}
+        GROUP BY producto
+        HAVING SUM(unidades) <> 0
+    """, params)
+    return cursor.fetchall()
+
+
+# === FUNCIÓN: ventas_por_producto ===
+# Una fila por nombre de producto con las unidades vendidas y el importe, ordenadas de más a
+# menos vendido (a igual cantidad, por nombre). Los ítems sin nombre salen con nombre None.
+def ventas_por_producto(cursor, estados: List[str], desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict[str, Any]]:
+    if _usa_resumen(estados, desde, hasta):
+        filas = list(_ventas_por_producto_resumen(cursor, desde, hasta))
+        otros = [e for e in estados if e not in ESTADOS_RESUMEN]
+        if otros:
+            filas += _ventas_por_producto_pedidos(cursor, otros, desde, hasta)
+    else:
+        filas = _ventas_por_producto_pedidos(cursor, estados, desde, hasta)
+
+    productos: Dict[Optional[str], Dict[str, Any]] = {}
+    for fila in filas:
+        producto = productos.setdefault(fila['nombre'], {"nombre": fila['nombre'], "cantidad": 0, "total": 0.0})
+        producto["cantidad"] += int(fila['cantidad'])
+        producto["total"] += float(fila['total'])
+    return sorted(productos.values(), key=lambda p: (-p["cantidad"], p["nombre"] is None, p["nombre"] or ""))
+
+
+# === FUNCIÓN: resumen_ventas ===
+# Totales del período: importe, pedidos, unidades y top-N de productos.
+def resumen_ventas(cursor, estados: List[str], desde: Optional[str] = None, hasta: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+    productos = ventas_por_producto(cursor, estados, desde, hasta)
+    return {
+        "ventas_totales": round(sum(p["total"] for p in productos), 2),
+        "pedidos_totales": contar_pedidos(cursor, estados, desde, hasta),
+        "productos_vendidos": sum(p["cantidad"] for p in productos),
+        "productos_mas_vendidos": [
+            {"nombre": p["nombre"], "cantidad": p["cantidad"]}
+            for p in productos if p["nombre"] is not None
+        ][:top]
+    }
+
+
+# === FUNCIÓN: ventas_por_hora ===
+# Importe vendido (Entregado/Pagado) en cada hora de un día, desde el resumen.
+def ventas_por_hora(cursor, fecha: str) -> Dict[int, float]:
+    cursor.execute("""
+        SELECT hora, SUM(ingresos) AS total_venta
+        FROM ventas_diarias
+        WHERE fecha = %s::date
+        GROUP BY hora
+    """, (fecha,))
+    return {int(row['hora']): float(row['total_venta']) for row in cursor.fetchall()}
+
+
+# === FUNCIÓN: resumen_cocina ===
+# Pedidos con tiempos de cocina y minutos promedio, para los pedidos hechos en el rango (por el día
+# del pedido, como el resumen). Los Entregado/Pagado salen de pedidos_diarios; los que siguen en
+# 'Listo' se calculan al momento. Si el rango no son días completos se calcula todo sobre `pedidos`.
+ESTADOS_COCINA = ('Listo',) + ESTADOS_RESUMEN
+CONDICION_COCINA = "p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NOT NULL"
+
+def resumen_cocina(cursor, desde: str, hasta: str) -> Dict[str, Any]:
+    pedidos, minutos = 0, 0.0
+    estados_vivos = list(ESTADOS_COCINA)
+    if _es_dia(desde) and _es_dia(hasta):
+        condicion, params = _filtro_resumen(desde, hasta)
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(pedidos_cocina), 0) AS pedidos, COALESCE(SUM(minutos_cocina), 0) AS minutos
+            FROM pedidos_diarios
+            WHERE {condicion}
+        """, params)
+        resumen = cursor.fetchone()
+        pedidos, minutos = int(resumen['pedidos']), float(resumen['minutos'])
+        estados_vivos = ['Listo']
+    condicion, params = _filtro_pedidos(estados_vivos, desde, hasta)
+    cursor.execute(f"""
+        SELECT COUNT(*) AS pedidos,
+               COALESCE(SUM(EXTRACT(EPOCH FROM (p.hora_fin_cocina - p.hora_inicio_cocina)) / 60.0), 0) AS minutos
+        FROM pedidos p
+        WHERE {condicion} AND {CONDICION_COCINA}
+    """, params)
+    vivos = cursor.fetchone()
+    pedidos += int(vivos['pedidos'])
+    minutos += float(vivos['minutos'])
+    return {"pedidos": pedidos, "promedio_minutos": minutos / pedidos if pedidos else 0}
+
+
+# === FUNCIÓN: detalle_cocina ===
+# Tiempos de cocina de los `limite` pedidos más recientes del mismo conjunto que resumen_cocina
+# (idx_pedidos_estado_fecha), en orden cronológico.
+def detalle_cocina(cursor, desde: str, hasta: str, limite: int) -> List[Dict[str, Any]]:
+    condicion, params = _filtro_pedidos(list(ESTADOS_COCINA), desde, hasta)
+    cursor.execute(f"""
+        SELECT p.id, EXTRACT(EPOCH FROM (p.hora_fin_cocina - p.hora_inicio_cocina)) / 60.0 AS tiempo_cocina_minutos
+        FROM pedidos p
+        WHERE {condicion} AND {CONDICION_COCINA}
+        ORDER BY p.fecha_hora DESC, p.id DESC
+        LIMIT %s
+    """, params + [limite])
+    return [{"id": row['id'], "tiempo": float(row['tiempo_cocina_minutos'])} for row in reversed(cursor.fetchall())]
+
+
+# === FUNCIÓN: reconstruir_resumen ===
+# Recalcula ventas_diarias y pedidos_diarios desde cero (carga inicial tras crear las tablas,
+# o para corregir diferencias). El llamador hace commit.
+def reconstruir_resumen(cursor) -> Dict[str, int]:
+    cursor.execute("SELECT reconstruir_ventas_diarias();")
+    cursor.execute("SELECT (SELECT COUNT(*) FROM ventas_diarias) AS filas_ventas, (SELECT COUNT(*) FROM pedidos_diarios) AS dias")
+    return dict(cursor.fetchone())
+
+
+# Uso por línea de comandos: python agregaciones.py reconstruir
+if __name__ == "__main__":
+    import sys
+    from database import pool
+
+    if sys.argv[1:] != ["reconstruir"]:
+        print("Uso: python agregaciones.py reconstruir")
+        sys.exit(1)
+    with pool.conexion() as conn:
+        with conn.cursor() as cursor:
+            resultado = reconstruir_resumen(cursor)
+        conn.commit()
+    pool.cerrar()
+    print(f"Resumen de ventas reconstruido: {resultado['filas_ventas']} filas de ventas, {resultado['dias']} días")
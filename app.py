@@ -20,6 +20,7 @@ from reservas_service import ReservasService # Asumiendo que creas este archivo
 # --- AÑADIR ESTOS IMPORTS ---
 from recetas_view import crear_vista_recetas
 from recetas_service import RecetasService
+from planificador import planificador
 
 # === FUNCIÓN: reproducir_sonido_pedido ===
 # Reproduce una melodía simple cuando se confirma un pedido.
@@ -53,7 +54,9 @@ def obtener_titulo_pedido(pedido):
 
 # === FUNCIÓN: crear_selector_item ===
 # Crea un selector con dropdowns para filtrar y elegir items del menú.
-def crear_selector_item(menu):
+# `porciones_disponibles(nombre)` devuelve cuántas porciones permite el stock (None = sin límite):
+# los platos agotados se muestran deshabilitados.
+def crear_selector_item(menu, porciones_disponibles=None):
     tipos = list(set(item["tipo"] for item in menu))
     tipos.sort()
     tipo_dropdown = ft.Dropdown(
@@ -72,19 +75,41 @@ def crear_selector_item(menu):
         label="Seleccionar item",
         width=200,
     )
-    def filtrar_items(e):
+    def agotado(nombre):
+        return porciones_disponibles is not None and porciones_disponibles(nombre) == 0
+    def construir_opciones():
         query = search_field.value.lower().strip() if search_field.value else ""
         tipo_actual = tipo_dropdown.value
         if query:
             items_filtrados = [item for item in menu if query in item["nombre"].lower()]
         else:
             items_filtrados = [item for item in menu if item["tipo"] == tipo_actual]
-        items_dropdown.options = [ft.dropdown.Option(item["nombre"]) for item in items_filtrados]
+        items_dropdown.options = [
+            ft.dropdown.Option(key=item["nombre"], text=f"{item['nombre']} (agotado)", disabled=True)
+            if agotado(item["nombre"]) else ft.dropdown.Option(item["nombre"])
+            for item in items_filtrados
+        ]
+    def filtrar_items(e):
+        construir_opciones()
         items_dropdown.value = None
         if e and e.page:
             e.page.update()
+    def actualizar_disponibilidad():
+        # Llamar al cambiar el stock: conserva la selección salvo que el plato se haya agotado
+        construir_opciones()
+        if items_dropdown.value and agotado(items_dropdown.value):
+            items_dropdown.value = None
     def actualizar_items(e):
         filtrar_items(e)
+    def actualizar_menu():
+        # Llamar tras cambiar la lista del menú (se modifica en el sitio): rehace tipos e ítems
+        tipos_nuevos = sorted(set(item["tipo"] for item in menu))
+        tipo_dropdown.options = [ft.dropdown.Option(tipo) for tipo in tipos_nuevos]
+        if tipo_dropdown.value not in tipos_nuevos:
+            tipo_dropdown.value = tipos_nuevos[0] if tipos_nuevos else "Entradas"
+        construir_opciones()
+        if items_dropdown.value and items_dropdown.value not in [op.key for op in items_dropdown.options]:
+            items_dropdown.value = None
     tipo_dropdown.on_change = actualizar_items
     search_field.on_change = filtrar_items
     actualizar_items(None)
@@ -105,6 +130,8 @@ def crear_selector_item(menu):
                     return item
         return None
     container.get_selected_item = get_selected_item
+    container.actualizar_disponibilidad = actualizar_disponibilidad
+    container.actualizar_menu = actualizar_menu
     return container
 
 def crear_mesas_grid(backend_service, on_select):
@@ -269,7 +296,7 @@ def crear_panel_gestion(backend_service, menu, on_update_ui, page, primary_color
         hint_text="Ej: Sin cebolla, sin salsa, etc.",
         width=400
     )
-    selector_item = crear_selector_item(menu)
+    selector_item = crear_selector_item(menu, backend_service.porciones_disponibles)
     # --- NUEVO: Selector de Cantidad ---
     cantidad_dropdown = ft.Dropdown(
         label="Cantidad",
@@ -472,6 +499,13 @@ def crear_panel_gestion(backend_service, menu, on_update_ui, page, primary_color
         except ValueError:
             cantidad = 1 # Valor por defecto si hay error
         # --- FIN OBTENER CANTIDAD ---
+        # Porciones que permite el stock (los ítems de un pedido aún sin guardar todavía no descontaron stock)
+        porciones = backend_service.porciones_disponibles(item["nombre"])
+        if porciones is not None:
+            sin_guardar = sum(1 for i in pedido_actual.get("items", []) if i.get("nombre") == item["nombre"]) if pedido_actual["id"] is None else 0
+            if cantidad + sin_guardar > porciones:
+                print(f"No hay stock para {cantidad + sin_guardar} porciones de '{item['nombre']}' (disponibles: {porciones}).")
+                return
         try:
             # ✅ SOLO ACTUALIZAR EN MEMORIA SI AÚN NO TIENE ID
             if pedido_actual["id"] is None:
@@ -667,6 +701,8 @@ def crear_panel_gestion(backend_service, menu, on_update_ui, page, primary_color
         expand=True
     )
     panel.seleccionar_mesa = seleccionar_mesa_interna
+    panel.actualizar_disponibilidad = selector_item.actualizar_disponibilidad
+    panel.actualizar_menu = selector_item.actualizar_menu
     return panel
 
 # === FUNCIÓN: crear_vista_cocina ===
@@ -678,24 +714,71 @@ def crear_vista_cocina(backend_service, on_update_ui, page):
         padding=20,
         auto_scroll=True,
     )
+    seleccionados = {} # id -> pedido marcado para cambiar de estado en grupo
     def actualizar():
         try:
             pedidos = backend_service.obtener_pedidos_activos()
             lista_pedidos.controls.clear()
+            visibles = {}
             for pedido in pedidos:
                 # ✅ SOLO MOSTRAR SI ESTÁ PENDIENTE O EN PREPARACIÓN
                 if pedido.get("estado") in ["Pendiente", "En preparacion"] and pedido.get("items"):
+                    visibles[pedido["id"]] = pedido
                     lista_pedidos.controls.append(crear_item_pedido_cocina(pedido, backend_service, on_update_ui))
+            # La selección sigue a los pedidos que aún se muestran, con su estado actual
+            for pedido_id in list(seleccionados):
+                if pedido_id in visibles:
+                    seleccionados[pedido_id] = visibles[pedido_id]
+                else:
+                    del seleccionados[pedido_id]
+            actualizar_botones_grupo()
             page.update()
         except Exception as e:
             print(f"Error al cargar pedidos: {e}")
+    def actualizar_botones_grupo():
+        estados = {p.get("estado") for p in seleccionados.values()}
+        preparar_seleccionados_btn.disabled = not seleccionados or estados != {"Pendiente"}
+        listos_seleccionados_btn.disabled = not seleccionados or estados != {"En preparacion"}
+    def cambiar_estado_seleccionados(e, nuevo_estado):
+        if not seleccionados:
+            return
+        try:
+            # Una sola petición y un solo refresco para todos los tickets marcados
+            resultado = backend_service.cambiar_estado_pedidos(list(seleccionados.values()), nuevo_estado)
+            for r in resultado["resultados"]:
+                if not r["actualizado"]:
+                    print(f"Pedido {r['id']}: {r.get('error')}")
+        except Exception as ex:
+            print(f"Error al cambiar estado: {ex}")
+        seleccionados.clear()
+        on_update_ui()
+    preparar_seleccionados_btn = ft.ElevatedButton(
+        "Preparar seleccionados",
+        on_click=lambda e: cambiar_estado_seleccionados(e, "En preparacion"),
+        disabled=True,
+        style=ft.ButtonStyle(bgcolor=ft.Colors.ORANGE_700, color=ft.Colors.WHITE)
+    )
+    listos_seleccionados_btn = ft.ElevatedButton(
+        "Listos seleccionados",
+        on_click=lambda e: cambiar_estado_seleccionados(e, "Listo"),
+        disabled=True,
+        style=ft.ButtonStyle(bgcolor=ft.Colors.GREEN_700, color=ft.Colors.WHITE)
+    )
     def crear_item_pedido_cocina(pedido, backend_service, on_update_ui):
+        def seleccionar(e):
+            if e.control.value:
+                seleccionados[pedido["id"]] = pedido
+            else:
+                seleccionados.pop(pedido["id"], None)
+            actualizar_botones_grupo()
+            page.update()
         def cambiar_estado(e, p, nuevo_estado):
             try:
-                backend_service.actualizar_estado_pedido(p["id"], nuevo_estado)
+                backend_service.actualizar_estado_pedido(p["id"], nuevo_estado, p.get("estado"))
                 on_update_ui()  # ✅ ACTUALIZA AMBAS VISTAS
             except Exception as ex:
                 print(f"Error al cambiar estado: {ex}")
+                on_update_ui() # Otra pantalla pudo cambiarlo antes (409): mostrar el estado real
         def eliminar_pedido_click(e):
             try:
                 # ✅ ELIMINAR EL PEDIDO DE LA BASE DE DATOS
@@ -715,7 +798,10 @@ def crear_vista_cocina(backend_service, on_update_ui, page):
         return ft.Container(
             content=ft.Column([
                 ft.Row([
-                    ft.Text(origen, size=20, weight=ft.FontWeight.BOLD),
+                    ft.Row([
+                        ft.Checkbox(value=pedido["id"] in seleccionados, on_change=seleccionar),
+                        ft.Text(origen, size=20, weight=ft.FontWeight.BOLD),
+                    ]),
                     ft.IconButton(
                         icon=ft.Icons.DELETE,
                         on_click=eliminar_pedido_click,
@@ -747,7 +833,10 @@ def crear_vista_cocina(backend_service, on_update_ui, page):
         )
     vista = ft.Container(
         content=ft.Column([
-            ft.Text("Pedidos en Cocina", size=20, weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Text("Pedidos en Cocina", size=20, weight=ft.FontWeight.BOLD),
+                ft.Row([preparar_seleccionados_btn, listos_seleccionados_btn]),
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             lista_pedidos
         ]),
         padding=20,
@@ -782,6 +871,14 @@ def crear_vista_admin(backend_service, menu, on_update_ui, page):
         page.update()
     tipo_item_eliminar.on_change = actualizar_items_eliminar
     actualizar_items_eliminar(None)
+    def actualizar_menu():
+        # Llamar tras cambiar la lista del menú (se modifica en el sitio)
+        tipos_nuevos = sorted(set(item["tipo"] for item in menu))
+        for dropdown in (tipo_item_admin, tipo_item_eliminar):
+            dropdown.options = [ft.dropdown.Option(tipo) for tipo in tipos_nuevos]
+            if dropdown.value not in tipos_nuevos:
+                dropdown.value = tipos_nuevos[0] if tipos_nuevos else "Entradas"
+        actualizar_items_eliminar(None)
     def agregar_item(e):
         tipo = tipo_item_admin.value
         nombre = (nombre_item.value or "").strip()
@@ -929,6 +1026,7 @@ def crear_vista_admin(backend_service, menu, on_update_ui, page):
     )
     # --- FIN CAMBIO 1 ---
     vista.actualizar_lista_clientes = actualizar_lista_clientes
+    vista.actualizar_menu = actualizar_menu
     return vista
 
 # === FUNCIÓN: crear_vista_personalizacion ===
@@ -1054,14 +1152,19 @@ class RestauranteGUI:
         self.vista_personalizacion = None  # ✅ AGREGAR ESTO
         self.menu_cache = None
         self.hilo_sincronizacion = None
+        # --- EVENTOS DEL BACKEND (SSE) ---
+        self.suscripcion_eventos = None # threading.Event para detener la suscripción
+        self.tablas_pendientes = set() # Tablas con cambios aún no reflejados en la UI
+        self.temporizador_eventos = None
+        self.lock_eventos = threading.Lock()
+        self.disponibilidad_pendiente = True # Descargar entera la disponibilidad del menú en el próximo refresco
+        # --- FIN EVENTOS ---
         # --- NUEVAS VARIABLES PARA ALERTA DE BAJOS STOCK ---
-        self.hilo_verificacion_stock = None
         self.hay_stock_bajo = False # Bandera para indicar si hay stock bajo
         self.ingredientes_bajos_lista = [] # Lista de nombres de ingredientes bajos
         self.mostrar_detalle_stock = False # Bandera para mostrar/ocultar el detalle
         # --- FIN NUEVAS VARIABLES ---
         # --- NUEVAS VARIABLES PARA ALERTA DE RETRASOS ---
-        self.hilo_verificacion_retrasos = None
         self.lista_alertas_retrasos = [] # Lista de diccionarios con info de alertas {id_pedido, mesa, titulo, tiempo_retraso, ...}
         self.hay_pedidos_atrasados = False # Bandera para indicar si hay pedidos atrasados
         self.mostrar_detalle_retrasos = False # Bandera para mostrar/ocultar el detalle de retrasos
@@ -1133,139 +1236,94 @@ class RestauranteGUI:
 
     # --- FIN FUNCIONES DE CONFIGURACIÓN ---
 
-    # --- FUNCIÓN: verificar_stock_periodicamente ---
-    def verificar_stock_periodicamente(self):
-        """Verifica el inventario cada 30 segundos y actualiza la bandera."""
-        while True:
-            try:
-                items = self.inventory_service.obtener_inventario()
-                # VERIFICAR ALERTAS DE INGREDIENTES BAJOS - USAR UMBRAL CONFIGURABLE
-                # umbral_bajo = 5 # UMBRAL PARA AVISAR (PUEDES CAMBIAR ESTE VALOR) # <-- COMENTAR ESTA LINEA
-                ingredientes_bajos = [item for item in items if item['cantidad_disponible'] <= self.umbral_stock_bajo] # <-- USAR self.umbral_stock_bajo
-                # ACTUALIZAR CONTENIDO DE ALERTA
-                if ingredientes_bajos:
-                    nombres_bajos = ", ".join([item['nombre'] for item in ingredientes_bajos])
-                    # Actualizar la bandera y la lista de ingredientes bajos
-                    self.hay_stock_bajo = True
-                    self.ingredientes_bajos_lista = [item['nombre'] for item in ingredientes_bajos]
-                    print(f"Bandera de stock bajo activada. Ingredientes: {self.ingredientes_bajos_lista}") # Mensaje de depuración
-                else:
-                    self.hay_stock_bajo = False
-                    self.ingredientes_bajos_lista = []
-                    # Si no hay stock bajo, ocultar el detalle
-                    self.mostrar_detalle_stock = False
-                    print("Bandera de stock bajo desactivada.") # Mensaje de depuración
-                time.sleep(30) # VERIFICAR CADA 30 SEGUNDOS
-            except Exception as e:
-                print(f"Error en verificación periódica de inventario (stock): {e}")
-                time.sleep(30) # ESPERAR 30 SEGUNDOS ANTES DE REINTENTAR
-
-    # --- NUEVA FUNCIÓN CORREGIDA: verificar_retrasos_periodicamente ---
-    def verificar_retrasos_periodicamente(self):
-        """Verifica pedidos activos cada 60 segundos y genera/elimina alertas si exceden el umbral."""
-        while True:
-            try:
-                pedidos_activos = self.backend_service.obtener_pedidos_activos()
-                ahora = datetime.now()
-                nuevos_ids_activos = {pedido['id'] for pedido in pedidos_activos if pedido.get('estado') in ["Pendiente", "En preparacion"]}
-
-                # Filtrar alertas antiguas que ya no estén en pedidos_activos o ya no estén atrasadas
-                alertas_actualizadas = []
-                for alerta in self.lista_alertas_retrasos:
-                    id_pedido = alerta['id_pedido']
-                    # Verificar si el pedido aún está activo (Pendiente o En preparacion)
-                    pedido_activo = next((p for p in pedidos_activos if p['id'] == id_pedido and p.get('estado') in ["Pendiente", "En preparacion"]), None)
-                    if pedido_activo:
-                        # El pedido sigue activo, verificar si sigue atrasado
-                        try:
-                            fecha_pedido = datetime.strptime(pedido_activo.get('fecha_hora', ''), "%Y-%m-%d %H:%M:%S")
-                            diferencia = (ahora - fecha_pedido).total_seconds() / 60  # Diferencia en minutos
-                            if diferencia >= self.tiempo_umbral_minutos:
-                                # Aún está atrasado, mantener la alerta
-                                alerta['tiempo_retraso'] = round(diferencia, 2) # Opcional: actualizar el tiempo de retraso mostrado
-                                alertas_actualizadas.append(alerta)
-                            else:
-                                # Ya no está atrasado, no mantener la alerta
-                                print(f"Alerta eliminada para Pedido {id_pedido} - ya no está atrasado.")
-                        except ValueError as ve:
-                            print(f"Error al parsear fecha del pedido {id_pedido} en alertas: {pedido_activo.get('fecha_hora', '')} - {ve}")
-                            # Si hay error de parseo, no mantener la alerta
-                    else:
-                        # El pedido ya no está activo (posiblemente cambió a Listo, Entregado, Pagado, o fue eliminado)
-                        print(f"Alerta eliminada para Pedido {id_pedido} - ya no está activo.")
-                        # No mantener la alerta
-
-                # Actualizar la lista de alertas con las filtradas
-                self.lista_alertas_retrasos = alertas_actualizadas
-
-                # Generar nuevas alertas como antes
-                nuevas_alertas = []
-                ids_alertas_existentes = {alerta['id_pedido'] for alerta in self.lista_alertas_retrasos}
-
-                for pedido in pedidos_activos:
-                    estado = pedido.get('estado')
-                    fecha_str = pedido.get('fecha_hora')
-                    # Solo considerar pedidos Pendientes o En Preparación
-                    if estado in ["Pendiente", "En preparacion"] and fecha_str:
-                        try:
-                            fecha_pedido = datetime.strptime(fecha_str.split(".")[0], "%Y-%m-%d %H:%M:%S")
-                            diferencia = (ahora - fecha_pedido).total_seconds() / 60  # Diferencia en minutos
-
-                            if diferencia >= self.tiempo_umbral_minutos:
-                                id_pedido = pedido['id']
-
-                                # Solo agregar si no existe una alerta para este pedido
-                                if id_pedido not in ids_alertas_existentes:
-                                    nueva_alerta = {
-                                        "id_pedido": id_pedido,
-                                        "titulo_pedido": obtener_titulo_pedido(pedido), # Usar la función auxiliar
-                                        "estado": estado,
-                                        "tiempo_retraso": round(diferencia, 2),
-                                        "fecha_hora": fecha_pedido # Opcional: guardar el datetime original
-                                    }
-                                    nuevas_alertas.append(nueva_alerta)
-                                    print(f"Alerta generada para Pedido {id_pedido} en {obtener_titulo_pedido(pedido)} - {diferencia:.2f} minutos retraso.")
-
-                        except ValueError as ve:
-                            print(f"Error al parsear fecha del pedido {pedido.get('id')}: {fecha_str} - {ve}")
-                            continue # Saltar este pedido si hay error de parseo
-
-                # Agregar las nuevas alertas a la lista ya filtrada
-                self.lista_alertas_retrasos.extend(nuevas_alertas)
-
-                # Actualizar la bandera de retrasos basada en la lista actualizada
-                self.hay_pedidos_atrasados = len(self.lista_alertas_retrasos) > 0
-
-                # Opcional: Mantener solo las últimas N alertas
-                # self.lista_alertas_retrasos = self.lista_alertas_retrasos[-10:] # Por ejemplo, últimos 10
-
-                time.sleep(60) # VERIFICAR CADA 60 SEGUNDOS
-            except Exception as e:
-                print(f"Error en verificación periódica de retrasos: {e}")
-                time.sleep(60) # ESPERAR 60 SEGUNDOS ANTES DE REINTENTAR
-    # --- FIN NUEVA FUNCIÓN CORREGIDA ---
+    # --- FUNCIÓN: verificar_stock ---
+    # Tarea periódica del planificador (cada 30 s, ver iniciar_sincronizacion).
+    def verificar_stock(self):
+        """Verifica el inventario y actualiza la bandera de stock bajo."""
+        # Filtrado en el backend (GET /inventario/alertas): ingredientes por debajo de su nivel de
+        # alerta o del umbral configurado en esta terminal, sin descargar todo el inventario
+        ingredientes_bajos = self.inventory_service.obtener_alertas(self.umbral_stock_bajo)
+        # ACTUALIZAR CONTENIDO DE ALERTA
+        if ingredientes_bajos:
+            nombres_bajos = ", ".join([item['nombre'] for item in ingredientes_bajos])
+            # Actualizar la bandera y la lista de ingredientes bajos
+            self.hay_stock_bajo = True
+            self.ingredientes_bajos_lista = [item['nombre'] for item in ingredientes_bajos]
+            print(f"Bandera de stock bajo activada. Ingredientes: {self.ingredientes_bajos_lista}") # Mensaje de depuración
+        else:
+            self.hay_stock_bajo = False
+            self.ingredientes_bajos_lista = []
+            # Si no hay stock bajo, ocultar el detalle
+            self.mostrar_detalle_stock = False
+            print("Bandera de stock bajo desactivada.") # Mensaje de depuración
+
+    # --- FUNCIÓN: verificar_retrasos ---
+    # El backend detecta los retrasos (retrasos.py): aquí solo se pide la lista ya filtrada con el
+    # umbral de esta terminal. Se ejecuta al llegar el evento 'pedidos_atrasados' y, como red de
+    # seguridad (o si el umbral local difiere del del backend), cada 60 s desde el planificador.
+    def verificar_retrasos(self):
+        """Reemplaza las alertas de retraso por los pedidos atrasados que informa el backend."""
+        atrasados = self.backend_service.obtener_pedidos_atrasados(self.tiempo_umbral_minutos)
+        self.lista_alertas_retrasos = [
+            {
+                "id_pedido": pedido["id"],
+                "titulo_pedido": obtener_titulo_pedido(pedido),
+                "estado": pedido["estado"],
+                "tiempo_retraso": pedido["minutos_retraso"],
+                "fecha_hora": pedido["fecha_hora"]
+            }
+            for pedido in atrasados
+        ]
+        self.hay_pedidos_atrasados = len(self.lista_alertas_retrasos) > 0
+        if not self.hay_pedidos_atrasados:
+            self.mostrar_detalle_retrasos = False
+    # --- FIN FUNCIÓN ---
 
     def iniciar_sincronizacion(self):
         """Inicia la sincronización automática en segundo plano."""
-        def actualizar_periodicamente():
-            while True:
-                try:
-                    # ✅ ACTUALIZAR INTERFAZ CADA 3 SEGUNDOS
-                    self.actualizar_ui_completo()
-                    time.sleep(3)  # ✅ INTERVALO DE ACTUALIZACIÓN
-                except Exception as e:
-                    print(f"Error en sincronización: {e}")
-                    time.sleep(3)
-
-        # ✅ INICIAR HILO DE SINCRONIZACIÓN GENERAL
-        self.hilo_sincronizacion = threading.Thread(target=actualizar_periodicamente, daemon=True)
-        self.hilo_sincronizacion.start()
-        # ✅ INICIAR HILO DE VERIFICACIÓN DE STOCK
-        self.hilo_verificacion_stock = threading.Thread(target=self.verificar_stock_periodicamente, daemon=True)
-        self.hilo_verificacion_stock.start()
-        # ✅ INICIAR HILO DE VERIFICACIÓN DE RETRASOS
-        self.hilo_verificacion_retrasos = threading.Thread(target=self.verificar_retrasos_periodicamente, daemon=True)
-        self.hilo_verificacion_retrasos.start()
+        # ✅ SUSCRIBIRSE AL FLUJO DE EVENTOS DEL BACKEND (REEMPLAZA EL SONDEO CADA 3 SEGUNDOS)
+        # Cada vista se actualiza solo cuando cambia la tabla de la que depende.
+        self.suscripcion_eventos = self.backend_service.suscribir_eventos(self.on_evento_backend)
+        # ✅ TAREAS PERIÓDICAS EN EL PLANIFICADOR COMPARTIDO (planificador.py)
+        planificador.agregar("alertas_stock", self.verificar_stock, 30)
+        planificador.agregar("alertas_retrasos", self.verificar_retrasos, 60)
+        # Red de seguridad por si se perdiera algún evento: refresco completo cada 5 minutos
+        planificador.agregar("sincronizacion_ui", self.actualizar_ui_completo, 300, inmediato=False)
+
+    # --- FUNCIÓN: on_evento_backend ---
+    # Recibe los eventos del backend. Agrupa los que llegan juntos (p. ej. pedido + inventario
+    # de la misma transacción) para refrescar cada vista una sola vez.
+    def on_evento_backend(self, tabla: str, datos: Dict[str, Any]):
+        if self.page is None:
+            return
+        if tabla == "conectado":
+            # (Re)conexión: pudimos perdernos eventos, refrescar todo
+            # (la copia local de pedidos se descarga de nuevo por si su cursor quedó viejo)
+            self.backend_service.reiniciar_pedidos_activos()
+            self.actualizar_ui_completo()
+            return
+        if tabla == "menu_disponibilidad":
+            # Las porciones que cambiaron vienen en el evento; solo se descarga todo si el backend lo pide
+            if datos.get("completo"):
+                self.disponibilidad_pendiente = True
+            else:
+                self.backend_service.actualizar_disponibilidad_menu(datos.get("platos", {}))
+        with self.lock_eventos:
+            self.tablas_pendientes.add(tabla)
+            if self.temporizador_eventos is None:
+                self.temporizador_eventos = threading.Timer(0.05, self.aplicar_eventos_pendientes)
+                self.temporizador_eventos.daemon = True
+                self.temporizador_eventos.start()
+
+    def aplicar_eventos_pendientes(self):
+        with self.lock_eventos:
+            tablas = self.tablas_pendientes
+            self.tablas_pendientes = set()
+            self.temporizador_eventos = None
+        try:
+            self.actualizar_vistas_por_tablas(tablas)
+        except Exception as e:
+            print(f"Error al aplicar eventos {tablas}: {e}")
 
     def main(self, page: ft.Page):
         self.page = page
@@ -1362,13 +1420,7 @@ class RestauranteGUI:
             reloj.value = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             page.update()
 
-        def loop_reloj():
-            while True:
-                actualizar_reloj()
-                time.sleep(1)
-
-        hilo_reloj = threading.Thread(target=loop_reloj, daemon=True)
-        hilo_reloj.start()
+        planificador.agregar("reloj", actualizar_reloj, 1, jitter=0)
 
         try:
             self.menu_cache = self.backend_service.obtener_menu()
@@ -1582,10 +1634,81 @@ class RestauranteGUI:
         if self.panel_gestion:
             self.panel_gestion.seleccionar_mesa(numero_mesa)
 
-    def actualizar_ui_completo(self):
+    def actualizar_mesas_grid(self):
         nuevo_grid = crear_mesas_grid(self.backend_service, self.seleccionar_mesa)
         self.mesas_grid.controls = nuevo_grid.controls
         self.mesas_grid.update()
+
+    # --- FUNCIÓN: actualizar_vistas_por_tablas ---
+    # Refresca solo las vistas que dependen de las tablas que cambiaron.
+    def actualizar_vistas_por_tablas(self, tablas):
+        refrescos = []
+        if tablas & {"pedidos", "mesas", "reservas"}:
+            refrescos.append(self.actualizar_mesas_grid)
+        if "pedidos" in tablas:
+            if hasattr(self.vista_cocina, 'actualizar'):
+                refrescos.append(self.vista_cocina.actualizar)
+            if hasattr(self.vista_caja, 'actualizar'):
+                refrescos.append(self.vista_caja.actualizar)
+        if "clientes" in tablas and hasattr(self.vista_admin, 'actualizar_lista_clientes'):
+            refrescos.append(self.vista_admin.actualizar_lista_clientes)
+        if "pedidos_atrasados" in tablas:
+            refrescos.append(self.verificar_retrasos)
+        if "menu_disponibilidad" in tablas:
+            refrescos.append(self.actualizar_disponibilidad_menu)
+        if "inventario_alertas" in tablas:
+            # Un ingrediente cruzó su nivel de alerta
+            refrescos.append(self.verificar_stock)
+            planificador.ejecutar_ahora("alertas_inventario")
+        if "menu" in tablas:
+            # Alta/baja de platos en otro terminal: la lista compartida se cambia en el sitio
+            refrescos.append(self.actualizar_menu)
+        if "recetas" in tablas:
+            # Cambian las porciones que rinde el stock de cada plato
+            self.disponibilidad_pendiente = True
+            refrescos.append(self.actualizar_disponibilidad_menu)
+        if tablas & {"inventario", "recetas", "menu"}:
+            if hasattr(self.vista_recetas, 'actualizar_datos'):
+                refrescos.append(self.vista_recetas.actualizar_datos)
+        if "inventario" in tablas:
+            refrescos.append(self.actualizar_lista_inventario)
+        for refrescar in refrescos:
+            try:
+                refrescar()
+            except Exception as e:
+                print(f"Error al refrescar vista ({tablas}): {e}")
+        if hasattr(self, 'actualizar_visibilidad_alerta'):
+            self.actualizar_visibilidad_alerta()
+        self.page.update()
+
+    # --- FUNCIÓN: actualizar_menu ---
+    # Vuelve a pedir el menú (ETag) y rehace los selectores de ítems de gestión y administración.
+    def actualizar_menu(self):
+        self.menu_cache[:] = self.backend_service.obtener_menu()
+        if hasattr(self.panel_gestion, 'actualizar_menu'):
+            self.panel_gestion.actualizar_menu()
+        if hasattr(self.vista_admin, 'actualizar_menu'):
+            self.vista_admin.actualizar_menu()
+        # Platos nuevos aún sin porciones conocidas
+        self.disponibilidad_pendiente = True
+        self.actualizar_disponibilidad_menu()
+
+    # --- FUNCIÓN: actualizar_disponibilidad_menu ---
+    # Marca como agotados en el selector de ítems los platos sin stock ("lista 86" del backend).
+    def actualizar_disponibilidad_menu(self):
+        if self.disponibilidad_pendiente:
+            self.disponibilidad_pendiente = False
+            self.backend_service.actualizar_disponibilidad_menu()
+        if hasattr(self.panel_gestion, 'actualizar_disponibilidad'):
+            self.panel_gestion.actualizar_disponibilidad()
+
+    def actualizar_ui_completo(self):
+        self.actualizar_mesas_grid()
+        self.disponibilidad_pendiente = True
+        try:
+            self.actualizar_disponibilidad_menu()
+        except Exception as e:
+            print(f"Error al cargar la disponibilidad del menú: {e}")
         if hasattr(self.vista_cocina, 'actualizar'):
             self.vista_cocina.actualizar()
         # if hasattr(self.vista_caja, 'actualizar'): # <-- COMENTAR ESTA LINEA (ANTIGUA, si existe)
@@ -0,0 +1,181 @@
+# asignacion_mesas.py
+# Asignación automática de mesas para reservas y clientes sin reserva (walk-ins).
+# Para un grupo y una ventana [inicio, fin) se elige la mesa libre más chica en la que caben
+# (mesas.capacidad) y, entre mesas iguales, la que deja el hueco libre más ajustado en el día:
+# así las mesas grandes y los huecos largos quedan para los grupos que de verdad los necesitan.
+# La reasignación de una noche completa aplica la misma regla reserva por reserva (empaquetado de
+# intervalos) y solo propone el plan si todas las reservas siguen teniendo mesa.
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+MESA_VIRTUAL = 99 # Pedidos de la app: no se ocupa ni se reserva
+
+Intervalo = Tuple[datetime, datetime]
+
+
+# === FUNCIÓN: hueco_libre ===
+# Largo del hueco libre del día que contiene [inicio, fin) en una mesa con esos intervalos
+# ocupados, o None si la ventana se cruza con alguno.
+def hueco_libre(intervalos: List[Intervalo], inicio: datetime, fin: datetime, dia_inicio: datetime, dia_fin: datetime) -> Optional[timedelta]:
+    desde, hasta = dia_inicio, dia_fin
+    for ocupado_desde, ocupado_hasta in intervalos:
+        if ocupado_desde < fin and inicio < ocupado_hasta:
+            return None
+        if ocupado_hasta <= inicio:
+            desde = max(desde, ocupado_hasta)
+        elif ocupado_desde >= fin:
+            hasta = min(hasta, ocupado_desde)
+    return hasta - desde
+
+
+# === FUNCIÓN: elegir_mesa ===
+# Mejor mesa para el grupo: menor capacidad suficiente, luego hueco más ajustado, luego número.
+def elegir_mesa(
+    mesas: List[Dict[str, Any]],
+    intervalos_por_mesa: Dict[int, List[Intervalo]],
+    personas: int,
+    inicio: datetime,
+    fin: datetime,
+    excluir: Optional[set] = None
+) -> Optional[Dict[str, Any]]:
+    dia_inicio = datetime.combine(inicio.date(), datetime.min.time())
+    dia_fin = max(dia_inicio + timedelta(days=1), fin)
+    mejor, mejor_clave = None, None
+    for mesa in mesas:
+        if mesa['capacidad'] < personas or (excluir and mesa['numero'] in excluir):
+            continue
+        hueco = hueco_libre(intervalos_por_mesa.get(mesa['numero'], []), inicio, fin, dia_inicio, dia_fin)
+        if hueco is None:
+            continue
+        clave = (mesa['capacidad'], hueco, mesa['numero'])
+        if mejor_clave is None or clave < mejor_clave:
+            mejor, mejor_clave = mesa, clave
+    return mejor
+
+
+# === FUNCIÓN: planificar_reasignacion ===
+# Reparte las reservas movibles entre las mesas respetando los intervalos fijos (reservas ya
+# empezadas o de otros días). Prueba dos órdenes (por hora de inicio y de grupo más grande a más
+# chico) y devuelve {reserva_id: mesa_numero} del que menos asientos desperdicia, o None si
+# ninguno logra sentar a todas.
+def planificar_reasignacion(
+    mesas: List[Dict[str, Any]],
+    fijas: Dict[int, List[Intervalo]],
+    reservas: List[Dict[str, Any]]
+) -> Optional[Dict[int, int]]:
+    capacidad = {mesa['numero']: mesa['capacidad'] for mesa in mesas}
+    ordenes = [
+        sorted(reservas, key=lambda r: (r['inicio'], -r['personas'], r['id'])),
+        sorted(reservas, key=lambda r: (-r['personas'], r['inicio'], r['id'])),
+    ]
+    mejor_plan, mejor_desperdicio = None, None
+    for orden in ordenes:
+        intervalos = {numero: list(ocupados) for numero, ocupados in fijas.items()}
+        plan = {}
+        for reserva in orden:
+            mesa = elegir_mesa(mesas, intervalos, reserva['personas'], reserva['inicio'], reserva['fin'])
+            if mesa is None:
+                plan = None
+                break
+            plan[reserva['id']] = mesa['numero']
+            intervalos.setdefault(mesa['numero'], []).append((reserva['inicio'], reserva['fin']))
+        if plan is None:
+            continue
+        desperdicio = sum(capacidad[plan[r['id']]] - r['personas'] for r in reservas)
+        if mejor_desperdicio is None or desperdicio < mejor_desperdicio:
+            mejor_plan, mejor_desperdicio = plan, desperdicio
+    return mejor_plan
+
+
+# --- LECTURAS DE LA BD ---
+def _mesas(cursor) -> List[Dict[str, Any]]:
+    cursor.execute("SELECT numero, capacidad FROM mesas WHERE numero <> %s ORDER BY numero", (MESA_VIRTUAL,))
+    return [dict(row) for row in cursor.fetchall()]
+
+def _reservas_en(cursor, desde: datetime, hasta: datetime) -> List[Dict[str, Any]]:
+    # Usa el índice GiST de la restricción reservas_sin_solapamiento
+    cursor.execute("""
+        SELECT id, mesa_numero, personas, lower(periodo) AS inicio, upper(periodo) AS fin
+        FROM reservas
+        WHERE periodo && tsrange(%s, %s, '[)')
+    """, (desde, hasta))
+    return cursor.fetchall()
+
+
+# === FUNCIÓN: asignar_mesa ===
+# Mejor mesa libre para un grupo en [inicio, fin). Si la ventana incluye el momento actual
+# (cliente sin reserva) también descarta las mesas con pedidos activos.
+def asignar_mesa(cursor, personas: int, inicio: datetime, fin: datetime) -> Optional[Dict[str, Any]]:
+    dia_inicio = datetime.combine(inicio.date(), datetime.min.time())
+    dia_fin = max(dia_inicio + timedelta(days=1), fin)
+    intervalos: Dict[int, List[Intervalo]] = {}
+    for reserva in _reservas_en(cursor, dia_inicio, dia_fin):
+        intervalos.setdefault(reserva['mesa_numero'], []).append((reserva['inicio'], reserva['fin']))
+    ocupadas = set()
+    if inicio <= datetime.now() < fin:
+        cursor.execute("SELECT mesa_numero FROM mesa_estado WHERE pedidos_activos > 0")
+        ocupadas = {row['mesa_numero'] for row in cursor.fetchall()}
+    return elegir_mesa(_mesas(cursor), intervalos, personas, inicio, fin, excluir=ocupadas)
+
+
+# === FUNCIÓN: reasignar_dia ===
+# Plan de reasignación de las reservas que empiezan en `fecha` y aún no empezaron. Las reservas sin
+# `personas` (anteriores a la columna) se tratan como grupos del tamaño de su mesa actual.
+# Con aplicar=True guarda el plan en la transacción del llamador (que hace commit).
+def reasignar_dia(cursor, fecha: datetime, aplicar: bool = False) -> Dict[str, Any]:
+    dia_inicio = datetime.combine(fecha.date(), datetime.min.time())
+    dia_fin = dia_inicio + timedelta(days=1)
+    ahora = datetime.now()
+    mesas = _mesas(cursor)
+    capacidad = {mesa['numero']: mesa['capacidad'] for mesa in mesas}
+
+    filas = _reservas_en(cursor, dia_inicio, dia_fin)
+    fijas: Dict[int, List[Intervalo]] = {}
+    movibles = []
+    for fila in filas:
+        if dia_inicio <= fila['inicio'] < dia_fin and fila['inicio'] > ahora and fila['mesa_numero'] in capacidad:
+            movibles.append({
+                "id": fila['id'],
+                "mesa_actual": fila['mesa_numero'],
+                "personas": fila['personas'] or capacidad[fila['mesa_numero']],
+                "inicio": fila['inicio'],
+                "fin": fila['fin'],
+            })
+        else:
+            fijas.setdefault(fila['mesa_numero'], []).append((fila['inicio'], fila['fin']))
+
+    desperdicio_actual = sum(capacidad[r['mesa_actual']] - r['personas'] for r in movibles)
+    plan = planificar_reasignacion(mesas, fijas, movibles)
+    if plan is None:
+        plan = {r['id']: r['mesa_actual'] for r in movibles} # Sin plan completo: todo queda como está
+    desperdicio_nuevo = sum(capacidad[plan[r['id']]] - r['personas'] for r in movibles)
+    if desperdicio_nuevo >= desperdicio_actual:
+        plan = {r['id']: r['mesa_actual'] for r in movibles}
+        desperdicio_nuevo = desperdicio_actual
+
+    cambios = [
+        {"reserva_id": r['id'], "mesa_anterior": r['mesa_actual'], "mesa_nueva": plan[r['id']]}
+        for r in sorted(movibles, key=lambda r: (r['inicio'], r['id']))
+        if plan[r['id']] != r['mesa_actual']
+    ]
+    if aplicar and cambios:
+        # Los intercambios (A -> B y B -> A) se cruzan a mitad del UPDATE: la restricción se revisa al confirmar
+        cursor.execute("SET CONSTRAINTS reservas_sin_solapamiento DEFERRED")
+        cursor.execute("""
+            UPDATE reservas r
+            SET mesa_numero = c.mesa_nueva
+            FROM jsonb_to_recordset(%s::jsonb) AS c(reserva_id INTEGER, mesa_nueva INTEGER)
+            WHERE r.id = c.reserva_id
+        """, (json.dumps([{"reserva_id": c["reserva_id"], "mesa_nueva": c["mesa_nueva"]} for c in cambios]),))
+
+    return {
+        "fecha": dia_inicio.strftime("%Y-%m-%d"),
+        "reservas": len(movibles),
+        "personas": sum(r['personas'] for r in movibles),
+        "asientos_sin_usar_antes": desperdicio_actual,
+        "asientos_sin_usar_despues": desperdicio_nuevo,
+        "cambios": cambios,
+        "aplicado": bool(aplicar and cambios),
+    }
@@ -1,13 +1,14 @@
 # === BACKEND.PY ===
 # Backend API para el sistema de restaurante con integración de FastAPI y PostgreSQL.
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
 import json
 from datetime import datetime, date, timedelta
+from decimal import Decimal
 import subprocess
 import os
 import shutil
@@ -19,6 +20,7 @@ from configuraciones_backend import configuraciones_app
 from fastapi import Query 
 from fastapi import FastAPI, HTTPException, Depends, Query # Asegúrate de tener Query importado
 from recetas_backend import recetas_app
+from eventos_backend import eventos_app, bus as bus_eventos
 from backend_service import BackendService
 
 app = FastAPI(title="RestaurantIA Backend")
@@ -27,21 +29,64 @@ app = FastAPI(title="RestaurantIA Backend")
 app.mount("/inventario", inventario_app)
 app.mount("/configuraciones", configuraciones_app)
 app.mount("/recetas", recetas_app)
-
-
-# Configuración directa de PostgreSQL
-DATABASE_URL = "dbname=restaurant_db user=postgres password=postgres host=localhost port=5432"
+app.mount("/eventos", eventos_app) # Flujo SSE de cambios (LISTEN/NOTIFY)
+
+
+# Pool de conexiones PostgreSQL compartido por esta app y las sub-apps montadas
+from database import get_db, pool
+from versiones import etag_tablas, respuesta_no_modificada, agregar_etag
+from agregaciones import resumen_ventas, ventas_por_producto, ventas_de_plato, ventas_por_hora, resumen_cocina, detalle_cocina, reconstruir_resumen
+from recetas_cache import cache_recetas
+from asignacion_mesas import MESA_VIRTUAL, asignar_mesa, reasignar_dia
+from retrasos import monitor_retrasos
+from disponibilidad_menu import disponibilidad_menu
+from pronostico_inventario import pronostico_inventario
+from movimientos_inventario import marcar_movimientos, snapshots_inventario
+
+# Estados que cuentan como venta en los reportes
+ESTADOS_VENTA_REPORTE = ['Listo', 'Entregado', 'Pagado']
+ESTADOS_VENTA_COMPLETADA = ['Entregado', 'Pagado'] # Ajustar según tu definición de venta completada
+# Estados válidos de un pedido (CHECK de la tabla pedidos en SqlPRO.sql)
+ESTADOS_PEDIDO = ['Tomando pedido', 'Pendiente', 'En preparacion', 'Listo', 'Entregado', 'Pagado']
+# Cambios de estado permitidos en PATCH /pedidos/{id}/estado (estado actual -> estados siguientes)
+TRANSICIONES_PEDIDO = {
+    'Tomando pedido': ['Pendiente'],
+    'Pendiente': ['Tomando pedido', 'En preparacion'],
+    'En preparacion': ['Pendiente', 'Listo'],
+    'Listo': ['En preparacion', 'Entregado', 'Pagado'],
+    'Entregado': ['Pagado'],
+    'Pagado': [],
+}
 
 @app.get("/")
 def read_root():
     return {"message": "Bienvenido a la API del Sistema de Restaurante"}
 
-def get_db():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+@app.on_event("startup")
+def iniciar_escucha_eventos():
+    # Las sub-apps montadas no reciben startup propio, por eso se arranca aquí
+    bus_eventos.agregar_oyente(cache_recetas.al_recibir_evento)
+    bus_eventos.agregar_oyente(monitor_retrasos.al_recibir_evento)
+    bus_eventos.agregar_oyente(disponibilidad_menu.al_recibir_evento) # Después de cache_recetas
+    bus_eventos.agregar_oyente(pronostico_inventario.al_recibir_evento)
+    disponibilidad_menu.iniciar(bus_eventos.publicar)
+    bus_eventos.iniciar()
+    monitor_retrasos.iniciar(pool, bus_eventos.publicar)
+    snapshots_inventario.iniciar(pool) # Foto diaria del stock para stock_en
     try:
-        yield conn
-    finally:
-        conn.close()
+        with pool.conexion() as conn:
+            with conn.cursor() as cursor:
+                cache_recetas.cargar(cursor)
+                disponibilidad_menu.cargar(cursor)
+    except Exception as e:
+        print(f"No se pudieron precargar las recetas (se cargarán con el primer pedido): {e}")
+
+@app.on_event("shutdown")
+def cerrar_pool_conexiones():
+    bus_eventos.detener()
+    monitor_retrasos.detener()
+    snapshots_inventario.detener()
+    pool.cerrar()
 
 # Modelos
 class ItemMenu(BaseModel):
@@ -55,6 +100,17 @@ class PedidoCreate(BaseModel):
     estado: str = "Pendiente"
     notas: str = ""
 
+class PedidosLote(BaseModel):
+    pedidos: List[PedidoCreate]
+
+class CambioEstadoPedido(BaseModel):
+    id: int
+    estado: str
+    estado_actual: Optional[str] = None # Estado que vio la pantalla (compare-and-set)
+
+class CambiosEstadoPedidos(BaseModel):
+    cambios: List[CambioEstadoPedido]
+
 class PedidoResponse(BaseModel):
     id: int
     mesa_numero: int
@@ -77,10 +133,16 @@ class ClienteResponse(BaseModel):
     fecha_registro: str
     
 class ReservaCreate(BaseModel):
-    mesa_numero: int
+    mesa_numero: Optional[int] = None # Sin mesa: se asigna automáticamente según `personas`
     cliente_id: int
     fecha_hora_inicio: str  # "YYYY-MM-DD HH:MM:SS"
     fecha_hora_fin: Optional[str] = None # "YYYY-MM-DD HH:MM:SS"
+    personas: Optional[int] = None
+
+class AsignacionMesa(BaseModel):
+    personas: int
+    fecha_hora_inicio: Optional[str] = None # "YYYY-MM-DD HH:MM:SS"; sin inicio = ahora (cliente sin reserva)
+    fecha_hora_fin: Optional[str] = None # Por defecto, 1 hora después del inicio
 
 class BackupResponse(BaseModel):
     status: str
@@ -91,91 +153,165 @@ class BackupResponse(BaseModel):
 @app.get("/health")
 def health():
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        conn.close()
-        return {"status": "ok", "database": "connected"}
+        with pool.conexion() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        return {"status": "ok", "database": "connected", "pool": pool.metricas()}
     except Exception as e:
-        return {"status": "error", "database": str(e)}
+        return {"status": "error", "database": str(e), "pool": pool.metricas()}
 
 @app.get("/menu/items", response_model=List[ItemMenu])
-def obtener_menu(conn: psycopg2.extensions.connection = Depends(get_db)):
+def obtener_menu(request: Request, response: Response, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
+        etag = etag_tablas(cursor, "menu")
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
         cursor.execute("SELECT nombre, precio, tipo FROM menu ORDER BY tipo, nombre")
         items = cursor.fetchall()
+        agregar_etag(response, etag)
         return items
 
+# --- DISPONIBILIDAD DEL MENÚ ("lista 86") ---
+# Porciones que permite el stock actual por plato, desde memoria (disponibilidad_menu.py).
+# None = plato sin receta (no consume inventario). Los cambios llegan con el evento SSE 'menu_disponibilidad'.
+@app.get("/menu/disponibilidad")
+def obtener_disponibilidad_menu(request: Request, response: Response, conn: psycopg2.extensions.connection = Depends(get_db)):
+    with conn.cursor() as cursor:
+        porciones, version = disponibilidad_menu.obtener(cursor) # Solo lee la BD si la copia fue invalidada
+    # El ETag es el de los datos que se devuelven (tomado después de cargarlos); si la carga se
+    # descartó no hay versión y se responde sin ETag, así nunca hay 304 mientras la copia no está cargada
+    if version is not None:
+        etag = disponibilidad_menu.etag(version)
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
+        agregar_etag(response, etag)
+    return {
+        "porciones": porciones,
+        "agotados": sorted(plato for plato, cantidad in porciones.items() if cantidad == 0)
+    }
+# --- FIN DISPONIBILIDAD DEL MENÚ ---
+
+# === FUNCIÓN: verificar_y_descontar_stock ===
+# Explota los platos del pedido en ingredientes con las recetas en memoria (recetas_cache.py),
+# y en una sola sentencia SQL bloquea las filas de inventario afectadas, verifica el stock y lo
+# descuenta. Si falta algún ingrediente no se descuenta nada y se devuelve la lista de faltantes.
+# La misma sentencia reserva el id del pedido y lo marca como origen del consumo para el libro de
+# movimientos (trigger_movimientos_inventario_update lo lee al terminar la sentencia).
+SQL_VERIFICAR_Y_DESCONTAR_STOCK = """
+    WITH marca AS MATERIALIZED (
+        SELECT s.pedido_id,
+               set_config('restaurante.motivo_inventario', 'consumo', true) AS motivo,
+               set_config('restaurante.pedido_inventario', s.pedido_id::text, true) AS pedido
+        FROM (SELECT nextval(pg_get_serial_sequence('pedidos', 'id')) AS pedido_id) s
+    ),
+    necesarios AS (
+        SELECT *
+        FROM jsonb_to_recordset(%s::jsonb) AS n(ingrediente_id INTEGER, cantidad_necesaria NUMERIC, platos TEXT)
+    ),
+    bloqueados AS MATERIALIZED (
+        SELECT i.id, i.nombre, i.cantidad_disponible, n.cantidad_necesaria, n.platos
+        FROM inventario i
+        JOIN necesarios n ON n.ingrediente_id = i.id
+        ORDER BY i.id -- Orden fijo de bloqueo para evitar deadlocks entre pedidos concurrentes
+        FOR UPDATE OF i
+    ),
+    faltantes AS (
+        SELECT * FROM bloqueados WHERE cantidad_disponible < cantidad_necesaria
+    ),
+    descontados AS (
+        UPDATE inventario i
+        SET cantidad_disponible = i.cantidad_disponible - b.cantidad_necesaria
+        FROM bloqueados b
+        WHERE i.id = b.id
+        AND NOT EXISTS (SELECT 1 FROM faltantes)
+        RETURNING i.id
+    )
+    -- Siempre al menos una fila (la del id reservado); las que tienen ingrediente son los faltantes
+    SELECT m.pedido_id, f.id AS ingrediente_id, f.nombre AS nombre_ingrediente, f.cantidad_disponible, f.cantidad_necesaria, f.platos
+    FROM marca m
+    LEFT JOIN faltantes f ON TRUE
+    ORDER BY f.nombre;
+"""
+
+def verificar_y_descontar_stock(cursor, items: List[dict]) -> Tuple[Optional[int], List[dict]]:
+    """Devuelve (id reservado para el pedido, faltantes). Sin platos con receta no se reserva id (None)."""
+    necesarios = cache_recetas.ingredientes_necesarios(cursor, items)
+    if not necesarios:
+        return None, [] # Ningún plato del pedido tiene receta: no hay nada que descontar
+    cursor.execute(SQL_VERIFICAR_Y_DESCONTAR_STOCK, (json.dumps(necesarios),))
+    filas = cursor.fetchall()
+    return filas[0]['pedido_id'], [fila for fila in filas if fila['ingrediente_id'] is not None]
+
+# === FUNCIÓN: guardar_items_pedido ===
+# Reescribe las líneas normalizadas (pedido_items) de un pedido a partir de su lista de ítems.
+# Se llama dentro de la misma transacción que escribe pedidos.items, así ambas quedan iguales.
+SQL_INSERTAR_ITEMS_PEDIDO = """
+    INSERT INTO pedido_items (pedido_id, linea, nombre, tipo, precio, cantidad, fecha)
+    SELECT %(pedido_id)s, item.linea, item.valor->>'nombre', item.valor->>'tipo',
+           COALESCE((item.valor->>'precio')::numeric, 0), COALESCE((item.valor->>'cantidad')::integer, 1),
+           %(fecha)s
+    FROM jsonb_array_elements(%(items)s::jsonb) WITH ORDINALITY AS item(valor, linea)
+"""
+
+def guardar_items_pedido(cursor, pedido_id: int, items: List[dict], fecha_hora):
+    cursor.execute("DELETE FROM pedido_items WHERE pedido_id = %s", (pedido_id,))
+    cursor.execute(SQL_INSERTAR_ITEMS_PEDIDO, {"pedido_id": pedido_id, "items": json.dumps(items), "fecha": fecha_hora})
+
+# === FUNCIÓN: siguiente_numero_app ===
+# Número de ticket de los pedidos de la app (mesa virtual), reiniciado cada día. Una sola
+# sentencia sobre la fila del día en contadores_app, sin importar cuántos pedidos haya.
+SQL_SIGUIENTE_NUMERO_APP = """
+    INSERT INTO contadores_app (fecha, ultimo) VALUES (CURRENT_DATE, 1)
+    ON CONFLICT (fecha) DO UPDATE SET ultimo = contadores_app.ultimo + 1
+    RETURNING ultimo
+"""
+
+SQL_RESERVAR_NUMEROS_APP = """
+    INSERT INTO contadores_app (fecha, ultimo) VALUES (CURRENT_DATE, %(cantidad)s)
+    ON CONFLICT (fecha) DO UPDATE SET ultimo = contadores_app.ultimo + %(cantidad)s
+    RETURNING ultimo
+"""
+
+def siguiente_numero_app(cursor) -> int:
+    cursor.execute(SQL_SIGUIENTE_NUMERO_APP)
+    return cursor.fetchone()['ultimo']
+
+def reservar_numeros_app(cursor, cantidad: int) -> List[int]:
+    """Reserva `cantidad` números consecutivos en una sola sentencia (pedidos en lote)."""
+    cursor.execute(SQL_RESERVAR_NUMEROS_APP, {"cantidad": cantidad})
+    ultimo = cursor.fetchone()['ultimo']
+    return list(range(ultimo - cantidad + 1, ultimo + 1))
+
 @app.post("/pedidos", response_model=PedidoResponse)
 def crear_pedido(pedido: PedidoCreate, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
-        # --- NUEVA LÓGICA: VERIFICAR Y CONSUMIR INGREDIENTES ---
-        
-        # 1. Agrupar items por nombre para calcular cantidades totales
-        items_agrupados = {}
-        for item in pedido.items:
-            nombre_item = item['nombre']
-            if nombre_item in items_agrupados:
-                items_agrupados[nombre_item] += 1
-            else:
-                items_agrupados[nombre_item] = 1
-
-        # 2. Verificar stock de todos los ingredientes necesarios
-        ingredientes_a_consumir = [] # Lista de tuplas (ingrediente_id, cantidad_a_consumir, nombre_ingrediente)
-        
-        for nombre_item, cantidad_pedido in items_agrupados.items():
-            # Buscar si el ítem del pedido tiene una receta asociada
-            cursor.execute("""
-                SELECT r.id
-                FROM recetas r
-                WHERE r.nombre_plato = %s
-            """, (nombre_item,))
-            receta = cursor.fetchone()
-            
-            if receta:
-                # Si tiene receta, obtener los ingredientes necesarios y su stock actual
-                cursor.execute("""
-                    SELECT ir.ingrediente_id, ir.cantidad_necesaria, i.cantidad_disponible, i.nombre as nombre_ingrediente
-                    FROM ingredientes_recetas ir
-                    JOIN inventario i ON ir.ingrediente_id = i.id
-                    WHERE ir.receta_id = %s
-                """, (receta['id'],))
-                
-                ingredientes_recetas = cursor.fetchall()
-                
-                for ing in ingredientes_recetas:
-                    cantidad_total_necesaria = ing['cantidad_necesaria'] * cantidad_pedido
-                    
-                    # VERIFICACION DE STOCK
-                    if ing['cantidad_disponible'] < cantidad_total_necesaria:
-                        # Error: No hay suficiente stock
-                        raise HTTPException(
-                            status_code=400, 
-                            detail=f"No hay suficiente stock de '{ing['nombre_ingrediente']}' para preparar '{nombre_item}'. Disponible: {ing['cantidad_disponible']}, Necesario: {cantidad_total_necesaria}"
-                        )
-                    
-                    # Si hay stock, guardar para consumir después
-                    ingredientes_a_consumir.append({
-                        "id": ing['ingrediente_id'],
-                        "cantidad": cantidad_total_necesaria
-                    })
-
-        # 3. Si pasamos aquí, hay stock suficiente para TODO el pedido. Procedemos a crear el pedido.
-
-        numero_app = None
-        if pedido.mesa_numero == 99:
-            cursor.execute("SELECT MAX(numero_app) FROM pedidos WHERE mesa_numero = 99")
-            max_app = cursor.fetchone()
-            if max_app and max_app['max'] is not None:
-                numero_app = max_app['max'] + 1
-            else:
-                numero_app = 1
+        # --- VERIFICAR Y CONSUMIR INGREDIENTES EN UNA SOLA SENTENCIA ---
+        # Explosión de recetas, bloqueo de filas de inventario, verificación y descuento
+        # se resuelven en un único viaje a la BD, sin importar el tamaño del pedido.
+        # El id del pedido se reserva en la misma sentencia (el libro de movimientos asocia el consumo al pedido).
+        pedido_id, faltantes = verificar_y_descontar_stock(cursor, pedido.items)
+        if faltantes:
+            # Error: No hay suficiente stock (el descuento no se aplicó y la transacción se revierte)
+            detalle = "; ".join(
+                f"'{f['nombre_ingrediente']}' para preparar '{f['platos']}'. Disponible: {f['cantidad_disponible']}, Necesario: {f['cantidad_necesaria']}"
+                for f in faltantes
+            )
+            raise HTTPException(status_code=400, detail=f"No hay suficiente stock de {detalle}")
+
+        # Si pasamos aquí, hay stock suficiente para TODO el pedido (ya descontado). Procedemos a crear el pedido.
+
+        numero_app = siguiente_numero_app(cursor) if pedido.mesa_numero == MESA_VIRTUAL else None
 
         fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         cursor.execute("""
-            INSERT INTO pedidos (mesa_numero, numero_app, estado, fecha_hora, items, notas)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO pedidos (id, mesa_numero, numero_app, estado, fecha_hora, items, notas)
+            VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('pedidos', 'id'))), %s, %s, %s, %s, %s, %s)
             RETURNING id, mesa_numero, numero_app, estado, fecha_hora, items, notas
         """, (
+            pedido_id,
             pedido.mesa_numero,
             numero_app,
             pedido.estado,
@@ -185,18 +321,8 @@ def crear_pedido(pedido: PedidoCreate, conn: psycopg2.extensions.connection = De
         ))
         
         result = cursor.fetchone()
+        guardar_items_pedido(cursor, result['id'], pedido.items, result['fecha_hora'])
 
-        # 4. Consumir el stock (Actualizar inventario)
-        # Iterar sobre la lista de ingredientes validados
-        for consumo in ingredientes_a_consumir:
-            cursor.execute("""
-                UPDATE inventario
-                SET cantidad_disponible = cantidad_disponible - %s
-                WHERE id = %s
-            """, (consumo['cantidad'], consumo['id']))
-            
-        # --- FIN NUEVA LÓGICA ---
-        
         conn.commit()
         # ✅ CORREGIDO: Convertir datetime a string si es necesario
         fecha_hora_str = result['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S") if isinstance(result['fecha_hora'], datetime) else result['fecha_hora']
@@ -211,6 +337,144 @@ def crear_pedido(pedido: PedidoCreate, conn: psycopg2.extensions.connection = De
             "notas": result['notas']
         }
 
+def serializar_pedido(row) -> dict:
+    # ✅ CORREGIDO: Convertir datetime a string si es necesario
+    fecha_hora_str = row['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row['fecha_hora'], datetime) else row['fecha_hora']
+    return {
+        "id": row['id'],
+        "mesa_numero": row['mesa_numero'],
+        "numero_app": row['numero_app'],
+        "estado": row['estado'],
+        "fecha_hora": fecha_hora_str,
+        "items": row['items'],
+        "notas": row['notas']
+    }
+
+# --- PEDIDOS EN LOTE (app / delivery) ---
+MAX_PEDIDOS_LOTE = 200
+
+SQL_BLOQUEAR_INVENTARIO = """
+    SELECT id, nombre, cantidad_disponible
+    FROM inventario
+    WHERE id = ANY(%s)
+    ORDER BY id -- Mismo orden de bloqueo que verificar_y_descontar_stock
+    FOR UPDATE
+"""
+
+SQL_DESCONTAR_INVENTARIO_LOTE = """
+    UPDATE inventario i
+    SET cantidad_disponible = i.cantidad_disponible - d.cantidad
+    FROM jsonb_to_recordset(%s::jsonb) AS d(id INTEGER, cantidad NUMERIC)
+    WHERE i.id = d.id
+"""
+
+SQL_INSERTAR_PEDIDOS_LOTE = """
+    INSERT INTO pedidos (id, mesa_numero, numero_app, estado, fecha_hora, items, notas)
+    SELECT p.id, p.mesa_numero, p.numero_app, p.estado, p.fecha_hora, p.items, p.notas
+    FROM jsonb_to_recordset(%s::jsonb)
+        AS p(id INTEGER, mesa_numero INTEGER, numero_app INTEGER, estado TEXT, fecha_hora TIMESTAMP, items JSONB, notas TEXT)
+    RETURNING id, mesa_numero, numero_app, estado, fecha_hora, items, notas
+"""
+
+SQL_INSERTAR_ITEMS_LOTE = """
+    INSERT INTO pedido_items (pedido_id, linea, nombre, tipo, precio, cantidad, fecha)
+    SELECT p.id, item.linea, item.valor->>'nombre', item.valor->>'tipo',
+           COALESCE((item.valor->>'precio')::numeric, 0), COALESCE((item.valor->>'cantidad')::integer, 1),
+           p.fecha_hora
+    FROM jsonb_to_recordset(%s::jsonb) AS p(id INTEGER, fecha_hora TIMESTAMP, items JSONB)
+    CROSS JOIN LATERAL jsonb_array_elements(p.items) WITH ORDINALITY AS item(valor, linea)
+"""
+
+@app.post("/pedidos/lote")
+def crear_pedidos_lote(lote: PedidosLote, conn: psycopg2.extensions.connection = Depends(get_db)):
+    """
+    Crea varios pedidos en una sola transacción (ráfagas de pedidos de la app o de delivery).
+    El stock de todo el lote se verifica de una vez con las recetas en memoria, en el orden
+    recibido: un pedido sin stock suficiente se rechaza y no impide aceptar los siguientes.
+    Devuelve un resultado por pedido, en el mismo orden.
+    """
+    if not lote.pedidos:
+        return {"aceptados": 0, "rechazados": 0, "resultados": []}
+    if len(lote.pedidos) > MAX_PEDIDOS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_PEDIDOS_LOTE} pedidos por lote.")
+
+    with conn.cursor() as cursor:
+        resultados: List[dict] = [{"indice": i, "aceptado": False} for i in range(len(lote.pedidos))]
+
+        cursor.execute("SELECT numero FROM mesas WHERE numero = ANY(%s)", (list({p.mesa_numero for p in lote.pedidos}),))
+        mesas_existentes = {row['numero'] for row in cursor.fetchall()}
+
+        # Ingredientes de cada pedido (recetas en memoria) y bloqueo de todos los afectados a la vez
+        necesarios_por_pedido = [cache_recetas.ingredientes_necesarios(cursor, p.items) for p in lote.pedidos]
+        ids_ingredientes = sorted({n['ingrediente_id'] for necesarios in necesarios_por_pedido for n in necesarios})
+        stock: Dict[int, dict] = {}
+        if ids_ingredientes:
+            cursor.execute(SQL_BLOQUEAR_INVENTARIO, (ids_ingredientes,))
+            stock = {row['id']: {"nombre": row['nombre'], "cantidad": Decimal(row['cantidad_disponible'])} for row in cursor.fetchall()}
+
+        aceptados = []
+        descuento: Dict[int, Decimal] = {}
+        for i, (pedido, necesarios) in enumerate(zip(lote.pedidos, necesarios_por_pedido)):
+            if pedido.mesa_numero not in mesas_existentes:
+                resultados[i]["error"] = f"La mesa {pedido.mesa_numero} no existe."
+                continue
+            if pedido.estado not in ESTADOS_PEDIDO:
+                resultados[i]["error"] = f"Estado inválido: {pedido.estado}"
+                continue
+            faltantes = [
+                n for n in necesarios
+                if n['ingrediente_id'] not in stock or stock[n['ingrediente_id']]["cantidad"] < Decimal(n['cantidad_necesaria'])
+            ]
+            if faltantes:
+                resultados[i]["error"] = "No hay suficiente stock de " + "; ".join(
+                    f"'{stock.get(f['ingrediente_id'], {}).get('nombre', f['ingrediente_id'])}' para preparar '{f['platos']}'. "
+                    f"Disponible: {stock[f['ingrediente_id']]['cantidad'] if f['ingrediente_id'] in stock else 0}, Necesario: {f['cantidad_necesaria']}"
+                    for f in faltantes
+                )
+                continue
+            for n in necesarios:
+                cantidad = Decimal(n['cantidad_necesaria'])
+                stock[n['ingrediente_id']]["cantidad"] -= cantidad
+                descuento[n['ingrediente_id']] = descuento.get(n['ingrediente_id'], Decimal(0)) + cantidad
+            aceptados.append(i)
+
+        if aceptados:
+            # Ids y números de la app reservados de antemano: cada fila insertada se asocia a su pedido
+            cursor.execute("SELECT nextval(pg_get_serial_sequence('pedidos', 'id')) AS id FROM generate_series(1, %s)", (len(aceptados),))
+            ids = [row['id'] for row in cursor.fetchall()]
+
+            if descuento:
+                # Un movimiento de consumo por ingrediente para todo el lote (la nota lista los pedidos)
+                marcar_movimientos(cursor, "consumo", nota="Lote de pedidos " + ", ".join(str(pedido_id) for pedido_id in ids))
+                cursor.execute(SQL_DESCONTAR_INVENTARIO_LOTE, (json.dumps([{"id": k, "cantidad": str(v)} for k, v in descuento.items()]),))
+            de_la_app = [i for i in aceptados if lote.pedidos[i].mesa_numero == MESA_VIRTUAL]
+            numeros_app = dict(zip(de_la_app, reservar_numeros_app(cursor, len(de_la_app)))) if de_la_app else {}
+
+            fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            filas = [
+                {
+                    "id": pedido_id,
+                    "mesa_numero": lote.pedidos[i].mesa_numero,
+                    "numero_app": numeros_app.get(i),
+                    "estado": lote.pedidos[i].estado,
+                    "fecha_hora": fecha_hora,
+                    "items": lote.pedidos[i].items,
+                    "notas": lote.pedidos[i].notas
+                }
+                for i, pedido_id in zip(aceptados, ids)
+            ]
+            cursor.execute(SQL_INSERTAR_PEDIDOS_LOTE, (json.dumps(filas),))
+            creados = {row['id']: serializar_pedido(row) for row in cursor.fetchall()}
+            cursor.execute(SQL_INSERTAR_ITEMS_LOTE, (json.dumps(filas),))
+
+            for i, pedido_id in zip(aceptados, ids):
+                resultados[i]["aceptado"] = True
+                resultados[i]["pedido"] = creados[pedido_id]
+
+        conn.commit()
+        return {"aceptados": len(aceptados), "rechazados": len(lote.pedidos) - len(aceptados), "resultados": resultados}
+# --- FIN PEDIDOS EN LOTE ---
+
 @app.get("/pedidos/activos", response_model=List[PedidoResponse])
 def obtener_pedidos_activos(conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
@@ -220,133 +484,294 @@ def obtener_pedidos_activos(conn: psycopg2.extensions.connection = Depends(get_d
             WHERE estado IN ('Pendiente', 'En preparacion', 'Listo')
             ORDER BY fecha_hora DESC
         """)
-        pedidos = []
-        for row in cursor.fetchall():
-            # ✅ CORREGIDO: Convertir datetime a string si es necesario
-            fecha_hora_str = row['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row['fecha_hora'], datetime) else row['fecha_hora']
-            pedidos.append({
-                "id": row['id'],
-                "mesa_numero": row['mesa_numero'],
-                "numero_app": row['numero_app'],
-                "estado": row['estado'],
-                "fecha_hora": fecha_hora_str,
-                "items": row['items'],
-                "notas": row['notas']
-            })
-        return pedidos
+        return [serializar_pedido(row) for row in cursor.fetchall()]
+
+# --- PEDIDOS ATRASADOS ---
+# Se sirven desde la copia en memoria de retrasos.py (sin recorrer pedidos). Cuando un pedido
+# cruza el umbral del backend se publica además el evento SSE 'pedidos_atrasados'.
+@app.get("/pedidos/atrasados")
+def obtener_pedidos_atrasados(
+    umbral_minutos: Optional[float] = Query(None, gt=0, description="Minutos de espera; por defecto el umbral del backend (UMBRAL_RETRASO_MINUTOS)."),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    if monitor_retrasos.pendiente_sincronizar():
+        # Hay cambios de pedidos aún no leídos (o el monitor no arrancó): leerlos antes de responder
+        with conn.cursor() as cursor:
+            monitor_retrasos.sincronizar(cursor)
+    return {
+        "umbral_minutos": umbral_minutos if umbral_minutos is not None else monitor_retrasos.umbral.total_seconds() / 60,
+        "pedidos": monitor_retrasos.atrasados(umbral_minutos)
+    }
+# --- FIN PEDIDOS ATRASADOS ---
+
+# --- ENDPOINT DE CAMBIOS INCREMENTALES DE PEDIDOS ---
+# El cursor es el xmin del snapshot de PostgreSQL: toda transacción con id menor ya terminó.
+# Cada fila de pedidos guarda en `version` la transacción que la modificó por última vez y cada
+# borrado deja una lápida en pedidos_eliminados (ver triggers en SqlPRO.sql). Pedir `version >= cursor`
+# puede repetir algún pedido ya entregado (aplicarlo de nuevo no cambia nada), pero nunca se salta
+# un cambio de una transacción que confirmó tarde, cosa que sí pasaría con updated_at o una secuencia.
+# Las lápidas se borran a las 24 horas: un cursor anterior a la última purga recibe la lista completa
+# (`completo: true`), igual que sin `since`, porque podría faltarle alguna eliminación.
+@app.get("/pedidos/cambios")
+def obtener_cambios_pedidos(
+    since: Optional[str] = Query(None, description="Cursor devuelto por la llamada anterior. Sin él se devuelven todos los pedidos activos."),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    if since is not None and not since.isdigit():
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    with conn.cursor() as cursor:
+        # El cursor se toma ANTES de leer los cambios: lo que confirme después se verá en la próxima llamada
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS cursor")
+        nuevo_cursor = cursor.fetchone()['cursor']
+
+        completo = since is None
+        if not completo:
+            cursor.execute("SELECT version >= %s::xid8 AS vencido FROM pedidos_lapidas_purgadas", (since,))
+            fila = cursor.fetchone()
+            completo = fila is not None and fila['vencido']
+
+        if completo:
+            cursor.execute("""
+                SELECT id, mesa_numero, numero_app, estado, fecha_hora, items, notas
+                FROM pedidos
+                WHERE estado IN ('Pendiente', 'En preparacion', 'Listo')
+                ORDER BY fecha_hora DESC
+            """)
+            pedidos = [serializar_pedido(row) for row in cursor.fetchall()]
+            eliminados = []
+        else:
+            # Incluye pedidos que dejaron de estar activos (Entregado, Pagado): el cliente los quita de su copia
+            cursor.execute("""
+                SELECT id, mesa_numero, numero_app, estado, fecha_hora, items, notas
+                FROM pedidos
+                WHERE version >= %s::xid8
+                ORDER BY fecha_hora DESC
+            """, (since,))
+            pedidos = [serializar_pedido(row) for row in cursor.fetchall()]
+            cursor.execute("SELECT DISTINCT pedido_id FROM pedidos_eliminados WHERE version >= %s::xid8", (since,))
+            eliminados = [row['pedido_id'] for row in cursor.fetchall()]
+
+        return {
+            "cursor": nuevo_cursor,
+            "completo": completo, # True: reemplazar la copia local en lugar de aplicar cambios
+            "pedidos": pedidos,
+            "eliminados": eliminados
+        }
+# --- FIN ENDPOINT DE CAMBIOS ---
+
+# --- ACTUALIZACIÓN DE ESTADO (compare-and-set) ---
+# Una sola sentencia: solo cambia el pedido si su estado actual permite pasar al nuevo (y, si el
+# cliente lo indica, si sigue en el estado que vio). Las marcas de cocina se ponen con CASE en el
+# mismo UPDATE. Si dos pantallas de cocina pulsan a la vez, la segunda no encuentra la fila y recibe 409.
+SQL_CAMBIAR_ESTADO_PEDIDO = """
+    UPDATE pedidos
+    SET estado = %(estado)s,
+        hora_inicio_cocina = CASE
+            WHEN %(estado)s = 'En preparacion' AND hora_inicio_cocina IS NULL THEN LOCALTIMESTAMP -- Solo la primera vez
+            ELSE hora_inicio_cocina
+        END,
+        hora_fin_cocina = CASE
+            WHEN %(estado)s = 'Listo' AND hora_inicio_cocina IS NOT NULL AND hora_fin_cocina IS NULL THEN LOCALTIMESTAMP
+            ELSE hora_fin_cocina
+        END
+    WHERE id = %(pedido_id)s
+    AND estado = ANY(%(origenes)s)
+    RETURNING id, mesa_numero, cliente_id, estado, fecha_hora, items, numero_app, notas, updated_at, hora_inicio_cocina, hora_fin_cocina
+"""
+
+def origenes_permitidos(estado: str, estado_actual: Optional[str] = None) -> List[str]:
+    """Estados desde los que se puede pasar a `estado` (restringidos a `estado_actual` si se indica)."""
+    origenes = [origen for origen, destinos in TRANSICIONES_PEDIDO.items() if estado in destinos]
+    if estado_actual is not None:
+        origenes = [origen for origen in origenes if origen == estado_actual]
+    return origenes
 
-# --- MODIFICACIÓN EN EL ENDPOINT DE ACTUALIZACIÓN DE ESTADO ---
 @app.patch("/pedidos/{pedido_id}/estado")
-def actualizar_estado_pedido(pedido_id: int, estado: str, conn = Depends(get_db)):
-    with conn.cursor() as cursor:
-        # Verificar si el pedido existe
-        cursor.execute("SELECT estado, hora_inicio_cocina, hora_fin_cocina FROM pedidos WHERE id = %s", (pedido_id,))
-        pedido = cursor.fetchone()
-        if not pedido:
-            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+def actualizar_estado_pedido(pedido_id: int, estado: str, estado_actual: Optional[str] = None, conn = Depends(get_db)):
+    if estado not in ESTADOS_PEDIDO:
+        raise HTTPException(status_code=400, detail=f"Estado inválido: {estado}")
 
-        # --- LÓGICA PARA REGISTRAR MARCAS DE TIEMPO ---
-        now = datetime.now()
-        extra_update = ""
-        extra_values = []
-
-        if estado == "En preparacion" and pedido['hora_inicio_cocina'] is None:
-            # Solo registrar si es la primera vez que entra en "En preparacion"
-            extra_update = ", hora_inicio_cocina = %s"
-            extra_values.append(now)
-        elif estado == "Listo" and pedido['hora_inicio_cocina'] is not None and pedido['hora_fin_cocina'] is None:
-            # Registrar fin solo si hay un inicio registrado y aún no se ha registrado el fin
-            extra_update = ", hora_fin_cocina = %s"
-            extra_values.append(now)
-        # Opcional: Podrías limpiar hora_inicio_cocina si el estado vuelve a "Pendiente", pero eso complica la lógica.
-        # --- FIN LÓGICA ---
-
-        # Actualizar el estado (y potencialmente las marcas de tiempo)
-        update_query = f"UPDATE pedidos SET estado = %s {extra_update} WHERE id = %s RETURNING id, mesa_numero, cliente_id, estado, fecha_hora, items, numero_app, notas, updated_at, hora_inicio_cocina, hora_fin_cocina"
-        cursor.execute(update_query, (estado, *extra_values, pedido_id)) # *extra_values para desempaquetar los valores opcionales
+    with conn.cursor() as cursor:
+        cursor.execute(SQL_CAMBIAR_ESTADO_PEDIDO, {
+            "pedido_id": pedido_id,
+            "estado": estado,
+            "origenes": origenes_permitidos(estado, estado_actual)
+        })
         result = cursor.fetchone()
 
         if not result:
-            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+            # Solo en el caso de error: distinguir pedido inexistente de estado ya cambiado
+            cursor.execute("SELECT estado FROM pedidos WHERE id = %s", (pedido_id,))
+            pedido = cursor.fetchone()
+            if not pedido:
+                raise HTTPException(status_code=404, detail="Pedido no encontrado")
+            raise HTTPException(
+                status_code=409,
+                detail=f"El pedido está en '{pedido['estado']}' y no puede pasar a '{estado}'."
+            )
 
         conn.commit()
 
         # Devolver el pedido actualizado
         pedido_dict = dict(result)
-        # Opcional: Calcular el tiempo transcurrido aquí si se envía al cliente
         if pedido_dict['hora_inicio_cocina'] and pedido_dict['hora_fin_cocina']:
             tiempo_cocina = (pedido_dict['hora_fin_cocina'] - pedido_dict['hora_inicio_cocina']).total_seconds() / 60 # En minutos
             pedido_dict['tiempo_cocina_minutos'] = tiempo_cocina
-        elif pedido_dict['hora_inicio_cocina'] and estado == "Listo": # Solo si se acaba de marcar como listo y hay inicio
-             tiempo_cocina = (now - pedido_dict['hora_inicio_cocina']).total_seconds() / 60 # En minutos
-             pedido_dict['tiempo_cocina_minutos'] = tiempo_cocina
 
         return pedido_dict
-# --- FIN MODIFICACIÓN ---
 
-@app.get("/mesas")
-def obtener_mesas(conn: psycopg2.extensions.connection = Depends(get_db)):
+# --- ACTUALIZACIÓN DE ESTADO EN LOTE ---
+MAX_CAMBIOS_ESTADO = 200
+
+# Las mismas reglas que SQL_CAMBIAR_ESTADO_PEDIDO, para muchos pedidos en una sola sentencia
+SQL_CAMBIAR_ESTADO_PEDIDOS = """
+    UPDATE pedidos p
+    SET estado = c.estado,
+        hora_inicio_cocina = CASE
+            WHEN c.estado = 'En preparacion' AND p.hora_inicio_cocina IS NULL THEN LOCALTIMESTAMP
+            ELSE p.hora_inicio_cocina
+        END,
+        hora_fin_cocina = CASE
+            WHEN c.estado = 'Listo' AND p.hora_inicio_cocina IS NOT NULL AND p.hora_fin_cocina IS NULL THEN LOCALTIMESTAMP
+            ELSE p.hora_fin_cocina
+        END
+    FROM jsonb_to_recordset(%s::jsonb) AS c(id INTEGER, estado TEXT, origenes JSONB)
+    WHERE p.id = c.id
+    AND p.estado IN (SELECT jsonb_array_elements_text(c.origenes))
+    RETURNING p.id, p.mesa_numero, p.cliente_id, p.estado, p.fecha_hora, p.items, p.numero_app, p.notas, p.updated_at, p.hora_inicio_cocina, p.hora_fin_cocina
+"""
+
+@app.patch("/pedidos/estado")
+def actualizar_estados_pedidos(datos: CambiosEstadoPedidos, conn = Depends(get_db)):
     """
-    Obtiene el estado real de todas las mesas desde la base de datos.
+    Aplica varios cambios de estado (p. ej. marcar varios tickets 'Listo' o cerrar las cuentas al
+    final del turno) en una transacción. Cada cambio sigue las reglas de PATCH /pedidos/{id}/estado
+    y tiene su propio resultado: uno rechazado (400/404/409) no impide aplicar los demás.
     """
-    try:
-        with conn.cursor() as cursor:
-            # ✅ ENFOQUE SIMPLIFICADO: Obtener mesas y verificar ocupación por separado
-            mesas_result = []
-            
-            # Definir las mesas físicas
-            mesas_fisicas = [
-                {"numero": 1, "capacidad": 2},
-                {"numero": 2, "capacidad": 2},
-                {"numero": 3, "capacidad": 4},
-                {"numero": 4, "capacidad": 4},
-                {"numero": 5, "capacidad": 6},
-                {"numero": 6, "capacidad": 6},
-            ]
-            
-            for mesa in mesas_fisicas:
-                # Verificar si la mesa tiene pedidos activos
-                cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM pedidos 
-                    WHERE mesa_numero = %s 
-                    AND estado IN ('Pendiente', 'En preparacion', 'Listo')
-                """, (mesa["numero"],))
-                
-                result = cursor.fetchone()
-                # ✅ CORREGIDO: Asegurar que el conteo sea entero y no None
-                count = result['count'] if result and result['count'] is not None else 0
-                print(f"Mesa {mesa['numero']} -> COUNT: {count}")  # DEBUG
-                ocupada = count > 0
-                
-                mesas_result.append({
-                    "numero": mesa["numero"],
-                    "capacidad": mesa["capacidad"],
-                    "ocupada": ocupada  # ← Este valor se envía al frontend
-                })
-            
-            # Agregar mesa virtual
+    if len(datos.cambios) > MAX_CAMBIOS_ESTADO:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_CAMBIOS_ESTADO} cambios por petición.")
+
+    resultados: List[dict] = [{"indice": i, "id": c.id, "actualizado": False} for i, c in enumerate(datos.cambios)]
+    validos = {} # id -> índice
+    for i, cambio in enumerate(datos.cambios):
+        if cambio.estado not in ESTADOS_PEDIDO:
+            resultados[i].update({"codigo": 400, "error": f"Estado inválido: {cambio.estado}"})
+        elif cambio.id in validos:
+            resultados[i].update({"codigo": 400, "error": "Pedido repetido en la misma petición."})
+        else:
+            validos[cambio.id] = i
+
+    with conn.cursor() as cursor:
+        actualizados = {}
+        if validos:
+            cursor.execute(SQL_CAMBIAR_ESTADO_PEDIDOS, (json.dumps([
+                {
+                    "id": cambio.id,
+                    "estado": cambio.estado,
+                    "origenes": origenes_permitidos(cambio.estado, cambio.estado_actual)
+                }
+                for cambio in (datos.cambios[i] for i in validos.values())
+            ]),))
+            actualizados = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        rechazados = [pedido_id for pedido_id in validos if pedido_id not in actualizados]
+        estados_actuales = {}
+        if rechazados:
+            cursor.execute("SELECT id, estado FROM pedidos WHERE id = ANY(%s)", (rechazados,))
+            estados_actuales = {row['id']: row['estado'] for row in cursor.fetchall()}
+
+        conn.commit()
+
+    for pedido_id, i in validos.items():
+        if pedido_id in actualizados:
+            resultados[i].update({"actualizado": True, "pedido": actualizados[pedido_id]})
+        elif pedido_id not in estados_actuales:
+            resultados[i].update({"codigo": 404, "error": "Pedido no encontrado"})
+        else:
+            resultados[i].update({
+                "codigo": 409,
+                "estado_actual": estados_actuales[pedido_id],
+                "error": f"El pedido está en '{estados_actuales[pedido_id]}' y no puede pasar a '{datos.cambios[i].estado}'."
+            })
+    return {"actualizados": len(actualizados), "resultados": resultados}
+# --- FIN ACTUALIZACIÓN DE ESTADO ---
+
+# --- ESTADO DE MESAS ---
+# Una sola lectura de mesa_estado (mantenida por triggers en SqlPRO.sql), sin importar cuántas mesas haya.
+SQL_ESTADO_MESAS = """
+    SELECT m.numero, m.capacidad, me.pedidos_activos, me.reserva_inicio, me.reserva_fin,
+           c.nombre AS cliente_reservado_nombre,
+           me.reserva_inicio < CURRENT_DATE AS reserva_vencida
+    FROM mesa_estado me
+    JOIN mesas m ON m.numero = me.mesa_numero
+    LEFT JOIN clientes c ON c.id = me.reserva_cliente_id
+    ORDER BY m.numero
+"""
+
+def leer_estado_mesas(conn, cursor) -> List[dict]:
+    cursor.execute(SQL_ESTADO_MESAS)
+    filas = cursor.fetchall()
+    if any(fila['reserva_vencida'] for fila in filas):
+        # Cambió el día: la "próxima reserva" guardada ya pasó, se recalcula (una vez por día)
+        cursor.execute("SELECT refrescar_reservas_mesa_estado();")
+        conn.commit()
+        cursor.execute(SQL_ESTADO_MESAS)
+        filas = cursor.fetchall()
+
+    mesas_result = []
+    for fila in filas:
+        if fila['numero'] == MESA_VIRTUAL:
             mesas_result.append({
-                "numero": 99,
-                "capacidad": 1,
-                "ocupada": False,
+                "numero": MESA_VIRTUAL,
+                "capacidad": fila['capacidad'],
+                "ocupada": False, # La mesa virtual no se "ocupa" como las físicas
+                "reservada": False, # Ni se "reserva"
+                "cliente_reservado_nombre": None,
+                "fecha_hora_reserva": None,
                 "es_virtual": True
             })
-            
+            continue
+        reservada = fila['reserva_inicio'] is not None
+        mesas_result.append({
+            "numero": fila['numero'],
+            "capacidad": fila['capacidad'],
+            "ocupada": fila['pedidos_activos'] > 0,
+            "reservada": reservada,
+            "cliente_reservado_nombre": fila['cliente_reservado_nombre'] if reservada else None,
+            "fecha_hora_reserva": str(fila['reserva_inicio']) if reservada else None
+        })
+    return mesas_result
+
+@app.get("/mesas")
+def obtener_mesas(request: Request, response: Response, conn: psycopg2.extensions.connection = Depends(get_db)):
+    """
+    Obtiene el estado de todas las mesas: ocupación (pedidos activos) y próxima reserva.
+    """
+    try:
+        with conn.cursor() as cursor:
+            # La fecha entra en el ETag: al cambiar de día la próxima reserva puede ser otra
+            etag = etag_tablas(cursor, "mesas", "mesa_estado", "clientes", sufijo=date.today().isoformat())
+            no_modificada = respuesta_no_modificada(request, etag)
+            if no_modificada:
+                return no_modificada
+
+            mesas_result = leer_estado_mesas(conn, cursor)
+            agregar_etag(response, etag)
             return mesas_result
-            
+
     except Exception as e:
         print(f"Error en obtener_mesas: {e}")
         # En caso de error, devolver mesas por defecto como LIBRES
         return [
-            {"numero": 1, "capacidad": 2, "ocupada": False},
-            {"numero": 2, "capacidad": 2, "ocupada": False},
-            {"numero": 3, "capacidad": 4, "ocupada": False},
-            {"numero": 4, "capacidad": 4, "ocupada": False},
-            {"numero": 5, "capacidad": 6, "ocupada": False},
-            {"numero": 6, "capacidad": 6, "ocupada": False},
-            {"numero": 99, "capacidad": 1, "ocupada": False, "es_virtual": True}
+            {"numero": 1, "capacidad": 2, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 2, "capacidad": 2, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 3, "capacidad": 4, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 4, "capacidad": 4, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 5, "capacidad": 6, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 6, "capacidad": 6, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
+            {"numero": 99, "capacidad": 100, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None, "es_virtual": True}
         ]
+# --- FIN ESTADO DE MESAS ---
 
 # Endpoint para inicializar menú
 @app.post("/menu/inicializar")
@@ -451,17 +876,20 @@ def inicializar_menu(conn: psycopg2.extensions.connection = Depends(get_db)):
 @app.delete("/pedidos/{pedido_id}/ultimo_item")
 def eliminar_ultimo_item(pedido_id: int, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
-        cursor.execute("SELECT items FROM pedidos WHERE id = %s", (pedido_id,))
+        cursor.execute("SELECT items FROM pedidos WHERE id = %s FOR UPDATE", (pedido_id,))
         row = cursor.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
-        items = json.loads(row['items'])
+        # JSONB llega ya como lista; los pedidos antiguos pueden tenerlo como texto JSON
+        items = json.loads(row['items']) if isinstance(row['items'], str) else row['items']
         if not items:
             raise HTTPException(status_code=400, detail="No hay ítems para eliminar")
         
         items.pop()
         cursor.execute("UPDATE pedidos SET items = %s WHERE id = %s", (json.dumps(items), pedido_id))
+        # La línea eliminada es siempre la última (linea = posición en items)
+        cursor.execute("DELETE FROM pedido_items WHERE pedido_id = %s AND linea > %s", (pedido_id, len(items)))
         conn.commit()
         return {"status": "ok"}
 
@@ -487,7 +915,7 @@ def actualizar_pedido(pedido_id: int, pedido_actualizado: PedidoCreate, conn: ps
             pedido_actualizado.notas,
             pedido_id
         ))
-        
+        guardar_items_pedido(cursor, pedido_id, pedido_actualizado.items, fecha_hora)
         
         conn.commit()
         return {"status": "ok", "message": "Pedido actualizado"}
@@ -525,8 +953,12 @@ def eliminar_item_menu(nombre: str, tipo: str, conn: psycopg2.extensions.connect
 # NUEVOS ENDPOINTS PARA GESTIÓN DE CLIENTES
 
 @app.get("/clientes", response_model=List[ClienteResponse])
-def obtener_clientes(conn: psycopg2.extensions.connection = Depends(get_db)):
+def obtener_clientes(request: Request, response: Response, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
+        etag = etag_tablas(cursor, "clientes")
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
         cursor.execute("SELECT id, nombre, domicilio, celular, fecha_registro FROM clientes ORDER BY nombre")
         clientes = []
         for row in cursor.fetchall():
@@ -538,6 +970,7 @@ def obtener_clientes(conn: psycopg2.extensions.connection = Depends(get_db)):
                 "celular": row['celular'],
                 "fecha_registro": fecha_str
             })
+        agregar_etag(response, etag)
         return clientes
 
 @app.post("/clientes", response_model=ClienteResponse)
@@ -577,56 +1010,8 @@ def obtener_reporte(
     conn: psycopg2.extensions.connection = Depends(get_db)
 ):
     with conn.cursor() as cursor:
-        # Consultar pedidos en el rango de fechas
-        cursor.execute("""
-            SELECT items, estado, fecha_hora
-            FROM pedidos
-            WHERE fecha_hora >= %s AND fecha_hora < %s
-            AND estado IN ('Listo', 'Entregado', 'Pagado')
-        """, (start_date, end_date))
-        
-        pedidos = cursor.fetchall()
-        
-        # Calcular estadísticas
-        ventas_totales = 0
-        pedidos_totales = len(pedidos)
-        productos_vendidos = 0
-        productos_mas_vendidos = {}
-
-        for pedido in pedidos:
-            # ✅ CORREGIR: El campo 'items' ya es una lista, no necesita json.loads()
-            items = pedido['items']
-            
-            # ✅ VERIFICAR SI ES STRING Y PARSEAR SI ES NECESARIO
-            if isinstance(items, str):
-                items = json.loads(items)
-            
-            for item in items:
-                nombre = item['nombre']
-                precio = item['precio']
-                
-                ventas_totales += precio
-                productos_vendidos += 1
-                
-                # Contar productos más vendidos
-                if nombre in productos_mas_vendidos:
-                    productos_mas_vendidos[nombre] += 1
-                else:
-                    productos_mas_vendidos[nombre] = 1
-
-        # Ordenar productos más vendidos
-        productos_mas_vendidos_lista = sorted(
-            [{'nombre': k, 'cantidad': v} for k, v in productos_mas_vendidos.items()],
-            key=lambda x: x['cantidad'],
-            reverse=True
-        )[:10]  # Top 10
-
-        return {
-            "ventas_totales": round(ventas_totales, 2),
-            "pedidos_totales": pedidos_totales,
-            "productos_vendidos": productos_vendidos,
-            "productos_mas_vendidos": productos_mas_vendidos_lista
-        }
+        # Totales, unidades y top 10 calculados en PostgreSQL (ver agregaciones.py)
+        return resumen_ventas(cursor, ESTADOS_VENTA_REPORTE, start_date, end_date, top=10)
         
 
 @app.get("/analisis/productos")
@@ -638,47 +1023,12 @@ def obtener_analisis_productos(
     """
     Obtiene el análisis de productos vendidos en un rango de fechas.
     """
-    # Construir la condición de fecha si se proporcionan parámetros
-    fecha_condicion = ""
-    params = []
-    if start_date and end_date:
-        fecha_condicion = "AND fecha_hora >= %s AND fecha_hora < %s"
-        params = [start_date, end_date]
-    elif start_date:
-        fecha_condicion = "AND fecha_hora >= %s"
-        params = [start_date]
-    elif end_date:
-        # Si solo se da end_date, asumimos desde el principio de los tiempos hasta end_date
-        fecha_condicion = "AND fecha_hora < %s"
-        params = [end_date]
-
     with conn.cursor() as cursor:
-        # Consultar ítems de pedidos en el rango de fechas y con estado de venta completada
-        cursor.execute(f"""
-            SELECT items
-            FROM pedidos
-            WHERE estado IN ('Entregado', 'Pagado') -- Ajustar según tu definición de venta completada
-            {fecha_condicion}
-        """, params)
-        
-        pedidos = cursor.fetchall()
-
-    # Contar productos vendidos
-    conteo_productos = {}
-    for pedido in pedidos:
-        # Asumiendo que 'items' es una lista de diccionarios
-        items = pedido['items']
-        if isinstance(items, str):
-            items = json.loads(items) # Parsear si es string (aunque debería ser lista por el modelo de Pydantic o por cómo se inserta)
-
-        if isinstance(items, list):
-            for item in items:
-                nombre = item.get('nombre')
-                if nombre:
-                    conteo_productos[nombre] = conteo_productos.get(nombre, 0) + 1
-
-    # Ordenar productos
-    productos_ordenados = sorted(conteo_productos.items(), key=lambda x: x[1], reverse=True)
+        # Conteo por producto en PostgreSQL: una fila por producto, no por pedido
+        productos = ventas_por_producto(cursor, ESTADOS_VENTA_COMPLETADA, start_date, end_date)
+
+    # Ya vienen ordenados de más a menos vendido
+    productos_ordenados = [(p["nombre"], p["cantidad"]) for p in productos if p["nombre"]]
     productos_mas_vendidos = [{"nombre": k, "cantidad": v} for k, v in productos_ordenados[:10]] # Top 10
     productos_menos_vendidos = [{"nombre": k, "cantidad": v} for k, v in productos_ordenados[-10:]] # Últimos 10 (menos vendidos)
 
@@ -688,155 +1038,70 @@ def obtener_analisis_productos(
         "productos_menos_vendidos": productos_menos_vendidos
     }
 
-
-@app.get("/mesas")
-def obtener_mesas_detalladas(conn = Depends(get_db)):
+@app.get("/analisis/productos/{nombre:path}") # :path porque el servidor decodifica %2F antes de enrutar
+def obtener_ventas_plato(
+    nombre: str,
+    start_date: str = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    end_date: str = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
     """
-    Obtiene el estado detallado de todas las mesas, incluyendo ocupación y reservas.
+    Obtiene las unidades vendidas y el importe de un plato por día.
     """
-    try:
-        # Obtener mesas físicas desde la base de datos
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT numero, capacidad FROM mesas WHERE numero != 99 ORDER BY numero;") # Excluir mesa virtual
-            mesas_db = cursor.fetchall()
-
-        # Obtener reservas activas (pueden ser para hoy o futuras, dependiendo de tu lógica)
-        # Asumiendo una tabla 'reservas' con columnas: id, mesa_numero, cliente_id, fecha_hora_inicio, fecha_hora_fin
-        # y una tabla 'clientes' con id, nombre
-        with conn.cursor() as cursor:
-            # Obtener reservas para hoy o futuras (puedes ajustar la lógica de fecha)
-            from datetime import datetime, date # Importar aquí o asegurarte que esté arriba
-            hoy = date.today().strftime("%Y-%m-%d")
-            cursor.execute("""
-                SELECT r.mesa_numero, r.fecha_hora_inicio, r.fecha_hora_fin, c.nombre as cliente_nombre
-                FROM reservas r
-                JOIN clientes c ON r.cliente_id = c.id
-                WHERE DATE(r.fecha_hora_inicio) >= %s
-                ORDER BY r.fecha_hora_inicio;
-            """, (hoy,))
-            reservas_db = cursor.fetchall()
-
-        # Obtener pedidos activos para saber qué mesas están ocupadas
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT mesa_numero
-                FROM pedidos
-                WHERE estado IN ('Tomando pedido', 'Pendiente', 'En preparacion', 'Listo', 'Entregado')
-                AND mesa_numero != 99; -- Excluir pedido digital
-            """)
-            pedidos_activos = set(row['mesa_numero'] for row in cursor.fetchall())
-
-        # Combinar la información
-        mesas_result = []
-        reservas_por_mesa = {}
-        for res in reservas_db:
-            # Agrupar reservas por mesa (por si hay varias en un día)
-            if res['mesa_numero'] not in reservas_por_mesa:
-                reservas_por_mesa[res['mesa_numero']] = []
-            reservas_por_mesa[res['mesa_numero']].append({
-                "cliente_nombre": res['cliente_nombre'],
-                "fecha_hora_inicio": str(res['fecha_hora_inicio']), # Convertir a string para JSON
-                "fecha_hora_fin": str(res['fecha_hora_fin']) if res['fecha_hora_fin'] else None
-            })
-
-        for mesa_db in mesas_db:
-            numero = mesa_db['numero']
-            capacidad = mesa_db['capacidad']
-            ocupada = numero in pedidos_activos
-            reservada = numero in reservas_por_mesa
-
-            mesa_info = {
-                "numero": numero,
-                "capacidad": capacidad,
-                "ocupada": ocupada,
-                "reservada": reservada,
-                "cliente_reservado_nombre": None,
-                "fecha_hora_reserva": None
-            }
-
-            if reservada:
-                # Tomar la primera reserva encontrada para mostrar en la UI (puedes mejorar esta lógica)
-                primera_reserva = reservas_por_mesa[numero][0]
-                mesa_info["cliente_reservado_nombre"] = primera_reserva["cliente_nombre"]
-                mesa_info["fecha_hora_reserva"] = primera_reserva["fecha_hora_inicio"]
-
-            mesas_result.append(mesa_info)
-
-        # Agregar mesa virtual (99)
-        mesas_result.append({
-            "numero": 99,
-            "capacidad": 100, # o el valor que uses
-            "ocupada": False, # La mesa virtual no se "ocupa" como las físicas
-            "reservada": False, # Ni se "reserva"
-            "cliente_reservado_nombre": None,
-            "fecha_hora_reserva": None,
-            "es_virtual": True # Opcional: para distinguirla en la UI
-        })
-
-        return mesas_result
-
-    except Exception as e:
-        print(f"Error en obtener_mesas_detalladas: {e}")
-        # En caso de error, devolver mesas por defecto como lo hacía antes
-        # Asegúrate de que esta estructura coincida con la que espera crear_mesas_grid
-        return [
-            {"numero": 1, "capacidad": 2, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 2, "capacidad": 2, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 3, "capacidad": 4, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 4, "capacidad": 4, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 5, "capacidad": 6, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 6, "capacidad": 6, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None},
-            {"numero": 99, "capacidad": 100, "ocupada": False, "reservada": False, "cliente_reservado_nombre": None, "fecha_hora_reserva": None, "es_virtual": True}
-        ]
+    with conn.cursor() as cursor:
+        return {"nombre": nombre, "ventas": ventas_de_plato(cursor, nombre, ESTADOS_VENTA_COMPLETADA, start_date, end_date)}
+
+
+# --- DISPONIBILIDAD DE MESAS ---
+DURACION_RESERVA_POR_DEFECTO = timedelta(hours=1) # Igual que la columna `periodo` de reservas en SqlPRO.sql
+
+# Mesas con capacidad suficiente y sin reservas que se crucen con [inicio, fin). El cruce se
+# resuelve con el índice GiST de la restricción reservas_sin_solapamiento, así que no depende de
+# cuántas reservas futuras haya. Si la ventana incluye el momento actual, tampoco se ofrecen las
+# mesas ocupadas por pedidos activos (mesa_estado).
+SQL_MESAS_DISPONIBLES = """
+    SELECT m.numero, m.capacidad
+    FROM mesas m
+    JOIN mesa_estado me ON me.mesa_numero = m.numero
+    WHERE m.numero <> %(mesa_virtual)s
+    AND m.capacidad >= %(personas)s
+    AND NOT EXISTS (
+        SELECT 1 FROM reservas r
+        WHERE r.mesa_numero = m.numero
+        AND r.periodo && tsrange(%(inicio)s, %(fin)s, '[)')
+    )
+    AND NOT (tsrange(%(inicio)s, %(fin)s, '[)') @> LOCALTIMESTAMP AND me.pedidos_activos > 0)
+    ORDER BY m.capacidad, m.numero -- Primero la mesa más chica que alcanza
+"""
 
-# Opcional: Endpoint para obtener mesas disponibles en una fecha/hora específica
 @app.get("/mesas/disponibles/")
 def obtener_mesas_disponibles_para_fecha_hora(
-    fecha_hora_str: str = Query(..., description="Fecha y hora en formato YYYY-MM-DD HH:MM:SS"),
+    fecha_hora: str = Query(..., description="Inicio en formato YYYY-MM-DD HH:MM:SS"),
+    fecha_hora_fin: Optional[str] = Query(None, description="Fin en formato YYYY-MM-DD HH:MM:SS (por defecto, 1 hora después del inicio)"),
+    personas: int = Query(1, ge=1, description="Tamaño del grupo"),
     conn = Depends(get_db)
 ):
     """
-    Obtiene la lista de mesas disponibles para una fecha y hora específica.
-    Una mesa está disponible si no está ocupada por un pedido activo ni reservada para esa hora.
+    Obtiene la lista de mesas disponibles para un grupo en una ventana de tiempo.
+    Una mesa está disponible si le caben las personas, no tiene reservas que se crucen con la
+    ventana y, si la ventana incluye el momento actual, no está ocupada por un pedido activo.
     """
-    from datetime import datetime
     try:
-        fecha_hora_obj = datetime.strptime(fecha_hora_str, "%Y-%m-%d %H:%M:%S")
+        inicio = datetime.strptime(fecha_hora, "%Y-%m-%d %H:%M:%S")
+        fin = datetime.strptime(fecha_hora_fin, "%Y-%m-%d %H:%M:%S") if fecha_hora_fin else inicio + DURACION_RESERVA_POR_DEFECTO
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha/hora inválido. Use YYYY-MM-DD HH:MM:SS")
+    if fin <= inicio:
+        raise HTTPException(status_code=400, detail="La hora de fin debe ser posterior a la de inicio.")
 
     try:
-        # Obtener mesas físicas
         with conn.cursor() as cursor:
-            cursor.execute("SELECT numero, capacidad FROM mesas WHERE numero != 99;")
-            mesas_db = cursor.fetchall()
-
-        # Obtener mesas ocupadas en ese momento (basado en pedidos activos)
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT DISTINCT mesa_numero
-                FROM pedidos
-                WHERE estado IN ('Tomando pedido', 'Pendiente', 'En preparacion', 'Listo', 'Entregado')
-                AND mesa_numero != 99;
-            """)
-            ocupadas_db = set(row['mesa_numero'] for row in cursor.fetchall())
-
-        # Obtener mesas reservadas en ese momento
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT DISTINCT mesa_numero
-                FROM reservas
-                WHERE %s BETWEEN fecha_hora_inicio AND COALESCE(fecha_hora_fin, fecha_hora_inicio + INTERVAL '1 hour');
-                -- Asumimos una duración de 1 hora si no se especifica fin
-            """, (fecha_hora_obj,))
-            reservadas_db = set(row['mesa_numero'] for row in cursor.fetchall())
-        
-        # Combinar resultados (similar lógica que en obtener_mesas_detalladas pero simplificada para disponibilidad)
-        # ... (Implementar lógica completa si se necesita este endpoint)
-        pass 
+            cursor.execute(SQL_MESAS_DISPONIBLES, {"mesa_virtual": MESA_VIRTUAL, "personas": personas, "inicio": inicio, "fin": fin})
+            return [{"numero": row['numero'], "capacidad": row['capacidad']} for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error en obtener_mesas_disponibles: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Error en obtener_mesas_disponibles_para_fecha_hora: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor al consultar disponibilidad.")
+# --- FIN DISPONIBILIDAD DE MESAS ---
 
 # --- ENDPOINT DE RESPALDO (BACKUP) ---
 
@@ -918,27 +1183,6 @@ def crear_respaldo():
         raise HTTPException(status_code=500, detail=f"Error creando respaldo: {str(e)}")
 
 
-        mesas_disponibles = []
-        for mesa in mesas_db:
-            if mesa['numero'] not in ocupadas_db and mesa['numero'] not in reservadas_db:
-                mesas_disponibles.append({
-                    "numero": mesa['numero'],
-                    "capacidad": mesa['capacidad']
-                })
-
-        return mesas_disponibles
-
-    except Exception as e:
-        print(f"Error en obtener_mesas_disponibles_para_fecha_hora: {e}")
-        raise HTTPException(status_code=500, detail="Error interno del servidor al consultar disponibilidad.")
-    
-
-class ReservaCreate(BaseModel):
-    mesa_numero: int
-    cliente_id: int
-    fecha_hora_inicio: str  # "YYYY-MM-DD HH:MM:SS"
-    fecha_hora_fin: Optional[str] = None # "YYYY-MM-DD HH:MM:SS"
-
 class ReservaUpdate(BaseModel):
     mesa_numero: Optional[int] = None
     cliente_id: Optional[int] = None
@@ -955,14 +1199,15 @@ def obtener_reservas(
     """
     try:
         query = """
-            SELECT r.id, r.mesa_numero, r.cliente_id, c.nombre as cliente_nombre, r.fecha_hora_inicio, r.fecha_hora_fin
+            SELECT r.id, r.mesa_numero, r.cliente_id, c.nombre as cliente_nombre, r.fecha_hora_inicio, r.fecha_hora_fin, r.personas
             FROM reservas r
             JOIN clientes c ON r.cliente_id = c.id
         """
         params = []
         if fecha:
-            query += " WHERE DATE(r.fecha_hora_inicio) = %s"
-            params.append(fecha)
+            # Rango en lugar de DATE(...) para que use el índice por fecha_hora_inicio
+            query += " WHERE r.fecha_hora_inicio >= %s::date AND r.fecha_hora_inicio < %s::date + 1"
+            params.extend([fecha, fecha])
 
         query += " ORDER BY r.fecha_hora_inicio;"
 
@@ -978,7 +1223,8 @@ def obtener_reservas(
                 "cliente_id": res['cliente_id'],
                 "cliente_nombre": res['cliente_nombre'],
                 "fecha_hora_inicio": str(res['fecha_hora_inicio']),
-                "fecha_hora_fin": str(res['fecha_hora_fin']) if res['fecha_hora_fin'] else None
+                "fecha_hora_fin": str(res['fecha_hora_fin']) if res['fecha_hora_fin'] else None,
+                "personas": res['personas']
             })
 
         return reservas
@@ -988,38 +1234,113 @@ def obtener_reservas(
         raise HTTPException(status_code=500, detail="Error interno del servidor al obtener reservas.")
 
 
+# --- OCUPACIÓN DE RESERVAS POR FRANJAS ---
+MINUTOS_POR_FRANJA = 15 # Deben coincidir con franjas_reserva() en SqlPRO.sql
+FRANJAS_POR_DIA = 96
+MAX_DIAS_OCUPACION = 31
+
+# Matriz de disponibilidad de varios días leída de reservas_ocupacion (una fila por día y mesa con
+# reservas), sin recorrer las reservas. Cada mesa viaja como 24 caracteres hexadecimales: el bit
+# más significativo es la franja 00:00-00:15 y un 1 indica que está reservada.
+@app.get("/reservas/ocupacion")
+def obtener_ocupacion_reservas(
+    request: Request,
+    response: Response,
+    fecha: str = Query(..., description="Primer día en formato YYYY-MM-DD"),
+    dias: int = Query(1, ge=1, le=MAX_DIAS_OCUPACION, description="Cantidad de días"),
+    conn = Depends(get_db)
+):
+    try:
+        desde = datetime.strptime(fecha, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD.")
+    hasta = desde + timedelta(days=dias - 1)
+
+    with conn.cursor() as cursor:
+        etag = etag_tablas(cursor, "reservas", "mesas")
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
+
+        cursor.execute("SELECT numero FROM mesas WHERE numero <> %s ORDER BY numero", (MESA_VIRTUAL,))
+        mesas = [row['numero'] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT fecha, mesa_numero, franjas::text AS franjas
+            FROM reservas_ocupacion
+            WHERE fecha BETWEEN %s AND %s
+        """, (desde, hasta))
+        ocupacion = {(row['fecha'], row['mesa_numero']): row['franjas'] for row in cursor.fetchall()}
+
+    libre = "0" * (FRANJAS_POR_DIA // 4)
+    resultado = {
+        "minutos_por_franja": MINUTOS_POR_FRANJA,
+        "franjas_por_dia": FRANJAS_POR_DIA,
+        "mesas": mesas,
+        "dias": []
+    }
+    for i in range(dias):
+        dia = desde + timedelta(days=i)
+        franjas_dia = {}
+        for numero in mesas:
+            bits = ocupacion.get((dia, numero))
+            franjas_dia[str(numero)] = f"{int(bits, 2):0{FRANJAS_POR_DIA // 4}x}" if bits else libre
+        resultado["dias"].append({"fecha": dia.isoformat(), "franjas": franjas_dia})
+
+    agregar_etag(response, etag)
+    return resultado
+# --- FIN OCUPACIÓN DE RESERVAS ---
+
+
 @app.post("/reservas/", status_code=201)
 def crear_reserva_simplificada(reserva: ReservaCreate, conn = Depends(get_db)):
     """
-    Crea una nueva reserva. Versión simplificada sin verificación de conflictos.
+    Crea una nueva reserva. Si la mesa ya tiene una reserva que se cruza con el horario
+    responde 409 (lo garantiza la restricción reservas_sin_solapamiento de la BD).
+    Sin mesa_numero, la mesa se elige automáticamente para `personas` (asignacion_mesas.py).
     """
     try:
         # Asumimos que cliente_id y mesa_numero son válidos (verificados por Pydantic)
         # Asumimos que fecha_hora_inicio y fecha_hora_fin tienen el formato correcto (verificado por Pydantic o antes)
-        # No verificamos conflictos de horarios por ahora
 
         # Calcular fecha_hora_fin si es None
         fecha_inicio_obj = datetime.fromisoformat(reserva.fecha_hora_inicio.replace(" ", "T"))
         if reserva.fecha_hora_fin:
             fecha_fin_obj = datetime.fromisoformat(reserva.fecha_hora_fin.replace(" ", "T"))
         else:
-            fecha_fin_obj = fecha_inicio_obj + timedelta(hours=1) # Asumir 1 hora si no se da fin
-
-        with conn.cursor() as cursor:
-            # Insertar la reserva directamente
-            # Usamos placeholders %s para evitar inyección SQL
-            cursor.execute("""
-                INSERT INTO reservas (mesa_numero, cliente_id, fecha_hora_inicio, fecha_hora_fin)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id;
-            """, (reserva.mesa_numero, reserva.cliente_id, fecha_inicio_obj, fecha_fin_obj))
-            reserva_id = cursor.fetchone()['id']
+            fecha_fin_obj = fecha_inicio_obj + DURACION_RESERVA_POR_DEFECTO # Asumir 1 hora si no se da fin
+        if fecha_fin_obj <= fecha_inicio_obj:
+            raise HTTPException(status_code=400, detail="La hora de fin debe ser posterior a la de inicio.")
+        if reserva.mesa_numero is None and not reserva.personas:
+            raise HTTPException(status_code=400, detail="Indique la mesa o la cantidad de personas para asignarla.")
+
+        for intento in range(3):
+            with conn.cursor() as cursor:
+                mesa_numero = reserva.mesa_numero
+                if mesa_numero is None:
+                    mesa = asignar_mesa(cursor, reserva.personas, fecha_inicio_obj, fecha_fin_obj)
+                    if mesa is None:
+                        raise HTTPException(status_code=409, detail=f"No hay mesa libre para {reserva.personas} personas en ese horario.")
+                    mesa_numero = mesa['numero']
+                try:
+                    # Usamos placeholders %s para evitar inyección SQL
+                    cursor.execute("""
+                        INSERT INTO reservas (mesa_numero, cliente_id, fecha_hora_inicio, fecha_hora_fin, personas)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id;
+                    """, (mesa_numero, reserva.cliente_id, fecha_inicio_obj, fecha_fin_obj, reserva.personas))
+                    reserva_id = cursor.fetchone()['id']
+                    break
+                except psycopg2.errors.ExclusionViolation:
+                    # Con mesa automática, otra terminal pudo tomar la misma mesa: se vuelve a elegir
+                    if reserva.mesa_numero is not None or intento == 2:
+                        raise
+                    conn.rollback()
         conn.commit() # Confirmar la transacción
 
         # Opcional: Obtener y devolver la reserva creada
         with conn.cursor() as cursor:
             cursor.execute("""
-                SELECT r.id, r.mesa_numero, r.cliente_id, c.nombre as cliente_nombre, r.fecha_hora_inicio, r.fecha_hora_fin
+                SELECT r.id, r.mesa_numero, r.cliente_id, c.nombre as cliente_nombre, r.fecha_hora_inicio, r.fecha_hora_fin, r.personas
                 FROM reservas r
                 JOIN clientes c ON r.cliente_id = c.id
                 WHERE r.id = %s;
@@ -1036,7 +1357,8 @@ def crear_reserva_simplificada(reserva: ReservaCreate, conn = Depends(get_db)):
             "cliente_id": nueva_reserva_db['cliente_id'],
             "cliente_nombre": nueva_reserva_db['cliente_nombre'],
             "fecha_hora_inicio": str(nueva_reserva_db['fecha_hora_inicio']),
-            "fecha_hora_fin": str(nueva_reserva_db['fecha_hora_fin']) if nueva_reserva_db['fecha_hora_fin'] else None
+            "fecha_hora_fin": str(nueva_reserva_db['fecha_hora_fin']) if nueva_reserva_db['fecha_hora_fin'] else None,
+            "personas": nueva_reserva_db['personas']
         }
 
     except ValueError as ve:
@@ -1046,6 +1368,10 @@ def crear_reserva_simplificada(reserva: ReservaCreate, conn = Depends(get_db)):
     except HTTPException:
         # Re-raise HTTP exceptions (como 400, 404)
         raise
+    except psycopg2.errors.ExclusionViolation:
+        conn.rollback()
+        mesa_texto = f"La mesa {reserva.mesa_numero}" if reserva.mesa_numero is not None else "La mesa asignada"
+        raise HTTPException(status_code=409, detail=f"{mesa_texto} ya tiene una reserva que se cruza con ese horario.")
     except Exception as e:
         # Captura cualquier otro error inesperado
         print(f"Error interno en crear_reserva_simplificada: {e}")
@@ -1055,6 +1381,58 @@ def crear_reserva_simplificada(reserva: ReservaCreate, conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error interno del servidor al crear la reserva.")
 
 
+# --- ASIGNACIÓN AUTOMÁTICA DE MESAS ---
+@app.post("/mesas/asignar")
+def asignar_mesa_automatica(asignacion: AsignacionMesa, conn = Depends(get_db)):
+    """
+    Propone la mejor mesa libre para un grupo (reserva o cliente sin reserva): la más chica en la
+    que caben y, entre iguales, la que deja el hueco más ajustado. No guarda nada.
+    """
+    if asignacion.personas < 1:
+        raise HTTPException(status_code=400, detail="La cantidad de personas debe ser al menos 1.")
+    try:
+        inicio = datetime.strptime(asignacion.fecha_hora_inicio, "%Y-%m-%d %H:%M:%S") if asignacion.fecha_hora_inicio else datetime.now().replace(microsecond=0)
+        fin = datetime.strptime(asignacion.fecha_hora_fin, "%Y-%m-%d %H:%M:%S") if asignacion.fecha_hora_fin else inicio + DURACION_RESERVA_POR_DEFECTO
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha/hora inválido. Use YYYY-MM-DD HH:MM:SS")
+    if fin <= inicio:
+        raise HTTPException(status_code=400, detail="La hora de fin debe ser posterior a la de inicio.")
+
+    with conn.cursor() as cursor:
+        mesa = asignar_mesa(cursor, asignacion.personas, inicio, fin)
+    if mesa is None:
+        raise HTTPException(status_code=409, detail=f"No hay mesa libre para {asignacion.personas} personas en ese horario.")
+    return {"numero": mesa['numero'], "capacidad": mesa['capacidad'], "fecha_hora_inicio": str(inicio), "fecha_hora_fin": str(fin)}
+
+@app.post("/reservas/reasignar")
+def reasignar_reservas_dia(
+    fecha: str = Query(..., description="Día en formato YYYY-MM-DD"),
+    aplicar: bool = Query(False, description="Guardar el plan (si no, solo se devuelve)"),
+    conn = Depends(get_db)
+):
+    """
+    Reacomoda las reservas del día que aún no empezaron para desperdiciar la menor cantidad de
+    asientos (parejas fuera de las mesas de 6), sin dejar ninguna reserva sin mesa.
+    """
+    try:
+        dia = datetime.strptime(fecha, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD.")
+    try:
+        with conn.cursor() as cursor:
+            if aplicar:
+                # Nadie más puede mover o crear reservas mientras se calcula y guarda el plan
+                cursor.execute("LOCK TABLE reservas IN SHARE ROW EXCLUSIVE MODE")
+            resultado = reasignar_dia(cursor, dia, aplicar=aplicar)
+        conn.commit()
+        return resultado
+    except Exception as e:
+        conn.rollback()
+        print(f"Error en reasignar_reservas_dia: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al reasignar reservas: {str(e)}")
+# --- FIN ASIGNACIÓN AUTOMÁTICA DE MESAS ---
+
+
 @app.delete("/reservas/{reserva_id}")
 def eliminar_reserva(reserva_id: int, conn = Depends(get_db)):
     """
@@ -1100,35 +1478,13 @@ def obtener_ventas_por_hora(
 
     try:
         with conn.cursor() as cursor:
-            # Consultar pedidos completados (Pagado o Entregado) para la fecha dada
-            # Extraer la hora de la fecha_hora y sumar el total de cada pedido
-            # Seleccionar el nombre y el precio de cada ítem en el array JSONB 'items'
-            cursor.execute("""
-                SELECT EXTRACT(HOUR FROM fecha_hora) AS hora, SUM(item_data.precio) AS total_venta
-                FROM pedidos,
-                     jsonb_to_recordset(pedidos.items) AS item_data(nombre TEXT, precio REAL, tipo TEXT, cantidad INTEGER)
-                WHERE DATE(fecha_hora) = %s
-                AND estado IN ('Entregado', 'Pagado') -- Ajustar según tu definición de venta completada
-                GROUP BY EXTRACT(HOUR FROM fecha_hora)
-                ORDER BY hora;
-            """, (fecha,))
-            
-            resultados_db = cursor.fetchall()
-
-        # Inicializar un diccionario con todas las horas del día a 0.0
-        ventas_por_hora = {f"{h:02d}": 0.0 for h in range(24)} # Usar f-string para asegurar formato '00', '01', ..., '23'
-
-        # Llenar el diccionario con los resultados de la base de datos
-        for row in resultados_db:
-            # Asegurar que hora es un entero y total_venta es un número
-            hora_int = int(row['hora'])
-            total_venta_db = row['total_venta']
-            # Si total_venta_db es None (por ejemplo, si no hay items), usar 0.0
-            total_venta = float(total_venta_db) if total_venta_db is not None else 0.0
-            hora_str = f"{hora_int:02d}" # Convertir a string con formato '00', '01', ..., '23'
-            ventas_por_hora[hora_str] = total_venta
-
-        return ventas_por_hora
+            # Pedidos completados (Pagado o Entregado) del día, desde el resumen ventas_diarias
+            ventas_db = ventas_por_hora(cursor, fecha)
+
+        # Diccionario con todas las horas del día ('00', '01', ..., '23'), en 0.0 si no hubo ventas
+        ventas_por_hora_dia = {f"{h:02d}": ventas_db.get(h, 0.0) for h in range(24)}
+
+        return ventas_por_hora_dia
     except Exception as e:
         # Capturar cualquier error interno del servidor y loguearlo
         print(f"Error interno en obtener_ventas_por_hora: {e}")
@@ -1137,51 +1493,40 @@ def obtener_ventas_por_hora(
         raise HTTPException(status_code=500, detail=f"Error interno del servidor al calcular ventas por hora: {str(e)}")
 # --- FIN NUEVO ENDPOINT CORREGIDO ---
 
+# --- ENDPOINT: Reconstruir resumen de ventas ---
+# Recalcula ventas_diarias y pedidos_diarios desde pedidos (carga inicial o corrección).
+# También disponible por consola: python agregaciones.py reconstruir
+@app.post("/reportes/reconstruir")
+def reconstruir_resumen_ventas(conn = Depends(get_db)):
+    try:
+        with conn.cursor() as cursor:
+            resultado = reconstruir_resumen(cursor)
+        conn.commit()
+        return {"status": "ok", **resultado}
+    except Exception as e:
+        conn.rollback()
+        print(f"Error al reconstruir el resumen de ventas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al reconstruir el resumen de ventas: {str(e)}")
+# --- FIN ENDPOINT ---
+
 # --- NUEVO ENDPOINT: Eficiencia de Cocina ---
+MAX_DETALLE_COCINA = 200
+
 @app.get("/reportes/eficiencia_cocina")
 def get_eficiencia_cocina(tipo: str, start_date: str, end_date: str, conn = Depends(get_db)):
     """
-    Obtiene estadísticas de eficiencia de cocina para un rango de fechas.
+    Obtiene estadísticas de eficiencia de cocina para los pedidos hechos en un rango de fechas
+    (Listo, Entregado y Pagado con hora de inicio y fin de cocina).
+    El total y el promedio salen del resumen pedidos_diarios; `detalle_pedidos` trae solo los
+    MAX_DETALLE_COCINA pedidos más recientes de ese mismo conjunto (para el gráfico).
     """
     with conn.cursor() as cursor:
-        # Consulta para obtener pedidos que tengan hora_inicio_cocina y hora_fin_cocina
-        # y que estén dentro del rango de fechas.
-        # Filtrar por estado que indica que cocina terminó (Listo, Entregado, Pagado)
-        # Suponiendo que hora_fin_cocina se registra al pasar a 'Listo'.
-        query = """
-            SELECT
-                id,
-                hora_inicio_cocina,
-                hora_fin_cocina,
-                (EXTRACT(EPOCH FROM (hora_fin_cocina - hora_inicio_cocina)) / 60.0) AS tiempo_cocina_minutos
-            FROM pedidos
-            WHERE
-                hora_inicio_cocina IS NOT NULL
-                AND hora_fin_cocina IS NOT NULL
-                AND hora_inicio_cocina >= %s
-                AND hora_fin_cocina <= %s
-                AND estado IN ('Listo', 'Entregado', 'Pagado') -- Ajustar según sea necesario
-            ORDER BY hora_fin_cocina; -- O por id, o por hora_inicio_cocina
-        """
-        cursor.execute(query, (start_date, end_date))
-        pedidos_db = cursor.fetchall()
-
-        if not pedidos_db:
-            return {"promedio_minutos": 0, "detalle_pedidos": []}
-
-        tiempos = [row['tiempo_cocina_minutos'] for row in pedidos_db]
-        promedio = sum(tiempos) / len(tiempos)
-
-        detalle = [
-            {
-                "id": row['id'],
-                "tiempo": row['tiempo_cocina_minutos']
-            }
-            for row in pedidos_db
-        ]
-
+        resumen = resumen_cocina(cursor, start_date, end_date)
+        detalle = detalle_cocina(cursor, start_date, end_date, MAX_DETALLE_COCINA) if resumen["pedidos"] else []
         return {
-            "promedio_minutos": promedio,
-            "detalle_pedidos": detalle
+            "pedidos": resumen["pedidos"],
+            "promedio_minutos": resumen["promedio_minutos"],
+            "detalle_pedidos": detalle,
+            "detalle_limitado": resumen["pedidos"] > len(detalle)
         }
 # --- FIN NUEVO ENDPOINT ---
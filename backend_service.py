@@ -1,22 +1,35 @@
 # === BACKEND_SERVICE.PY ===
 # Cliente HTTP para interactuar con la API del backend del sistema de restaurante.
 
-import requests
-from typing import List, Dict, Any
+import copy
+import json
+import threading
+from typing import List, Dict, Any, Callable
 from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from http_client import cliente_http, obtener_json_con_etag, HTTP_TIMEOUT_CONEXION
+
+# Mismos estados que filtra /pedidos/activos en el backend
+ESTADOS_PEDIDO_ACTIVOS = ("Pendiente", "En preparacion", "Listo")
 
 class BackendService:
     def __init__(self, base_url: str = "http://127.0.0.1:8000"):
         self.base_url = base_url.rstrip("/")
+        # --- COPIA LOCAL DE PEDIDOS ACTIVOS (sincronizada con /pedidos/cambios) ---
+        self._pedidos_espejo: Dict[int, Dict[str, Any]] = {}
+        self._cursor_pedidos = None
+        self._lock_pedidos = threading.Lock()
+        self._cache_etag: Dict[str, Any] = {} # url -> (etag, json) para menú, mesas y clientes
+        # --- PORCIONES DISPONIBLES POR PLATO (ver actualizar_disponibilidad_menu) ---
+        self._disponibilidad_menu: Dict[str, Any] = {}
 
     # === MÉTODO: obtener_menu ===
     # Obtiene todos los ítems del menú desde el backend.
 
     def obtener_menu(self) -> List[Dict[str, Any]]:
         """Obtiene todos los ítems del menú desde el backend."""
-        r = requests.get(f"{self.base_url}/menu/items")
-        r.raise_for_status()
-        return r.json()
+        return obtener_json_con_etag(f"{self.base_url}/menu/items", self._cache_etag)
 
     # === MÉTODO: crear_pedido ===
     # Crea un nuevo pedido en el backend.
@@ -29,7 +42,7 @@ class BackendService:
             "estado": estado,
             "notas": notas
         }
-        r = requests.post(f"{self.base_url}/pedidos", json=payload)
+        r = cliente_http.post(f"{self.base_url}/pedidos", json=payload)
         if r.status_code != 200:
             try:
                 error_detail = r.json().get('detail', r.text)
@@ -38,32 +51,142 @@ class BackendService:
             raise Exception(f"{error_detail}") # Solo el mensaje limpio
         return r.json()
 
+    # === MÉTODO: crear_pedidos_lote ===
+    # Crea varios pedidos en una sola petición/transacción (ráfagas de la app o de delivery).
+    def crear_pedidos_lote(self, pedidos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Args:
+            pedidos (List[Dict[str, Any]]): Pedidos con mesa_numero, items y opcionalmente estado y notas.
+        Returns:
+            Dict[str, Any]: {"aceptados", "rechazados", "resultados"}; cada resultado trae "indice",
+            "aceptado" y el "pedido" creado o el "error".
+        """
+        r = cliente_http.post(f"{self.base_url}/pedidos/lote", json={"pedidos": pedidos})
+        r.raise_for_status()
+        return r.json()
+
     # === MÉTODO: obtener_pedidos_activos ===
     # Obtiene todos los pedidos activos desde el backend.
 
     def obtener_pedidos_activos(self) -> List[Dict[str, Any]]:
-        """Obtiene todos los pedidos activos desde el backend."""
-        r = requests.get(f"{self.base_url}/pedidos/activos")
+        """
+        Obtiene todos los pedidos activos. Solo descarga del backend lo que cambió desde la
+        última llamada (/pedidos/cambios) y lo aplica sobre la copia local.
+        """
+        with self._lock_pedidos:
+            cambios = self.obtener_cambios_pedidos(self._cursor_pedidos)
+            self._aplicar_cambios_pedidos(cambios)
+            activos = sorted(self._pedidos_espejo.values(), key=lambda p: p.get("fecha_hora") or "", reverse=True)
+            # Copias: quien llama puede modificar los pedidos sin tocar la copia local
+            return copy.deepcopy(activos)
+
+    # === MÉTODO: obtener_cambios_pedidos ===
+    # Obtiene los pedidos creados, modificados o eliminados desde un cursor.
+
+    def obtener_cambios_pedidos(self, cursor: str = None) -> Dict[str, Any]:
+        """
+        Args:
+            cursor (str): Valor de "cursor" de la respuesta anterior. None para obtener todos los activos.
+        Returns:
+            Dict: {"cursor", "completo", "pedidos", "eliminados"}; "completo" también llega en True si el
+            cursor es anterior a la última purga de lápidas (la copia local se reemplaza entera).
+        """
+        params = {"since": cursor} if cursor is not None else {}
+        r = cliente_http.get(f"{self.base_url}/pedidos/cambios", params=params)
         r.raise_for_status()
         return r.json()
 
+    def _aplicar_cambios_pedidos(self, cambios: Dict[str, Any]):
+        if cambios.get("completo"):
+            self._pedidos_espejo.clear()
+        for pedido in cambios.get("pedidos", []):
+            if pedido.get("estado") in ESTADOS_PEDIDO_ACTIVOS:
+                self._pedidos_espejo[pedido["id"]] = pedido
+            else:
+                self._pedidos_espejo.pop(pedido["id"], None) # Entregado / Pagado
+        for pedido_id in cambios.get("eliminados", []):
+            self._pedidos_espejo.pop(pedido_id, None)
+        self._cursor_pedidos = cambios.get("cursor")
+
+    def reiniciar_pedidos_activos(self):
+        """Descarta la copia local; la próxima llamada a obtener_pedidos_activos descarga todo."""
+        with self._lock_pedidos:
+            self._pedidos_espejo.clear()
+            self._cursor_pedidos = None
+
     # === MÉTODO: actualizar_estado_pedido ===
     # Actualiza el estado de un pedido en el backend.
 
-    def actualizar_estado_pedido(self, pedido_id: int, nuevo_estado: str) -> Dict[str, Any]:
-        """Actualiza el estado de un pedido en el backend."""
-        r = requests.patch(f"{self.base_url}/pedidos/{pedido_id}/estado", params={"estado": nuevo_estado})
+    def actualizar_estado_pedido(self, pedido_id: int, nuevo_estado: str, estado_actual: str = None) -> Dict[str, Any]:
+        """
+        Actualiza el estado de un pedido en el backend.
+        Si se indica `estado_actual` (el que ve la pantalla), el backend responde 409 cuando el
+        pedido ya cambió de estado en otra pantalla.
+        """
+        params = {"estado": nuevo_estado}
+        if estado_actual:
+            params["estado_actual"] = estado_actual
+        r = cliente_http.patch(f"{self.base_url}/pedidos/{pedido_id}/estado", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: actualizar_estados_pedidos ===
+    # Varios cambios de estado en una sola petición/transacción.
+
+    def actualizar_estados_pedidos(self, cambios: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Args:
+            cambios (List[Dict[str, Any]]): [{"id", "estado", "estado_actual" (opcional)}, ...]
+        Returns:
+            Dict[str, Any]: {"actualizados", "resultados"}; cada resultado trae "indice", "id",
+            "actualizado" y el "pedido" o el "error" con su "codigo" (400/404/409).
+        """
+        r = cliente_http.patch(f"{self.base_url}/pedidos/estado", json={"cambios": cambios})
         r.raise_for_status()
         return r.json()
 
+    # === MÉTODO: cambiar_estado_pedidos ===
+    # Pasa varios pedidos (tal como los muestra la pantalla) al mismo estado.
+
+    def cambiar_estado_pedidos(self, pedidos: List[Dict[str, Any]], nuevo_estado: str) -> Dict[str, Any]:
+        return self.actualizar_estados_pedidos([
+            {"id": p["id"], "estado": nuevo_estado, "estado_actual": p.get("estado")}
+            for p in pedidos
+        ])
+
+    # === MÉTODO: actualizar_disponibilidad_menu ===
+    # Copia local de las porciones que permite el stock por plato. Sin `cambios` se descarga entera;
+    # con los platos que trae el evento 'menu_disponibilidad' se actualiza sin ir al backend.
+
+    def actualizar_disponibilidad_menu(self, cambios: Dict[str, Any] = None):
+        if cambios is None:
+            porciones = obtener_json_con_etag(f"{self.base_url}/menu/disponibilidad", self._cache_etag)["porciones"]
+            self._disponibilidad_menu = porciones
+        else:
+            self._disponibilidad_menu.update(cambios)
+
+    # === MÉTODO: porciones_disponibles ===
+    # Porciones de un plato según la copia local (None = sin receta o aún sin datos: sin límite).
+
+    def porciones_disponibles(self, nombre: str):
+        return self._disponibilidad_menu.get(nombre)
+
+    # === MÉTODO: obtener_pedidos_atrasados ===
+    # Pedidos Pendiente/En preparacion que esperan desde hace al menos `umbral_minutos`
+    # (por defecto, el umbral del backend), más antiguos primero.
+
+    def obtener_pedidos_atrasados(self, umbral_minutos: float = None) -> List[Dict[str, Any]]:
+        params = {"umbral_minutos": umbral_minutos} if umbral_minutos else {}
+        r = cliente_http.get(f"{self.base_url}/pedidos/atrasados", params=params)
+        r.raise_for_status()
+        return r.json()["pedidos"]
+
     # === MÉTODO: obtener_mesas ===
     # Obtiene la lista de mesas desde el backend.
 
     def obtener_mesas(self) -> List[Dict[str, Any]]:
         """Obtiene la lista de mesas desde el backend."""
-        r = requests.get(f"{self.base_url}/mesas")
-        r.raise_for_status()
-        return r.json()
+        return obtener_json_con_etag(f"{self.base_url}/mesas", self._cache_etag)
 
     # === MÉTODO: eliminar_ultimo_item ===
     # Elimina el último ítem de un pedido en el backend.
@@ -72,7 +195,7 @@ class BackendService:
         """
         Elimina el último ítem de un pedido en el backend.
         """
-        r = requests.delete(f"{self.base_url}/pedidos/{pedido_id}/ultimo_item")
+        r = cliente_http.delete(f"{self.base_url}/pedidos/{pedido_id}/ultimo_item")
         r.raise_for_status()
         return r.json()
 
@@ -89,7 +212,7 @@ class BackendService:
             "estado": estado,
             "notas": notas
         }
-        r = requests.put(f"{self.base_url}/pedidos/{pedido_id}", json=payload)
+        r = cliente_http.put(f"{self.base_url}/pedidos/{pedido_id}", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -100,7 +223,7 @@ class BackendService:
         """
         Elimina un pedido completamente del backend.
         """
-        r = requests.delete(f"{self.base_url}/pedidos/{pedido_id}")
+        r = cliente_http.delete(f"{self.base_url}/pedidos/{pedido_id}")
         r.raise_for_status()
         return r.json()
 
@@ -116,7 +239,7 @@ class BackendService:
             "precio": precio,
             "tipo": tipo
         }
-        r = requests.post(f"{self.base_url}/menu/items", json=payload)
+        r = cliente_http.post(f"{self.base_url}/menu/items", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -127,7 +250,7 @@ class BackendService:
         """
         Elimina un ítem del menú en el backend.
         """
-        r = requests.delete(f"{self.base_url}/menu/items", params={"nombre": nombre, "tipo": tipo})
+        r = cliente_http.delete(f"{self.base_url}/menu/items", params={"nombre": nombre, "tipo": tipo})
         r.raise_for_status()
         return r.json()
 
@@ -138,9 +261,7 @@ class BackendService:
         """
         Obtiene la lista de clientes del backend.
         """
-        r = requests.get(f"{self.base_url}/clientes")
-        r.raise_for_status()
-        return r.json()
+        return obtener_json_con_etag(f"{self.base_url}/clientes", self._cache_etag)
 
     # === MÉTODO: agregar_cliente ===
     # Agrega un nuevo cliente al backend.
@@ -154,7 +275,7 @@ class BackendService:
             "domicilio": domicilio,
             "celular": celular
         }
-        r = requests.post(f"{self.base_url}/clientes", json=payload)
+        r = cliente_http.post(f"{self.base_url}/clientes", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -165,7 +286,7 @@ class BackendService:
         """
         Elimina un cliente del backend.
         """
-        r = requests.delete(f"{self.base_url}/clientes/{cliente_id}")
+        r = cliente_http.delete(f"{self.base_url}/clientes/{cliente_id}")
         r.raise_for_status()
         return r.json()
     
@@ -191,7 +312,7 @@ class BackendService:
             "start_date": start_date,
             "end_date": end_date
         }
-        r = requests.get(f"{self.base_url}/reportes/", params=params)
+        r = cliente_http.get(f"{self.base_url}/reportes", params=params)
         r.raise_for_status()
         return r.json()
     
@@ -206,7 +327,19 @@ class BackendService:
         if end_date:
             params["end_date"] = end_date
 
-        r = requests.get(f"{self.base_url}/analisis/productos/", params=params)
+        r = cliente_http.get(f"{self.base_url}/analisis/productos", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: obtener_ventas_plato ===
+    # Obtiene las ventas diarias de un plato en un rango de fechas.
+    def obtener_ventas_plato(self, nombre: str, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+        params = {}
+        if start_date:
+            params["start_date"] = start_date
+        if end_date:
+            params["end_date"] = end_date
+        r = cliente_http.get(f"{self.base_url}/analisis/productos/{quote(nombre, safe='')}", params=params) # El nombre puede traer / ? # %
         r.raise_for_status()
         return r.json()
     
@@ -220,7 +353,7 @@ class BackendService:
             Dict[str, float]: Diccionario con hora (00-23) como clave y total de ventas como valor.
         """
         params = {"fecha": fecha}
-        r = requests.get(f"{self.base_url}/reportes/ventas_por_hora", params=params)
+        r = cliente_http.get(f"{self.base_url}/reportes/ventas_por_hora", params=params)
         r.raise_for_status()
         return r.json()
     # --- FIN NUEVO MÉTODO ---
@@ -233,7 +366,8 @@ class BackendService:
             tipo (str): "Diario", "Semanal", "Mensual", "Anual".
             fecha (datetime): Fecha de referencia para el cálculo.
         Returns:
-            Dict[str, Any]: Diccionario con 'promedio_minutos' y 'detalle_pedidos'.
+            Dict[str, Any]: Diccionario con 'pedidos', 'promedio_minutos' y 'detalle_pedidos'
+                (los pedidos más recientes del periodo; 'detalle_limitado' indica si hay más).
         """
         # Construir parámetros de fecha (igual que en obtener_reporte)
         if tipo == "Diario":
@@ -255,7 +389,7 @@ class BackendService:
             "start_date": start_date,
             "end_date": end_date
         }
-        r = requests.get(f"{self.base_url}/reportes/eficiencia_cocina", params=params)
+        r = cliente_http.get(f"{self.base_url}/reportes/eficiencia_cocina", params=params)
         r.raise_for_status()
         return r.json()
     # --- FIN NUEVO MÉTODO ---
@@ -265,7 +399,7 @@ class BackendService:
         """
         Solicita al backend crear un respaldo de la base de datos.
         """
-        r = requests.post(f"{self.base_url}/backup")
+        r = cliente_http.post(f"{self.base_url}/backup", timeout=(HTTP_TIMEOUT_CONEXION, 300)) # pg_dump puede tardar
         if r.status_code != 200:
             try:
                 error_detail = r.json().get('detail', r.text)
@@ -273,3 +407,55 @@ class BackendService:
                 error_detail = r.text
             raise Exception(f"Error del backend ({r.status_code}): {error_detail}")
         return r.json()
+
+    # === MÉTODO: suscribir_eventos ===
+    # Se conecta al flujo SSE /eventos/ del backend en un hilo propio y llama a
+    # on_evento(tabla, datos) por cada cambio publicado. Reconecta solo con backoff
+    # y emite un evento "conectado" en cada (re)conexión para que la UI haga un refresco completo.
+    def suscribir_eventos(self, on_evento: Callable[[str, Dict[str, Any]], None]) -> threading.Event:
+        """
+        Args:
+            on_evento (Callable): Función que recibe el tipo de evento (nombre de la tabla) y su JSON.
+        Returns:
+            threading.Event: Llamar a .set() para detener la suscripción.
+        """
+        detener = threading.Event()
+
+        def despachar(tipo, datos):
+            try:
+                on_evento(tipo, datos)
+            except Exception as e:
+                print(f"Error al procesar evento '{tipo}': {e}")
+
+        def escuchar():
+            espera = 1
+            while not detener.is_set():
+                try:
+                    # Timeout de lectura mayor que el keepalive del servidor (15 s)
+                    with cliente_http.get(f"{self.base_url}/eventos/", stream=True, timeout=(HTTP_TIMEOUT_CONEXION, 45)) as r:
+                        r.raise_for_status()
+                        espera = 1
+                        despachar("conectado", {})
+                        tipo, datos = "message", []
+                        for linea in r.iter_lines(decode_unicode=True):
+                            if detener.is_set():
+                                return
+                            if linea is None:
+                                continue
+                            if linea == "": # Fin de un evento
+                                if datos:
+                                    despachar(tipo, json.loads("\n".join(datos)))
+                                tipo, datos = "message", []
+                            elif linea.startswith(":"): # Comentario / keepalive
+                                continue
+                            elif linea.startswith("event:"):
+                                tipo = linea[len("event:"):].strip()
+                            elif linea.startswith("data:"):
+                                datos.append(linea[len("data:"):].strip())
+                except Exception as e:
+                    print(f"Flujo de eventos desconectado: {e}")
+                detener.wait(espera)
+                espera = min(espera * 2, 30)
+
+        threading.Thread(target=escuchar, daemon=True).start()
+        return detener
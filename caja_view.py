@@ -104,7 +104,7 @@ def crear_vista_caja(backend_service, on_update_ui, page):
             return
         try:
             # Cambiar estado del pedido seleccionado a 'Pagado'
-            backend_service.actualizar_estado_pedido(pedido_seleccionado_para_cobro["id"], "Pagado")
+            backend_service.actualizar_estado_pedido(pedido_seleccionado_para_cobro["id"], "Pagado", pedido_seleccionado_para_cobro.get("estado"))
             # Deseleccionar el pedido
             cancelar_seleccion_pedido(None)
             # Actualizar la lista general de pedidos
@@ -1,18 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import json
 
-DATABASE_URL = "dbname=restaurant_db user=postgres password=postgres host=localhost port=5432"
-
-def get_db():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    try:
-        yield conn
-    finally:
-        conn.close()
+# Pool de conexiones compartido con backend.py
+from database import get_db
+from movimientos_inventario import marcar_movimientos
 
 class IngredienteConfig(BaseModel):
     nombre: str
@@ -111,6 +104,7 @@ def aplicar_configuracion(config_id: int, conn = Depends(get_db)):
 
             ingredientes = json.loads(config['ingredientes'])
 
+            marcar_movimientos(cursor, "reposicion", nota=f"Configuración {config_id}")
             # Agregar ingredientes al inventario
             for ing in ingredientes:
                 cursor.execute("""
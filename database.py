@@ -0,0 +1,179 @@
+# === DATABASE.PY ===
+# Pool de conexiones PostgreSQL compartido por backend.py y todas las sub-apps montadas
+# (inventario, recetas, configuraciones). Sustituye a los get_db() que abrían y cerraban
+# una conexión nueva en cada petición.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import RealDictCursor
+
+# Configuración directa de PostgreSQL (se puede sobreescribir con variables de entorno)
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    "dbname=restaurant_db user=postgres password=postgres host=localhost port=5432"
+)
+
+# --- PARÁMETROS DEL POOL ---
+POOL_MIN_CONEXIONES = int(os.environ.get("DB_POOL_MIN", "2"))
+POOL_MAX_CONEXIONES = int(os.environ.get("DB_POOL_MAX", "20"))
+POOL_TIMEOUT_SEGUNDOS = float(os.environ.get("DB_POOL_TIMEOUT", "10")) # Espera máxima por una conexión libre
+POOL_PING_SEGUNDOS = float(os.environ.get("DB_POOL_PING", "30")) # Verificar con SELECT 1 si estuvo ociosa más de esto
+# --- FIN PARÁMETROS ---
+
+
+# === CLASE: PoolConexiones ===
+# Envuelve un ThreadedConnectionPool con espera acotada, verificación de salud y métricas de uso.
+class PoolConexiones:
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float, ping_segundos: float):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_segundos = ping_segundos
+        self._pool = None # Se crea en el primer uso para que importar el módulo no conecte a la BD
+        self._lock = threading.Lock()
+        self._semaforo = threading.BoundedSemaphore(maxconn)
+        self._ultimo_uso = {} # id(conn) -> time.monotonic() de la última devolución
+        # --- MÉTRICAS ---
+        self._en_uso = 0
+        self._max_en_uso = 0
+        self._prestamos_totales = 0
+        self._esperas_agotadas = 0
+        self._conexiones_descartadas = 0
+        self._espera_total_segundos = 0.0
+
+    def _obtener_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.minconn,
+                        self.maxconn,
+                        self.dsn,
+                        cursor_factory=RealDictCursor
+                    )
+        return self._pool
+
+    def _conexion_sana(self, conn) -> bool:
+        """Descarta conexiones cerradas y hace ping a las que llevan tiempo ociosas."""
+        if conn.closed:
+            return False
+        ultimo_uso = self._ultimo_uso.get(id(conn))
+        if ultimo_uso is not None and time.monotonic() - ultimo_uso < self.ping_segundos:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def obtener(self):
+        """Presta una conexión del pool. Espera hasta `timeout` segundos si están todas en uso."""
+        inicio = time.monotonic()
+        if not self._semaforo.acquire(timeout=self.timeout):
+            with self._lock:
+                self._esperas_agotadas += 1
+            raise psycopg2.pool.PoolError(f"Pool de conexiones agotado ({self.maxconn} en uso)")
+        try:
+            pool = self._obtener_pool()
+            conn = pool.getconn()
+            # Reintentar una vez si la conexión prestada está rota (p. ej. tras reiniciar PostgreSQL)
+            if not self._conexion_sana(conn):
+                self._descartar(pool, conn)
+                conn = pool.getconn()
+        except Exception:
+            self._semaforo.release()
+            raise
+        with self._lock:
+            self._en_uso += 1
+            self._max_en_uso = max(self._max_en_uso, self._en_uso)
+            self._prestamos_totales += 1
+            self._espera_total_segundos += time.monotonic() - inicio
+        return conn
+
+    def _descartar(self, pool, conn):
+        self._ultimo_uso.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        with self._lock:
+            self._conexiones_descartadas += 1
+
+    def devolver(self, conn):
+        """Devuelve una conexión al pool, revirtiendo cualquier transacción que haya quedado abierta."""
+        pool = self._obtener_pool()
+        try:
+            estado = conn.get_transaction_status() if not conn.closed else psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+            if estado == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._descartar(pool, conn)
+                return
+            if estado != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback() # El endpoint no hizo commit (error o solo lectura): liberar bloqueos
+            self._ultimo_uso[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._descartar(pool, conn)
+        finally:
+            with self._lock:
+                self._en_uso -= 1
+            self._semaforo.release()
+
+    @contextmanager
+    def conexion(self):
+        """Uso fuera de FastAPI: `with pool.conexion() as conn: ...`"""
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def metricas(self) -> dict:
+        """Devuelve el estado del pool para /health."""
+        with self._lock:
+            libres = len(self._pool._pool) if self._pool is not None else 0
+            return {
+                "min_conexiones": self.minconn,
+                "max_conexiones": self.maxconn,
+                "en_uso": self._en_uso,
+                "libres": libres,
+                "max_en_uso": self._max_en_uso,
+                "prestamos_totales": self._prestamos_totales,
+                "esperas_agotadas": self._esperas_agotadas,
+                "conexiones_descartadas": self._conexiones_descartadas,
+                "espera_promedio_ms": round(self._espera_total_segundos * 1000 / self._prestamos_totales, 3) if self._prestamos_totales else 0.0,
+            }
+
+    def cerrar(self):
+        """Cierra todas las conexiones (llamar al apagar el servidor)."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._ultimo_uso.clear()
+
+
+# Instancia única por proceso
+pool = PoolConexiones(
+    DATABASE_URL,
+    POOL_MIN_CONEXIONES,
+    POOL_MAX_CONEXIONES,
+    POOL_TIMEOUT_SEGUNDOS,
+    POOL_PING_SEGUNDOS
+)
+
+
+# === DEPENDENCIA: get_db ===
+# Dependencia de FastAPI compartida por todas las apps. Presta una conexión del pool
+# y la devuelve al terminar la petición.
+def get_db():
+    conn = pool.obtener()
+    try:
+        yield conn
+    finally:
+        pool.devolver(conn)
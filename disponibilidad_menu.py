@@ -0,0 +1,143 @@
+# disponibilidad_menu.py
+# "Lista 86": cuántas porciones de cada plato del menú permite el stock actual del inventario,
+# según las recetas en memoria (recetas_cache.py). Se mantiene de forma incremental: cuando cambia
+# el stock de un ingrediente (evento 'inventario_stock' del trigger de SqlPRO.sql) solo se
+# recalculan los platos que lo usan, y GET /menu/disponibilidad se sirve desde memoria.
+# Cambios de menú, de recetas o ingredientes nuevos/borrados invalidan la copia (se recarga entera).
+
+import os
+import threading
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from recetas_cache import cache_recetas
+
+
+# === FUNCIÓN: porciones_posibles ===
+# Porciones completas de una receta que alcanzan con el stock dado (el ingrediente más escaso manda).
+def porciones_posibles(receta: List[Tuple[int, Decimal]], stock: Dict[int, Decimal]) -> int:
+    porciones = None
+    for ingrediente_id, cantidad in receta:
+        if cantidad <= 0:
+            continue
+        alcanza = int(max(stock.get(ingrediente_id, Decimal(0)), Decimal(0)) // cantidad)
+        porciones = alcanza if porciones is None else min(porciones, alcanza)
+    return porciones if porciones is not None else 0
+
+
+# === CLASE: DisponibilidadMenu ===
+class DisponibilidadMenu:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cargada = False
+        self._generacion = 0 # Aumenta en cada invalidación (descarta cargas que empezaron antes)
+        self._recetas: Dict[str, List[Tuple[int, Decimal]]] = {} # Solo platos del menú con receta
+        self._usos: Dict[int, set] = {} # ingrediente_id -> platos que lo usan
+        self._stock: Dict[int, Decimal] = {}
+        self._porciones: Dict[str, Optional[int]] = {} # None = sin receta (sin límite)
+        self.version = 0
+        self._publicar: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def iniciar(self, publicar: Callable[[Dict[str, Any]], None]):
+        """`publicar` entrega el evento 'menu_disponibilidad' a los clientes SSE (bus.publicar)."""
+        self._publicar = publicar
+
+    # --- CARGA ---
+    def cargar(self, cursor) -> Tuple[Dict[str, Optional[int]], Optional[int]]:
+        """Devuelve las porciones leídas y la versión con la que quedaron guardadas (None si se descartaron)."""
+        with self._lock:
+            generacion = self._generacion
+        recetas = cache_recetas.obtener(cursor)
+        cursor.execute("SELECT DISTINCT nombre FROM menu")
+        platos = [row['nombre'] for row in cursor.fetchall()]
+        cursor.execute("SELECT id, cantidad_disponible FROM inventario")
+        stock = {row['id']: Decimal(row['cantidad_disponible']) for row in cursor.fetchall()}
+
+        recetas_menu = {plato: recetas[plato] for plato in platos if plato in recetas}
+        usos: Dict[int, set] = {}
+        for plato, ingredientes in recetas_menu.items():
+            for ingrediente_id, _ in ingredientes:
+                usos.setdefault(ingrediente_id, set()).add(plato)
+        porciones = {plato: porciones_posibles(recetas_menu[plato], stock) if plato in recetas_menu else None for plato in platos}
+        with self._lock:
+            # Si llegó una invalidación mientras se leía, lo leído puede estar viejo: no se guarda
+            if generacion != self._generacion:
+                return dict(porciones), None
+            self._recetas = recetas_menu
+            self._usos = usos
+            self._stock = stock
+            self._porciones = porciones
+            self._cargada = True
+            self.version += 1
+            return dict(porciones), self.version
+
+    def invalidar(self):
+        with self._lock:
+            self._cargada = False
+            self._generacion += 1
+            self.version += 1
+
+    # --- CAMBIOS DE STOCK ---
+    def aplicar_stock(self, cambios: Dict[int, Decimal]) -> Dict[str, int]:
+        """Aplica cantidades nuevas de ingredientes y devuelve los platos cuyas porciones cambiaron."""
+        with self._lock:
+            if not self._cargada:
+                # Puede haber una carga en curso que leyó el stock antes de este cambio: se descarta
+                # (la próxima carga lee el stock actual). La versión también cambia para que ningún
+                # cliente se quede con un ETag de antes de este cambio
+                self._generacion += 1
+                self.version += 1
+                return {}
+            afectados = set()
+            for ingrediente_id, cantidad in cambios.items():
+                if ingrediente_id in self._stock:
+                    self._stock[ingrediente_id] = cantidad
+                    afectados |= self._usos.get(ingrediente_id, set())
+            modificados = {}
+            for plato in afectados:
+                porciones = porciones_posibles(self._recetas[plato], self._stock)
+                if porciones != self._porciones.get(plato):
+                    self._porciones[plato] = porciones
+                    modificados[plato] = porciones
+            if modificados:
+                self.version += 1
+            return modificados
+
+    def al_recibir_evento(self, evento: Dict[str, Any]):
+        # Oyente del bus de eventos (se registra después de cache_recetas, que se invalida primero)
+        tabla, operacion = evento.get("tabla"), evento.get("operacion")
+        if tabla == "inventario_stock" and evento.get("cambios") is not None:
+            modificados = self.aplicar_stock({c["id"]: Decimal(str(c["cantidad"])) for c in evento["cambios"]})
+            if modificados:
+                self._emitir({"completo": False, "platos": modificados})
+        elif (tabla in ("menu", "recetas", "inventario_stock")
+              or (tabla == "inventario" and operacion in ("INSERT", "DELETE"))
+              or operacion == "RECONECTADO"):
+            self.invalidar()
+            self._emitir({"completo": True}) # Los clientes vuelven a pedir la lista entera
+
+    def _emitir(self, datos: Dict[str, Any]):
+        if self._publicar is None:
+            return
+        try:
+            self._publicar({"tabla": "menu_disponibilidad", **datos})
+        except Exception as e:
+            print(f"Error al publicar la disponibilidad del menú: {e}")
+
+    # --- CONSULTA ---
+    def obtener(self, cursor) -> Tuple[Dict[str, Optional[int]], Optional[int]]:
+        """Porciones por plato y su versión; solo consulta la BD si la copia fue invalidada.
+        La versión es None si lo leído no se pudo guardar (llegó un cambio durante la carga)."""
+        with self._lock:
+            if self._cargada:
+                return dict(self._porciones), self.version
+        return self.cargar(cursor)
+
+    @staticmethod
+    def etag(version: int) -> str:
+        # Versión en memoria de este proceso (otro worker tiene la suya)
+        return f'"disponibilidad-{os.getpid()}-{version}"'
+
+
+# Instancia única por proceso (backend.py la suscribe al bus de eventos)
+disponibilidad_menu = DisponibilidadMenu()
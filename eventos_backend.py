@@ -0,0 +1,163 @@
+# eventos_backend.py
+# Flujo de eventos (Server-Sent Events) para que las terminales se enteren de los cambios
+# en pedidos, mesas, reservas, inventario, etc. sin tener que consultar cada pocos segundos.
+# Los eventos salen de PostgreSQL (LISTEN/NOTIFY, ver triggers en SqlPRO.sql), por lo que
+# cualquier worker o proceso que modifique la BD los dispara.
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+
+from database import DATABASE_URL
+
+# Canal de NOTIFY usado por la función notificar_cambio() de SqlPRO.sql
+CANAL_EVENTOS = "restaurante_eventos"
+KEEPALIVE_SEGUNDOS = 15 # Comentario SSE periódico para mantener viva la conexión
+
+
+# === CLASE: BusEventos ===
+# Escucha el canal de PostgreSQL en un hilo dedicado y reparte cada evento a los
+# suscriptores SSE conectados a este proceso.
+class BusEventos:
+    def __init__(self, dsn: str, canal: str):
+        self.dsn = dsn
+        self.canal = canal
+        self._suscriptores = set() # {(loop, asyncio.Queue)}
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._detener = threading.Event()
+        self._oyentes_locales = [] # Callbacks internos del backend (p. ej. invalidar cachés)
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._escuchar, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _escuchar(self):
+        espera = 1
+        while not self._detener.is_set():
+            conn = None
+            try:
+                # Conexión propia (no del pool): queda bloqueada en LISTEN toda la vida del proceso
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.canal};")
+                espera = 1
+                print(f"Escuchando eventos de PostgreSQL en el canal '{self.canal}'")
+                # Solo para los oyentes internos: lo notificado mientras no se escuchaba se perdió
+                self._avisar_oyentes({"tabla": None, "operacion": "RECONECTADO"})
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue # Timeout: volver a comprobar si hay que detenerse
+                    conn.poll()
+                    while conn.notifies:
+                        notificacion = conn.notifies.pop(0)
+                        try:
+                            evento = json.loads(notificacion.payload)
+                        except ValueError:
+                            evento = {"tabla": notificacion.payload}
+                        self.publicar(evento)
+            except Exception as e:
+                print(f"Error en la escucha de eventos: {e}")
+                self._detener.wait(espera)
+                espera = min(espera * 2, 30) # Backoff exponencial hasta 30 s
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def publicar(self, evento: Dict[str, Any]):
+        """Entrega el evento a los oyentes internos y a todos los clientes SSE de este proceso."""
+        self._avisar_oyentes(evento)
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for loop, cola in suscriptores:
+            loop.call_soon_threadsafe(cola.put_nowait, evento)
+
+    def _avisar_oyentes(self, evento: Dict[str, Any]):
+        for oyente in list(self._oyentes_locales):
+            try:
+                oyente(evento)
+            except Exception as e:
+                print(f"Error en oyente de eventos: {e}")
+
+    def agregar_oyente(self, oyente):
+        self._oyentes_locales.append(oyente)
+
+    def suscribir(self) -> asyncio.Queue:
+        cola = asyncio.Queue()
+        with self._lock:
+            self._suscriptores.add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, cola: asyncio.Queue):
+        with self._lock:
+            self._suscriptores = {(l, c) for (l, c) in self._suscriptores if c is not cola}
+
+    def total_suscriptores(self) -> int:
+        with self._lock:
+            return len(self._suscriptores)
+
+
+# Instancia única por proceso (backend.py la arranca en su evento de startup)
+bus = BusEventos(DATABASE_URL, CANAL_EVENTOS)
+
+
+# === FUNCIÓN: notificar_evento ===
+# Emite un evento desde el código del backend dentro de la transacción en curso.
+# PostgreSQL lo entrega a todos los workers solo si se hace commit.
+def notificar_evento(cursor, tabla: str, datos: Optional[Dict[str, Any]] = None):
+    evento = {"tabla": tabla, **(datos or {})}
+    cursor.execute("SELECT pg_notify(%s, %s);", (CANAL_EVENTOS, json.dumps(evento, default=str)))
+
+
+# Nueva sub-app para Eventos
+eventos_app = FastAPI(title="Eventos API")
+
+@eventos_app.get("/")
+async def flujo_eventos():
+    """
+    Flujo SSE. Cada evento tiene como tipo el nombre de la tabla afectada
+    (pedidos, mesas, reservas, inventario, recetas, clientes, menu) y como datos el JSON del evento.
+    Además, 'pedidos_atrasados' cuando un pedido cruza el umbral de espera (ver retrasos.py) e
+    'inventario_alertas' cuando un ingrediente cruza su nivel de alerta (trigger de SqlPRO.sql) y
+    'menu_disponibilidad' cuando cambian las porciones posibles de algún plato (disponibilidad_menu.py).
+    """
+    cola = bus.suscribir()
+
+    async def generar():
+        try:
+            yield "retry: 3000\n: conectado\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=KEEPALIVE_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                tipo = evento.get("tabla", "message")
+                yield f"event: {tipo}\ndata: {json.dumps(evento, default=str)}\n\n"
+        finally:
+            bus.desuscribir(cola)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@eventos_app.get("/estado")
+def estado_eventos():
+    """Diagnóstico: clientes conectados a este proceso."""
+    return {"suscriptores": bus.total_suscriptores(), "canal": CANAL_EVENTOS, "timestamp": time.time()}
@@ -0,0 +1,122 @@
+# http_client.py
+# Sesión HTTP compartida por todos los servicios cliente (BackendService, InventoryService,
+# RecetasService, ReservasService). Reutiliza las conexiones TCP al backend (keep-alive),
+# aplica timeouts por defecto, reintenta las lecturas que fallan y mide la latencia de cada endpoint.
+
+import copy
+import os
+import re
+import threading
+import time
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- PARÁMETROS DEL CLIENTE (se pueden sobreescribir con variables de entorno) ---
+HTTP_TIMEOUT_CONEXION = float(os.environ.get("HTTP_TIMEOUT_CONEXION", "3")) # Segundos para abrir la conexión
+HTTP_TIMEOUT_LECTURA = float(os.environ.get("HTTP_TIMEOUT_LECTURA", "15")) # Segundos esperando la respuesta
+HTTP_MAX_CONEXIONES = int(os.environ.get("HTTP_MAX_CONEXIONES", "20")) # Conexiones abiertas por host
+HTTP_REINTENTOS = int(os.environ.get("HTTP_REINTENTOS", "3"))
+# --- FIN PARÁMETROS ---
+
+
+# === CLASE: ClienteHTTP ===
+# Envuelve un requests.Session con un pool de conexiones. Los métodos tienen la misma firma que
+# requests.get/post/..., así que devuelven requests.Response y lanzan las mismas excepciones.
+class ClienteHTTP:
+    def __init__(self, timeout_conexion: float, timeout_lectura: float, max_conexiones: int, reintentos: int):
+        self.timeout = (timeout_conexion, timeout_lectura)
+        self.sesion = requests.Session()
+        # Solo se reintentan GET/HEAD ante 502/503/504 o cortes de lectura; un POST que llegó al
+        # backend no se repite. Los errores al conectar sí se reintentan siempre (la petición no salió).
+        reintentos = Retry(
+            total=reintentos,
+            backoff_factor=0.2, # 0.2 s, 0.4 s, 0.8 s...
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False
+        )
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=max_conexiones, max_retries=reintentos)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self._lock = threading.Lock()
+        self._latencias: Dict[str, Dict[str, Any]] = {} # "GET /pedidos/{id}" -> contadores
+
+    def request(self, metodo: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        inicio = time.perf_counter()
+        error = False
+        try:
+            respuesta = self.sesion.request(metodo, url, **kwargs)
+            error = respuesta.status_code >= 500
+            return respuesta
+        except requests.exceptions.RequestException:
+            error = True
+            raise
+        finally:
+            self._registrar(metodo, url, time.perf_counter() - inicio, error)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def _registrar(self, metodo: str, url: str, segundos: float, error: bool):
+        # Agrupar por endpoint: /pedidos/15/estado y /pedidos/16/estado cuentan juntos
+        ruta = re.sub(r"/\d+(?=/|$)", "/{id}", urlparse(url).path)
+        clave = f"{metodo} {ruta}"
+        with self._lock:
+            datos = self._latencias.setdefault(clave, {"llamadas": 0, "errores": 0, "total_ms": 0.0, "max_ms": 0.0})
+            datos["llamadas"] += 1
+            datos["errores"] += 1 if error else 0
+            datos["total_ms"] += segundos * 1000
+            datos["max_ms"] = max(datos["max_ms"], segundos * 1000)
+
+    def metricas(self) -> Dict[str, Dict[str, Any]]:
+        """Latencia por endpoint desde que arrancó la aplicación."""
+        with self._lock:
+            return {
+                clave: {
+                    "llamadas": datos["llamadas"],
+                    "errores": datos["errores"],
+                    "promedio_ms": round(datos["total_ms"] / datos["llamadas"], 1),
+                    "max_ms": round(datos["max_ms"], 1),
+                }
+                for clave, datos in sorted(self._latencias.items())
+            }
+
+
+# Instancia única por proceso, compartida por todos los servicios
+cliente_http = ClienteHTTP(HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA, HTTP_MAX_CONEXIONES, HTTP_REINTENTOS)
+
+
+# === FUNCIÓN: obtener_json_con_etag ===
+# GET con If-None-Match: si el backend responde 304 se reutiliza el cuerpo guardado en `cache`
+# (un dict por servicio) en lugar de descargarlo y parsearlo otra vez.
+def obtener_json_con_etag(url: str, cache: Dict[str, Any]) -> Any:
+    guardado = cache.get(url)
+    headers = {"If-None-Match": guardado[0]} if guardado else {}
+    r = cliente_http.get(url, headers=headers)
+    if r.status_code == 304 and guardado:
+        return copy.deepcopy(guardado[1]) # Copia: quien llama puede modificar la lista
+    r.raise_for_status()
+    datos = r.json()
+    etag = r.headers.get("ETag")
+    if etag:
+        cache[url] = (etag, datos)
+        return copy.deepcopy(datos)
+    cache.pop(url, None)
+    return datos
@@ -1,23 +1,20 @@
 # inventario_backend.py
 # Backend API para gestionar el inventario de ingredientes.
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 import psycopg2
-from psycopg2.extras import RealDictCursor
 # --- IMPORTAR LA EXCEPCIÓN DE INTEGRIDAD ---
 import psycopg2.errors
 # --- FIN IMPORTAR ---
 
-DATABASE_URL = "dbname=restaurant_db user=postgres password=postgres host=localhost port=5432"
-
-def get_db():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    try:
-        yield conn
-    finally:
-        conn.close()
+# Pool de conexiones compartido con backend.py
+from database import get_db
+from versiones import etag_tablas, respuesta_no_modificada, agregar_etag
+from movimientos_inventario import marcar_movimientos, stock_en, consumo_por_ingrediente, listar_movimientos, tomar_snapshot
+from pronostico_inventario import pronostico_inventario
 
 # --- MODELO: InventarioItem ---
 # Para agregar un nuevo ítem al inventario.
@@ -38,6 +35,12 @@ class InventarioUpdate(BaseModel):
     cantidad_minima_alerta: float = 5.0 # Nuevo campo, con valor por defecto
     # --- FIN AÑADIR EL NUEVO CAMPO ---
 
+# --- MODELO: MermaInventario ---
+# Para registrar stock perdido (vencido, roto, descartado).
+class MermaInventario(BaseModel):
+    cantidad: float
+    nota: Optional[str] = None
+
 # --- MODELO: InventarioResponse ---
 # Para la respuesta al obtener ítems del inventario.
 class InventarioResponse(BaseModel):
@@ -55,8 +58,12 @@ class InventarioResponse(BaseModel):
 inventario_app = FastAPI(title="Inventory API")
 
 @inventario_app.get("/", response_model=List[InventarioResponse])
-def obtener_inventario(conn: psycopg2.extensions.connection = Depends(get_db)):
+def obtener_inventario(request: Request, response: Response, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
+        etag = etag_tablas(cursor, "inventario")
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
         # --- ACTUALIZAR CONSULTA: Incluir cantidad_minima_alerta ---
         cursor.execute("""
             SELECT id, nombre, cantidad_disponible, unidad_medida, cantidad_minima_alerta, fecha_registro, fecha_actualizacion
@@ -76,11 +83,104 @@ def obtener_inventario(conn: psycopg2.extensions.connection = Depends(get_db)):
                 "fecha_registro": str(row['fecha_registro']),
                 "fecha_actualizacion": str(row['fecha_actualizacion'])
             })
+        agregar_etag(response, etag)
         return items
 
+# --- ALERTAS DE STOCK ---
+# Ingredientes en o por debajo de su nivel de alerta (cantidad_minima_alerta), sin enviar ni
+# recorrer todo el inventario: la condición coincide con el índice parcial idx_inventario_alertas
+# de SqlPRO.sql. Con `umbral` se suman los que tienen cantidad_disponible <= umbral (idx_inventario_stock).
+# Cuando un ingrediente cruza su nivel se emite además el evento 'inventario_alertas'.
+@inventario_app.get("/alertas", response_model=List[InventarioResponse])
+def obtener_alertas_inventario(
+    request: Request,
+    response: Response,
+    umbral: Optional[float] = Query(None, ge=0, description="Umbral fijo adicional (p. ej. el de la configuración de la terminal)."),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    with conn.cursor() as cursor:
+        etag = etag_tablas(cursor, "inventario", sufijo=f"alertas-{umbral}")
+        no_modificada = respuesta_no_modificada(request, etag)
+        if no_modificada:
+            return no_modificada
+        condicion = "cantidad_disponible <= cantidad_minima_alerta"
+        params = []
+        if umbral is not None:
+            condicion += " OR cantidad_disponible <= %s"
+            params.append(umbral)
+        cursor.execute(f"""
+            SELECT id, nombre, cantidad_disponible, unidad_medida, cantidad_minima_alerta, fecha_registro, fecha_actualizacion
+            FROM inventario
+            WHERE {condicion}
+            ORDER BY nombre
+        """, params)
+        items = [
+            {
+                "id": row['id'],
+                "nombre": row['nombre'],
+                "cantidad_disponible": row['cantidad_disponible'],
+                "unidad_medida": row['unidad_medida'],
+                "cantidad_minima_alerta": row['cantidad_minima_alerta'],
+                "fecha_registro": str(row['fecha_registro']),
+                "fecha_actualizacion": str(row['fecha_actualizacion'])
+            }
+            for row in cursor.fetchall()
+        ]
+        agregar_etag(response, etag)
+        return items
+# --- FIN ALERTAS DE STOCK ---
+
+# --- LIBRO DE MOVIMIENTOS ---
+# Historia del stock desde movimientos_inventario (ver movimientos_inventario.py): sin recorrer
+# pedidos ni reconstruir el stock a mano.
+@inventario_app.get("/movimientos")
+def obtener_movimientos_inventario(
+    ingrediente_id: Optional[int] = None,
+    desde: Optional[datetime] = Query(None, description="Desde (YYYY-MM-DDTHH:MM:SS), incluido."),
+    hasta: Optional[datetime] = Query(None, description="Hasta (YYYY-MM-DDTHH:MM:SS), excluido."),
+    limite: int = Query(500, ge=1, le=5000),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    with conn.cursor() as cursor:
+        return listar_movimientos(cursor, desde, hasta, ingrediente_id, limite)
+
+@inventario_app.get("/historico")
+def obtener_stock_historico(
+    momento: datetime = Query(..., description="Fecha y hora (YYYY-MM-DDTHH:MM:SS)."),
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    with conn.cursor() as cursor:
+        return {"momento": momento.strftime("%Y-%m-%d %H:%M:%S"), "ingredientes": stock_en(cursor, momento)}
+
+@inventario_app.get("/consumo")
+def obtener_consumo_inventario(
+    desde: Optional[datetime] = Query(None, description="Desde (YYYY-MM-DDTHH:MM:SS), incluido."),
+    hasta: Optional[datetime] = Query(None, description="Hasta (YYYY-MM-DDTHH:MM:SS), excluido."),
+    ingrediente_id: Optional[int] = None,
+    conn: psycopg2.extensions.connection = Depends(get_db)
+):
+    with conn.cursor() as cursor:
+        return consumo_por_ingrediente(cursor, desde, hasta, ingrediente_id)
+
+# Horas hasta el nivel de alerta y hasta agotarse de cada ingrediente, según su consumo por día de la
+# semana y hora (pronostico_inventario.py). Se calcula en memoria para todo el inventario a la vez.
+@inventario_app.get("/pronostico")
+def obtener_pronostico_inventario(conn: psycopg2.extensions.connection = Depends(get_db)):
+    with conn.cursor() as cursor:
+        return pronostico_inventario.obtener(cursor)
+
+@inventario_app.post("/snapshots")
+def crear_snapshot_inventario(conn: psycopg2.extensions.connection = Depends(get_db)):
+    with conn.cursor() as cursor:
+        total = tomar_snapshot(cursor)
+        conn.commit()
+        return {"status": "ok", "ingredientes": total}
+# --- FIN LIBRO DE MOVIMIENTOS ---
+
 @inventario_app.post("/", response_model=InventarioResponse)
 def agregar_item_inventario(item: InventarioItem, conn: psycopg2.extensions.connection = Depends(get_db)):
     with conn.cursor() as cursor:
+        marcar_movimientos(cursor, "reposicion") # Si el ingrediente ya existía, la suma queda como reposición
         # --- ACTUALIZAR CONSULTA: Incluir cantidad_minima_alerta en INSERT y UPDATE ---
         cursor.execute("""
             INSERT INTO inventario (nombre, cantidad_disponible, unidad_medida, cantidad_minima_alerta)
@@ -138,6 +238,35 @@ def actualizar_item_inventario(item_id: int, update_data: InventarioUpdate, conn
             "fecha_actualizacion": str(result['fecha_actualizacion'])
         }
 
+@inventario_app.post("/{item_id}/merma", response_model=InventarioResponse)
+def registrar_merma(item_id: int, merma: MermaInventario, conn: psycopg2.extensions.connection = Depends(get_db)):
+    if merma.cantidad <= 0:
+        raise HTTPException(status_code=400, detail="La cantidad de merma debe ser mayor que 0.")
+    with conn.cursor() as cursor:
+        marcar_movimientos(cursor, "merma", nota=merma.nota)
+        try:
+            cursor.execute("""
+                UPDATE inventario
+                SET cantidad_disponible = cantidad_disponible - %s
+                WHERE id = %s
+                RETURNING id, nombre, cantidad_disponible, unidad_medida, cantidad_minima_alerta, fecha_registro, fecha_actualizacion
+            """, (merma.cantidad, item_id))
+        except psycopg2.errors.CheckViolation:
+            raise HTTPException(status_code=400, detail="La merma es mayor que el stock disponible.")
+        result = cursor.fetchone()
+        if not result:
+            raise HTTPException(status_code=404, detail="Ítem no encontrado")
+        conn.commit()
+        return {
+            "id": result['id'],
+            "nombre": result['nombre'],
+            "cantidad_disponible": result['cantidad_disponible'],
+            "unidad_medida": result['unidad_medida'],
+            "cantidad_minima_alerta": result['cantidad_minima_alerta'],
+            "fecha_registro": str(result['fecha_registro']),
+            "fecha_actualizacion": str(result['fecha_actualizacion'])
+        }
+
 # --- CORRECCIÓN: Capturar la excepción de integridad referencial ---
 @inventario_app.delete("/{item_id}")
 def eliminar_item_inventario(item_id: int, conn = Depends(get_db)):
@@ -1,20 +1,30 @@
 # === INVENTARIO_SERVICE.PY ===
 # Cliente HTTP para interactuar con la API de inventario del sistema de restaurante.
 
-import requests
 from typing import List, Dict, Any
 
+from http_client import cliente_http, obtener_json_con_etag
+
 class InventoryService:
     def __init__(self, base_url: str = "http://127.0.0.1:8000"):
         self.base_url = base_url.rstrip("/")
+        self._cache_etag: Dict[str, Any] = {} # url -> (etag, json)
 
     # === MÉTODO: obtener_inventario ===
     # Obtiene la lista completa de items en inventario desde el backend.
     # Ahora incluye 'cantidad_minima_alerta'.
     def obtener_inventario(self) -> List[Dict[str, Any]]:
-        r = requests.get(f"{self.base_url}/inventario")
-        r.raise_for_status()
-        return r.json() # El JSON devuelto por el backend ya incluye 'cantidad_minima_alerta'
+        # Con barra final: evita la redirección de la sub-app montada en cada consulta
+        return obtener_json_con_etag(f"{self.base_url}/inventario/", self._cache_etag) # El JSON devuelto por el backend ya incluye 'cantidad_minima_alerta'
+
+    # === MÉTODO: obtener_alertas ===
+    # Solo los ingredientes en o por debajo de su nivel de alerta (filtrados en el backend).
+    # Con `umbral` también los que tienen cantidad_disponible <= umbral.
+    def obtener_alertas(self, umbral: float = None) -> List[Dict[str, Any]]:
+        url = f"{self.base_url}/inventario/alertas"
+        if umbral is not None:
+            url += f"?umbral={umbral}"
+        return obtener_json_con_etag(url, self._cache_etag)
 
     # === MÉTODO: agregar_item_inventario ===
     # Agrega un nuevo ítem al inventario en el backend o suma la cantidad si ya existe.
@@ -30,7 +40,7 @@ class InventoryService:
             "cantidad_minima_alerta": cantidad_minima_alerta
             # --- FIN AÑADIR EL NUEVO CAMPO ---
         }
-        r = requests.post(f"{self.base_url}/inventario", json=payload)
+        r = cliente_http.post(f"{self.base_url}/inventario", json=payload)
         r.raise_for_status()
         return r.json() # El JSON devuelto por el backend ya incluye 'cantidad_minima_alerta'
 
@@ -45,7 +55,7 @@ class InventoryService:
             "cantidad_minima_alerta": cantidad_minima_alerta
             # --- FIN AÑADIR EL NUEVO CAMPO ---
         }
-        r = requests.put(f"{self.base_url}/inventario/{item_id}", json=payload)
+        r = cliente_http.put(f"{self.base_url}/inventario/{item_id}", json=payload)
         r.raise_for_status()
         return r.json() # El JSON devuelto por el backend ya incluye 'cantidad_minima_alerta'
 
@@ -53,6 +63,43 @@ class InventoryService:
     # Elimina un ítem del inventario en el backend.
     # (No cambia, no involucra el nuevo campo)
     def eliminar_item_inventario(self, item_id: int) -> Dict[str, Any]:
-        r = requests.delete(f"{self.base_url}/inventario/{item_id}")
+        r = cliente_http.delete(f"{self.base_url}/inventario/{item_id}")
         r.raise_for_status()
         return r.json()
+
+    # === MÉTODO: registrar_merma ===
+    # Descuenta stock perdido (queda en el libro de movimientos como 'merma').
+    def registrar_merma(self, item_id: int, cantidad: float, nota: str = None) -> Dict[str, Any]:
+        r = cliente_http.post(f"{self.base_url}/inventario/{item_id}/merma", json={"cantidad": cantidad, "nota": nota})
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: obtener_movimientos ===
+    # Movimientos de stock más recientes primero (de un ingrediente o de todos) desde/hasta: "YYYY-MM-DDTHH:MM:SS".
+    def obtener_movimientos(self, ingrediente_id: int = None, desde: str = None, hasta: str = None) -> List[Dict[str, Any]]:
+        params = {k: v for k, v in {"ingrediente_id": ingrediente_id, "desde": desde, "hasta": hasta}.items() if v is not None}
+        r = cliente_http.get(f"{self.base_url}/inventario/movimientos", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: obtener_stock_historico ===
+    # Stock de cada ingrediente en un momento dado ("YYYY-MM-DD HH:MM:SS").
+    def obtener_stock_historico(self, momento: str) -> List[Dict[str, Any]]:
+        r = cliente_http.get(f"{self.base_url}/inventario/historico", params={"momento": momento})
+        r.raise_for_status()
+        return r.json()["ingredientes"]
+
+    # === MÉTODO: obtener_consumo ===
+    # Consumo, merma y reposición por ingrediente en [desde, hasta) ("YYYY-MM-DDTHH:MM:SS").
+    def obtener_consumo(self, desde: str = None, hasta: str = None) -> List[Dict[str, Any]]:
+        params = {k: v for k, v in {"desde": desde, "hasta": hasta}.items() if v is not None}
+        r = cliente_http.get(f"{self.base_url}/inventario/consumo", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: obtener_pronostico ===
+    # Proyección de agotamiento de todo el inventario (más urgentes primero).
+    def obtener_pronostico(self) -> List[Dict[str, Any]]:
+        r = cliente_http.get(f"{self.base_url}/inventario/pronostico")
+        r.raise_for_status()
+        return r.json()["ingredientes"]
@@ -1,10 +1,10 @@
 # inventario_view.py
 import flet as ft
 from typing import List, Dict, Any
-import threading
-import time
 import requests
 
+from planificador import planificador
+
 def crear_vista_inventario(inventory_service, on_update_ui, page):
     # Campo para mostrar alerta de bajo umbral
     alerta_umbral = ft.Container(expand=False) # Contenedor para la alerta
@@ -51,41 +51,30 @@ def crear_vista_inventario(inventory_service, on_update_ui, page):
     # Variable para rastrear si hay un campo de umbral en edición (opcional, similar a cantidad)
     campo_umbral_en_edicion_id = None
 
-    # FUNCIÓN PARA VERIFICAR ALERTAS PERIÓDICAMENTE
-    def verificar_alertas_periodicamente():
-        while True:
-            try:
-                items = inventory_service.obtener_inventario()
-                
-                # --- VERIFICAR ALERTAS DE INGREDIENTES BAJOS - USAR UMBRAL PERSONALIZADO ---
-                # umbral_bajo = 5 # UMBRAL PARA AVISAR (PUEDES CAMBIAR ESTE VALOR) # <-- COMENTAR ESTA LINEA
-                # ingredientes_bajos = [item for item in items if item['cantidad_disponible'] <= umbral_bajo] # <-- COMENTAR ESTA LINEA
-                # Verificar usando el umbral personalizado de cada ítem
-                ingredientes_bajos = [item for item in items if item['cantidad_disponible'] <= item['cantidad_minima_alerta']]
-                # --- FIN VERIFICACIÓN ---
+    # FUNCIÓN PARA VERIFICAR ALERTAS (tarea periódica del planificador, cada 30 segundos)
+    def verificar_alertas():
+        # El backend devuelve solo los ingredientes por debajo de su umbral personalizado
+        # (GET /inventario/alertas); también se ejecuta al llegar el evento 'inventario_alertas'
+        ingredientes_bajos = inventory_service.obtener_alertas()
 
-                # ACTUALIZAR CONTENIDO DE ALERTA
-                if ingredientes_bajos:
-                    nombres_bajos = ", ".join([item['nombre'] for item in ingredientes_bajos])
-                    alerta_umbral.content = ft.Row([
-                        ft.Icon(ft.Icons.WARNING, color=ft.Colors.WHITE),
-                        ft.Text(f"⚠️ Alerta de Inventario: {nombres_bajos} están por debajo del umbral personalizado", color=ft.Colors.WHITE)
-                    ], vertical_alignment=ft.CrossAxisAlignment.CENTER)
-                    alerta_umbral.bgcolor = ft.Colors.RED_700
-                    alerta_umbral.padding = 10
-                    alerta_umbral.border_radius = 5
-                    alerta_umbral.visible = True
-                else:
-                    alerta_umbral.visible = False # Ocultar si no hay alertas
-                # --- FIN VERIFICACIÓN ---
-                
-            except Exception as e:
-                print(f"Error en verificación periódica: {e}")
-                time.sleep(30) # ESPERAR 30 SEGUNDOS ANTES DE REINTENTAR
+        # ACTUALIZAR CONTENIDO DE ALERTA
+        if ingredientes_bajos:
+            nombres_bajos = ", ".join([item['nombre'] for item in ingredientes_bajos])
+            alerta_umbral.content = ft.Row([
+                ft.Icon(ft.Icons.WARNING, color=ft.Colors.WHITE),
+                ft.Text(f"⚠️ Alerta de Inventario: {nombres_bajos} están por debajo del umbral personalizado", color=ft.Colors.WHITE)
+            ], vertical_alignment=ft.CrossAxisAlignment.CENTER)
+            alerta_umbral.bgcolor = ft.Colors.RED_700
+            alerta_umbral.padding = 10
+            alerta_umbral.border_radius = 5
+            alerta_umbral.visible = True
+        else:
+            alerta_umbral.visible = False # Ocultar si no hay alertas
+        # --- FIN VERIFICACIÓN ---
+        page.update()
 
-    # INICIAR VERIFICACIÓN PERIÓDICA EN UN HILO SEPARADO
-    hilo_verificacion = threading.Thread(target=verificar_alertas_periodicamente, daemon=True)
-    hilo_verificacion.start()
+    # REGISTRAR LA VERIFICACIÓN PERIÓDICA EN EL PLANIFICADOR COMPARTIDO
+    planificador.agregar("alertas_inventario", verificar_alertas, 30)
 
     def actualizar_lista():
         nonlocal campo_en_edicion_id, campo_umbral_en_edicion_id # Acceder a las variables del scope superior
@@ -97,28 +86,9 @@ def crear_vista_inventario(inventory_service, on_update_ui, page):
         print("Actualizando lista de inventario...") # Mensaje de depuración
         try:
             items = inventory_service.obtener_inventario()
-            
-            # --- VERIFICAR ALERTAS DE INGREDIENTES BAJOS - USAR UMBRAL PERSONALIZADO ---
-            # umbral_bajo = 5 # UMBRAL PARA AVISAR (PUEDES CAMBIAR ESTE VALOR) # <-- COMENTAR ESTA LINEA
-            # ingredientes_bajos = [item for item in items if item['cantidad_disponible'] <= umbral_bajo] # <-- COMENTAR ESTA LINEA
-            # Verificar usando el umbral personalizado de cada ítem
-            ingredientes_bajos = [item for item in items if item['cantidad_disponible'] <= item['cantidad_minima_alerta']]
-            # --- FIN VERIFICACIÓN ---
 
-            # ACTUALIZAR CONTENIDO DE ALERTA
-            if ingredientes_bajos:
-                nombres_bajos = ", ".join([item['nombre'] for item in ingredientes_bajos])
-                alerta_umbral.content = ft.Row([
-                    ft.Icon(ft.Icons.WARNING, color=ft.Colors.WHITE),
-                    ft.Text(f"⚠️ Alerta de Inventario: {nombres_bajos} están por debajo del umbral personalizado", color=ft.Colors.WHITE)
-                ], vertical_alignment=ft.CrossAxisAlignment.CENTER)
-                alerta_umbral.bgcolor = ft.Colors.RED_700
-                alerta_umbral.padding = 10
-                alerta_umbral.border_radius = 5
-                alerta_umbral.visible = True
-            else:
-                alerta_umbral.visible = False # Ocultar si no hay alertas
-            # --- FIN VERIFICACIÓN ---
+            # La alerta se calcula en el backend (ver verificar_alertas)
+            planificador.ejecutar_ahora("alertas_inventario")
             
             # Limpiar la lista visual antes de reconstruir
             lista_inventario.controls.clear()
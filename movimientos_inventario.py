@@ -0,0 +1,241 @@
+# movimientos_inventario.py
+# Libro de movimientos del inventario (tabla movimientos_inventario de SqlPRO.sql): consultas de
+# stock histórico y de consumo, y marcado del motivo de las escrituras de stock.
+# Las filas las escribe el trigger registrar_movimientos_inventario() por cada sentencia que cambia
+# inventario.cantidad_disponible; la aplicación solo indica antes el motivo (consumo, reposición,
+# merma...) con variables locales de la transacción, así ningún camino de escritura puede olvidarse
+# de registrar su movimiento.
+# La foto diaria del stock (inventario_snapshots) la toma SnapshotsInventario, un hilo que backend.py
+# arranca en el startup.
+
+import os
+import threading
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+HORA_SNAPSHOT_INVENTARIO = os.environ.get("HORA_SNAPSHOT_INVENTARIO", "04:00") # HH:MM, hora local del servidor
+
+SQL_MARCAR_MOVIMIENTOS = """
+    SELECT set_config('restaurante.motivo_inventario', %(motivo)s, true),
+           set_config('restaurante.pedido_inventario', %(pedido_id)s, true),
+           set_config('restaurante.nota_inventario', %(nota)s, true)
+"""
+
+# Por ingrediente: saldo del último movimiento hasta el momento pedido (índice
+# idx_movimientos_inventario_ingrediente) o, si los movimientos se archivaron, la última foto.
+SQL_STOCK_EN = """
+    SELECT i.id, i.nombre, i.unidad_medida,
+           COALESCE(m.saldo, s.cantidad) AS cantidad,
+           COALESCE(m.fecha_hora, s.fecha_hora) AS fecha_hora
+    FROM inventario i
+    LEFT JOIN LATERAL (
+        SELECT mi.saldo, mi.fecha_hora
+        FROM movimientos_inventario mi
+        WHERE mi.ingrediente_id = i.id AND mi.fecha_hora <= %(momento)s
+        ORDER BY mi.fecha_hora DESC, mi.id DESC
+        LIMIT 1
+    ) m ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT sn.cantidad, sn.fecha_hora
+        FROM inventario_snapshots sn
+        WHERE sn.ingrediente_id = i.id AND sn.fecha_hora <= %(momento)s
+        ORDER BY sn.fecha_hora DESC
+        LIMIT 1
+    ) s ON m.saldo IS NULL
+    WHERE m.saldo IS NOT NULL OR s.cantidad IS NOT NULL
+    ORDER BY i.nombre
+"""
+
+# Una foto por día aunque haya varios workers: el advisory lock ordena a los que llegan a la vez
+# y el segundo ve la foto del primero.
+SQL_SNAPSHOT_DIARIO = """
+    SELECT pg_advisory_xact_lock(hashtext('inventario_snapshots'));
+    SELECT CASE
+        WHEN EXISTS (SELECT 1 FROM inventario_snapshots WHERE fecha_hora >= CURRENT_DATE) THEN 0
+        ELSE tomar_snapshot_inventario()
+    END AS total
+"""
+
+SQL_CONSUMO = """
+    SELECT m.ingrediente_id, i.nombre, i.unidad_medida,
+           COALESCE(SUM(-m.cantidad) FILTER (WHERE m.tipo = 'consumo'), 0) AS consumo,
+           COALESCE(SUM(-m.cantidad) FILTER (WHERE m.tipo = 'merma'), 0) AS merma,
+           COALESCE(SUM(m.cantidad) FILTER (WHERE m.tipo = 'reposicion'), 0) AS reposicion,
+           COALESCE(SUM(m.cantidad) FILTER (WHERE m.tipo = 'ajuste'), 0) AS ajuste,
+           COUNT(DISTINCT m.pedido_id) AS pedidos
+    FROM movimientos_inventario m
+    LEFT JOIN inventario i ON i.id = m.ingrediente_id
+    WHERE {condicion}
+    GROUP BY m.ingrediente_id, i.nombre, i.unidad_medida
+    ORDER BY consumo DESC, i.nombre
+"""
+
+
+# === FUNCIÓN: marcar_movimientos ===
+# Motivo de los cambios de stock que haga el resto de la transacción (lo lee el trigger).
+def marcar_movimientos(cursor, motivo: str, pedido_id: Optional[int] = None, nota: Optional[str] = None):
+    cursor.execute(SQL_MARCAR_MOVIMIENTOS, {
+        "motivo": motivo,
+        "pedido_id": str(pedido_id) if pedido_id is not None else '',
+        "nota": nota or ''
+    })
+
+
+def _filtro_movimientos(desde: Optional[datetime], hasta: Optional[datetime], ingrediente_id: Optional[int] = None):
+    condiciones = ["TRUE"]
+    params: List[Any] = []
+    if desde is not None:
+        condiciones.append("m.fecha_hora >= %s")
+        params.append(desde)
+    if hasta is not None:
+        condiciones.append("m.fecha_hora < %s")
+        params.append(hasta)
+    if ingrediente_id is not None:
+        condiciones.append("m.ingrediente_id = %s")
+        params.append(ingrediente_id)
+    return " AND ".join(condiciones), params
+
+
+# === FUNCIÓN: stock_en ===
+# Stock de cada ingrediente en un momento dado (los que aún no existían no aparecen).
+def stock_en(cursor, momento: datetime) -> List[Dict[str, Any]]:
+    cursor.execute(SQL_STOCK_EN, {"momento": momento})
+    return [
+        {
+            "id": row['id'],
+            "nombre": row['nombre'],
+            "unidad_medida": row['unidad_medida'],
+            "cantidad": float(row['cantidad']),
+            "desde": row['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S")
+        }
+        for row in cursor.fetchall()
+    ]
+
+# === FUNCIÓN: consumo_por_ingrediente ===
+# Totales por ingrediente y tipo de movimiento en [desde, hasta), leyendo solo ese rango del libro.
+def consumo_por_ingrediente(cursor, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, ingrediente_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    condicion, params = _filtro_movimientos(desde, hasta, ingrediente_id)
+    cursor.execute(SQL_CONSUMO.format(condicion=condicion), params)
+    return [
+        {
+            "ingrediente_id": row['ingrediente_id'],
+            "nombre": row['nombre'], # None si el ingrediente se eliminó
+            "unidad_medida": row['unidad_medida'],
+            "consumo": float(row['consumo']),
+            "merma": float(row['merma']),
+            "reposicion": float(row['reposicion']),
+            "ajuste": float(row['ajuste']),
+            "pedidos": row['pedidos']
+        }
+        for row in cursor.fetchall()
+    ]
+
+# === FUNCIÓN: listar_movimientos ===
+def listar_movimientos(cursor, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, ingrediente_id: Optional[int] = None, limite: int = 500) -> List[Dict[str, Any]]:
+    condicion, params = _filtro_movimientos(desde, hasta, ingrediente_id)
+    cursor.execute(f"""
+        SELECT m.id, m.ingrediente_id, i.nombre, m.fecha_hora, m.tipo, m.cantidad, m.saldo, m.pedido_id, m.nota
+        FROM movimientos_inventario m
+        LEFT JOIN inventario i ON i.id = m.ingrediente_id
+        WHERE {condicion}
+        ORDER BY m.fecha_hora DESC, m.id DESC
+        LIMIT %s
+    """, params + [limite])
+    return [
+        {
+            "id": row['id'],
+            "ingrediente_id": row['ingrediente_id'],
+            "nombre": row['nombre'],
+            "fecha_hora": row['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S"),
+            "tipo": row['tipo'],
+            "cantidad": float(row['cantidad']),
+            "saldo": float(row['saldo']),
+            "pedido_id": row['pedido_id'],
+            "nota": row['nota']
+        }
+        for row in cursor.fetchall()
+    ]
+
+# === FUNCIÓN: tomar_snapshot ===
+def tomar_snapshot(cursor) -> int:
+    cursor.execute("SELECT tomar_snapshot_inventario() AS total")
+    return cursor.fetchone()['total']
+
+# === FUNCIÓN: tomar_snapshot_diario ===
+# Toma la foto solo si hoy todavía no hay ninguna (0 si ya estaba).
+def tomar_snapshot_diario(cursor) -> int:
+    cursor.execute(SQL_SNAPSHOT_DIARIO)
+    return cursor.fetchone()['total']
+
+
+# === CLASE: SnapshotsInventario ===
+# Hilo que toma la foto diaria del stock a HORA_SNAPSHOT_INVENTARIO. Al arrancar también la toma
+# si hoy falta (el backend estaba apagado a esa hora), así stock_en siempre tiene un punto de partida.
+class SnapshotsInventario:
+    def __init__(self, hora: str):
+        horas, minutos = hora.split(":")
+        self.hora = time(int(horas), int(minutos))
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._detener = False
+        self._pool = None
+
+    def iniciar(self, pool):
+        with self._condicion:
+            self._pool = pool
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener = False
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+
+    def _proxima(self, ahora: datetime) -> datetime:
+        proxima = datetime.combine(ahora.date(), self.hora)
+        return proxima if proxima > ahora else proxima + timedelta(days=1)
+
+    def _ciclo(self):
+        objetivo = datetime.now() # La primera vuelta recupera la foto de hoy si falta
+        while True:
+            with self._condicion:
+                espera = (objetivo - datetime.now()).total_seconds()
+                if espera > 0 and not self._detener:
+                    self._condicion.wait(espera)
+                if self._detener:
+                    return
+            if datetime.now() < objetivo:
+                continue # Despertó antes de hora
+            try:
+                with self._pool.conexion() as conn:
+                    with conn.cursor() as cursor:
+                        total = tomar_snapshot_diario(cursor)
+                    conn.commit()
+                if total:
+                    print(f"Foto diaria del inventario guardada: {total} ingredientes")
+                objetivo = self._proxima(datetime.now())
+            except Exception as e:
+                print(f"Error al guardar la foto diaria del inventario: {e}")
+                objetivo = datetime.now() + timedelta(minutes=5) # Reintentar sin saturar la BD
+
+
+# Instancia única por proceso (backend.py la arranca en el startup)
+snapshots_inventario = SnapshotsInventario(HORA_SNAPSHOT_INVENTARIO)
+
+
+if __name__ == "__main__":
+    import sys
+    from database import pool
+
+    if sys.argv[1:] != ["snapshot"]:
+        print("Uso: python movimientos_inventario.py snapshot")
+        sys.exit(1)
+    with pool.conexion() as conn:
+        with conn.cursor() as cursor:
+            total = tomar_snapshot(cursor)
+        conn.commit()
+    pool.cerrar()
+    print(f"Foto del inventario guardada: {total} ingredientes")
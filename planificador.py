@@ -0,0 +1,160 @@
+# planificador.py
+# Planificador de tareas periódicas del cliente (alertas de stock, alertas de retrasos,
+# resincronización de la UI, reloj). Sustituye a los hilos con `while True` + `time.sleep`
+# que tenía cada vista: un solo hilo decide qué toca ejecutar y cada tarea corre en un pool
+# pequeño, sin solaparse consigo misma.
+
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+MAX_TAREAS_SIMULTANEAS = 4
+
+
+# === CLASE: Planificador ===
+class Planificador:
+    def __init__(self, max_hilos: int = MAX_TAREAS_SIMULTANEAS):
+        self._tareas: Dict[str, Dict[str, Any]] = {}
+        self._cola = [] # heap de (próxima ejecución en time.monotonic(), secuencia, nombre)
+        self._secuencia = 0
+        self._condicion = threading.Condition()
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="planificador")
+        self._hilo = None
+        self._detener = False
+
+    # --- TAREAS ---
+    def agregar(self, nombre: str, funcion: Callable[[], Any], intervalo: float, jitter: float = 0.1, inmediato: bool = True):
+        """
+        Registra (o reemplaza) una tarea periódica.
+        Args:
+            nombre (str): Identificador de la tarea.
+            funcion (Callable): Se llama sin argumentos; sus excepciones se registran y no detienen la tarea.
+            intervalo (float): Segundos entre ejecuciones.
+            jitter (float): Variación aleatoria del intervalo (0.1 = ±10 %) para que las tareas no coincidan.
+            inmediato (bool): Ejecutar la primera vez al arrancar en lugar de esperar un intervalo.
+        """
+        with self._condicion:
+            self._tareas[nombre] = {
+                "funcion": funcion,
+                "intervalo": intervalo,
+                "jitter": jitter,
+                "en_curso": False,
+                "ejecuciones": 0,
+                "errores": 0,
+                "ultima_duracion": 0.0,
+                "duracion_total": 0.0,
+                "duracion_max": 0.0,
+                "ultima_ejecucion": None,
+            }
+            self._programar(nombre, 0 if inmediato else self._siguiente_intervalo(nombre))
+        self.iniciar()
+
+    def quitar(self, nombre: str):
+        with self._condicion:
+            self._tareas.pop(nombre, None) # Las entradas que queden en la cola se ignoran
+
+    def ejecutar_ahora(self, nombre: str):
+        """Adelanta la próxima ejecución de una tarea (p. ej. tras un cambio que la afecta)."""
+        with self._condicion:
+            if nombre in self._tareas:
+                self._programar(nombre, 0)
+
+    def _siguiente_intervalo(self, nombre: str) -> float:
+        tarea = self._tareas[nombre]
+        return tarea["intervalo"] * (1 + random.uniform(-tarea["jitter"], tarea["jitter"]))
+
+    def _programar(self, nombre: str, retraso: float):
+        # Llamar con self._condicion tomado
+        self._secuencia += 1
+        heapq.heappush(self._cola, (time.monotonic() + retraso, self._secuencia, nombre))
+        self._condicion.notify()
+
+    # --- CICLO PRINCIPAL ---
+    def iniciar(self):
+        with self._condicion:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener = False
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+        self._ejecutor.shutdown(wait=False)
+
+    def _ciclo(self):
+        with self._condicion:
+            while not self._detener:
+                if not self._cola:
+                    self._condicion.wait()
+                    continue
+                momento, _, nombre = self._cola[0]
+                espera = momento - time.monotonic()
+                if espera > 0:
+                    self._condicion.wait(espera)
+                    continue
+                heapq.heappop(self._cola)
+                tarea = self._tareas.get(nombre)
+                if tarea is None:
+                    continue # Tarea quitada
+                if tarea["en_curso"]:
+                    tarea["repetir"] = True # Adelantada mientras corre: repetir en cuanto termine
+                    continue
+                # Descartar entradas duplicadas (ejecutar_ahora) que quedaron en la cola para esta tarea
+                self._cola = [entrada for entrada in self._cola if entrada[2] != nombre]
+                heapq.heapify(self._cola)
+                tarea["en_curso"] = True
+                try:
+                    self._ejecutor.submit(self._ejecutar, nombre, tarea)
+                except RuntimeError:
+                    return # El intérprete se está cerrando (el pool ya no acepta tareas)
+
+    def _ejecutar(self, nombre: str, tarea: Dict[str, Any]):
+        inicio = time.monotonic()
+        error = False
+        try:
+            tarea["funcion"]()
+        except Exception as e:
+            error = True
+            print(f"Error en la tarea periódica '{nombre}': {e}")
+        duracion = time.monotonic() - inicio
+        with self._condicion:
+            tarea["en_curso"] = False
+            tarea["ejecuciones"] += 1
+            tarea["errores"] += 1 if error else 0
+            tarea["ultima_duracion"] = duracion
+            tarea["duracion_total"] += duracion
+            tarea["duracion_max"] = max(tarea["duracion_max"], duracion)
+            tarea["ultima_ejecucion"] = time.time()
+            if self._tareas.get(nombre) is tarea:
+                # El intervalo se cuenta desde que termina: una tarea lenta no se encadena consigo misma
+                self._programar(nombre, 0 if tarea.pop("repetir", False) else self._siguiente_intervalo(nombre))
+        if duracion > tarea["intervalo"]:
+            print(f"La tarea periódica '{nombre}' tardó {duracion:.2f} s (intervalo: {tarea['intervalo']} s)")
+
+    # --- MÉTRICAS ---
+    def metricas(self) -> Dict[str, Dict[str, Any]]:
+        """Tiempo de ejecución de cada tarea desde que arrancó la aplicación."""
+        with self._condicion:
+            return {
+                nombre: {
+                    "intervalo_segundos": tarea["intervalo"],
+                    "ejecuciones": tarea["ejecuciones"],
+                    "errores": tarea["errores"],
+                    "ultima_duracion_ms": round(tarea["ultima_duracion"] * 1000, 1),
+                    "promedio_ms": round(tarea["duracion_total"] * 1000 / tarea["ejecuciones"], 1) if tarea["ejecuciones"] else 0.0,
+                    "max_ms": round(tarea["duracion_max"] * 1000, 1),
+                    "en_curso": tarea["en_curso"],
+                    "ultima_ejecucion": tarea["ultima_ejecucion"],
+                }
+                for nombre, tarea in sorted(self._tareas.items())
+            }
+
+
+# Instancia única por proceso, compartida por app.py y las vistas
+planificador = Planificador()
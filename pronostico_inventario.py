@@ -0,0 +1,284 @@
+# pronostico_inventario.py
+# Pronóstico de agotamiento de ingredientes (GET /inventario/pronostico). En lugar de un nivel de
+# alerta fijo, estima cuántas horas le quedan a cada ingrediente según su consumo habitual en cada
+# franja de la semana (día y hora): 168 tasas por ingrediente, promedio de las últimas semanas.
+# La historia sale del libro movimientos_inventario (consumo y merma); lo anterior al libro se
+# reconstruye con la explosión de recetas de pedido_items. Se guarda en memoria como una matriz
+# horas x ingredientes y cada consulta solo lee los movimientos nuevos; todo el cálculo se hace
+# con NumPy para el inventario completo a la vez.
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from recetas_cache import cache_recetas
+
+SEMANAS_HISTORIA = int(os.environ.get("PRONOSTICO_SEMANAS", "8"))
+VIGENCIA_SEGUNDOS = 300 # El pronóstico se recalcula como mucho cada 5 min (o antes si cambia el stock)
+MARGEN_LECTURA = timedelta(minutes=5) # Movimientos de transacciones que confirmaron después de la última lectura
+HORAS_SEMANA = 168
+TIPOS_SALIDA = ['consumo', 'merma']
+EPOCA = datetime(1970, 1, 1) # Jueves: las horas se cuentan desde aquí
+
+SQL_SALIDAS_POR_HORA = """
+    SELECT ingrediente_id, date_trunc('hour', fecha_hora) AS hora, SUM(-cantidad) AS cantidad
+    FROM movimientos_inventario
+    WHERE tipo = ANY(%s) AND fecha_hora >= %s
+    GROUP BY ingrediente_id, date_trunc('hour', fecha_hora)
+"""
+
+SQL_PLATOS_POR_HORA = """
+    SELECT date_trunc('hour', fecha) AS hora, nombre, COUNT(*) AS platos
+    FROM pedido_items
+    WHERE fecha >= %s AND fecha < %s
+    GROUP BY date_trunc('hour', fecha), nombre
+"""
+
+
+def hora_absoluta(momento: datetime) -> int:
+    return int((momento - EPOCA).total_seconds() // 3600)
+
+
+# === FUNCIÓN: franjas ===
+# Franja semanal de cada hora absoluta: lunes 0 h = 0 ... domingo 23 h = 167.
+def franjas(horas: np.ndarray) -> np.ndarray:
+    return ((horas // 24 + 3) % 7) * 24 + horas % 24
+
+
+# === FUNCIÓN: tasas_por_franja ===
+# Consumo promedio por franja (168, N) a partir del consumo por hora (H, N) que empieza en la hora
+# absoluta `inicio`. Solo cuentan las horas observadas desde `primera` (historia más corta que la ventana).
+def tasas_por_franja(consumo: np.ndarray, inicio: int, primera: int) -> np.ndarray:
+    horas = np.arange(inicio, inicio + consumo.shape[0])
+    observadas = horas >= primera
+    suma = np.zeros((HORAS_SEMANA, consumo.shape[1]))
+    np.add.at(suma, franjas(horas[observadas]), consumo[observadas])
+    ocurrencias = np.bincount(franjas(horas[observadas]), minlength=HORAS_SEMANA)
+    return suma / np.maximum(ocurrencias, 1)[:, None]
+
+
+# === FUNCIÓN: horas_hasta_consumir ===
+# Horas hasta que se consuma `objetivo` (N,) de cada ingrediente con las tasas (168, N), desde la
+# franja `franja` de la que ya pasó `transcurrido` (fracción de hora). NaN si no se consume nunca.
+# El patrón se repite cada semana: las semanas completas se saltan de una vez.
+def horas_hasta_consumir(objetivo: np.ndarray, tasas: np.ndarray, franja: int, transcurrido: float) -> np.ndarray:
+    columnas = np.arange(tasas.shape[1])
+    por_hora = tasas[(franja + np.arange(HORAS_SEMANA)) % HORAS_SEMANA]
+    acumulado = np.cumsum(por_hora, axis=0)
+    semanal = acumulado[-1]
+    # Se cuenta desde el inicio de la hora actual: lo consumido en lo que va de hora se suma al objetivo
+    restante = np.maximum(objetivo, 0) + por_hora[0] * transcurrido
+    with np.errstate(divide='ignore', invalid='ignore'):
+        semanas = np.where(semanal > 0, np.maximum(np.ceil(restante / semanal) - 1, 0), 0)
+        resto = restante - semanas * semanal
+        hora = np.argmax(acumulado >= resto - 1e-9, axis=0)
+        previo = np.where(hora > 0, acumulado[np.maximum(hora - 1, 0), columnas], 0)
+        dentro = (resto - previo) / por_hora[hora, columnas]
+        horas = semanas * HORAS_SEMANA + hora + dentro - transcurrido
+    horas = np.where(semanal > 0, horas, np.nan)
+    return np.where(objetivo <= 0, 0.0, horas)
+
+
+# === CLASE: PronosticoInventario ===
+class PronosticoInventario:
+    def __init__(self, semanas: int):
+        self.semanas = semanas
+        self._lock = threading.Lock() # Un cálculo a la vez
+        self._lock_eventos = threading.Lock() # Solo para los avisos del bus (no espera a un cálculo)
+        self._version_stock = 0 # Aumenta con cada cambio de stock: el resultado guardado queda viejo
+        self._recargar = True
+        self._columnas: Dict[int, int] = {} # ingrediente_id -> columna de la matriz
+        self._consumo: Optional[np.ndarray] = None # (horas, ingredientes); None = cargar todo
+        self._inicio = 0 # Hora absoluta de la fila 0
+        self._primera: Optional[int] = None # Primera hora con pedidos (None = sin historia)
+        self._leido_hasta: Optional[datetime] = None
+        self._resultado: Optional[Dict[str, Any]] = None
+        self._version_resultado = -1
+        self._momento_resultado = 0.0
+        self.cargas = 0
+
+    def al_recibir_evento(self, evento: Dict[str, Any]):
+        # Oyente del bus de eventos: un cambio de stock cambia las proyecciones (la historia se lee
+        # incrementalmente en la próxima consulta); las recetas cambian la historia anterior al libro.
+        tabla, operacion = evento.get("tabla"), evento.get("operacion")
+        if tabla in ("recetas", "inventario", "inventario_stock") or operacion == "RECONECTADO":
+            with self._lock_eventos:
+                self._version_stock += 1
+                if tabla == "recetas" or operacion == "RECONECTADO":
+                    self._recargar = True
+
+    # --- HISTORIA ---
+    def _asegurar_columnas(self, ingredientes: List[int]):
+        nuevos = [i for i in ingredientes if i not in self._columnas]
+        for ingrediente_id in nuevos:
+            self._columnas[ingrediente_id] = len(self._columnas)
+        if nuevos and self._consumo is not None:
+            self._consumo = np.pad(self._consumo, ((0, 0), (0, len(nuevos))))
+
+    def _ventana(self, ahora: datetime):
+        fin = hora_absoluta(ahora) + 1
+        return fin - self.semanas * HORAS_SEMANA, fin
+
+    def _sumar_salidas(self, cursor, desde: datetime):
+        cursor.execute(SQL_SALIDAS_POR_HORA, (TIPOS_SALIDA, desde))
+        filas = cursor.fetchall()
+        self._asegurar_columnas(sorted({row['ingrediente_id'] for row in filas}))
+        if not filas:
+            return
+        horas = np.array([hora_absoluta(row['hora']) for row in filas]) - self._inicio
+        columnas = np.array([self._columnas[row['ingrediente_id']] for row in filas])
+        cantidades = np.array([float(row['cantidad']) for row in filas])
+        dentro = (horas >= 0) & (horas < self._consumo.shape[0])
+        np.add.at(self._consumo, (horas[dentro], columnas[dentro]), cantidades[dentro])
+
+    def _cargar(self, cursor, ahora: datetime):
+        inicio, fin = self._ventana(ahora)
+        desde = EPOCA + timedelta(hours=inicio)
+        self._inicio = inicio
+        cursor.execute("SELECT id FROM inventario")
+        self._columnas = {}
+        self._asegurar_columnas([row['id'] for row in cursor.fetchall()])
+        self._consumo = np.zeros((fin - inicio, len(self._columnas)))
+
+        # Antes del libro de movimientos: platos vendidos x recetas actuales
+        cursor.execute("SELECT MIN(fecha_hora) AS inicio FROM movimientos_inventario")
+        inicio_libro = cursor.fetchone()['inicio'] or ahora
+        if inicio_libro > desde:
+            self._sumar_recetas(cursor, desde, inicio_libro)
+        self._sumar_salidas(cursor, max(desde, inicio_libro))
+
+        cursor.execute("SELECT MIN(fecha) AS primera FROM pedido_items")
+        primera = cursor.fetchone()['primera']
+        self._primera = max(hora_absoluta(primera), inicio) if primera is not None else None
+        self._leido_hasta = ahora
+        self.cargas += 1
+
+    def _sumar_recetas(self, cursor, desde: datetime, hasta: datetime):
+        recetas = cache_recetas.obtener(cursor)
+        cursor.execute(SQL_PLATOS_POR_HORA, (desde, hasta))
+        filas = [row for row in cursor.fetchall() if row['nombre'] in recetas]
+        if not filas:
+            return
+        platos = sorted({row['nombre'] for row in filas})
+        indice_plato = {nombre: i for i, nombre in enumerate(platos)}
+        self._asegurar_columnas(sorted({ingrediente_id for nombre in platos for ingrediente_id, _ in recetas[nombre]}))
+        # Matriz de recetas (platos x ingredientes): vendidos por hora @ recetas = consumo por hora
+        matriz_recetas = np.zeros((len(platos), len(self._columnas)))
+        for nombre in platos:
+            for ingrediente_id, cantidad in recetas[nombre]:
+                matriz_recetas[indice_plato[nombre], self._columnas[ingrediente_id]] += float(cantidad)
+        vendidos = np.zeros((self._consumo.shape[0], len(platos)))
+        horas = np.array([hora_absoluta(row['hora']) for row in filas]) - self._inicio
+        dentro = (horas >= 0) & (horas < vendidos.shape[0])
+        np.add.at(
+            vendidos,
+            (horas[dentro], np.array([indice_plato[row['nombre']] for row in filas])[dentro]),
+            np.array([row['platos'] for row in filas], dtype=float)[dentro]
+        )
+        self._consumo += vendidos @ matriz_recetas
+
+    def _actualizar(self, cursor, ahora: datetime):
+        # Desplazar la ventana hasta la hora actual conservando las horas que siguen dentro
+        inicio, fin = self._ventana(ahora)
+        consumo = np.zeros((fin - inicio, self._consumo.shape[1]))
+        desde_comun, hasta_comun = max(inicio, self._inicio), min(fin, self._inicio + self._consumo.shape[0])
+        if desde_comun < hasta_comun:
+            consumo[desde_comun - inicio:hasta_comun - inicio] = self._consumo[desde_comun - self._inicio:hasta_comun - self._inicio]
+        self._consumo, self._inicio = consumo, inicio
+        if self._primera is not None:
+            self._primera = max(self._primera, inicio)
+
+        # Las horas desde la última lectura (con margen) se vuelven a sumar enteras
+        desde = self._leido_hasta - MARGEN_LECTURA
+        desde = desde.replace(minute=0, second=0, microsecond=0)
+        fila = max(hora_absoluta(desde) - self._inicio, 0)
+        self._consumo[fila:] = 0
+        self._sumar_salidas(cursor, desde)
+        if self._primera is None and self._consumo.any():
+            self._primera = self._inicio + int(np.argmax(self._consumo.any(axis=1)))
+        self._leido_hasta = ahora
+
+    # --- PROYECCIÓN ---
+    def obtener(self, cursor) -> Dict[str, Any]:
+        """Proyección de todo el inventario; se reutiliza mientras no cambie el stock (hasta VIGENCIA_SEGUNDOS)."""
+        with self._lock:
+            with self._lock_eventos:
+                version = self._version_stock
+                if self._recargar:
+                    self._consumo = None
+                    self._recargar = False
+            if (self._resultado is not None and self._version_resultado == version
+                    and time.monotonic() - self._momento_resultado < VIGENCIA_SEGUNDOS):
+                return self._resultado
+            ahora = datetime.now()
+            try:
+                if self._consumo is None:
+                    self._cargar(cursor, ahora)
+                else:
+                    self._actualizar(cursor, ahora)
+                cursor.execute("""
+                    SELECT id, nombre, unidad_medida, cantidad_disponible, cantidad_minima_alerta
+                    FROM inventario
+                    ORDER BY nombre
+                """)
+                inventario = cursor.fetchall()
+            except Exception:
+                self._consumo = None # La historia pudo quedar a medio sumar: la próxima consulta la carga entera
+                raise
+            self._asegurar_columnas([row['id'] for row in inventario])
+            self._resultado = self._proyectar(inventario, ahora)
+            self._version_resultado = version
+            self._momento_resultado = time.monotonic()
+            return self._resultado
+
+    def _proyectar(self, inventario: List[dict], ahora: datetime) -> Dict[str, Any]:
+        columnas = np.array([self._columnas[row['id']] for row in inventario], dtype=int)
+        if self._primera is None:
+            tasas = np.zeros((HORAS_SEMANA, len(inventario)))
+        else:
+            tasas = tasas_por_franja(self._consumo, self._inicio, self._primera)[:, columnas]
+        stock = np.array([float(row['cantidad_disponible']) for row in inventario])
+        alerta = np.array([float(row['cantidad_minima_alerta']) for row in inventario])
+        franja = int(franjas(np.array([hora_absoluta(ahora)]))[0])
+        transcurrido = ahora.minute / 60 + ahora.second / 3600
+
+        hasta_agotarse = horas_hasta_consumir(stock, tasas, franja, transcurrido)
+        hasta_alerta = horas_hasta_consumir(stock - alerta, tasas, franja, transcurrido)
+        proximas = tasas[(franja + np.arange(25)) % HORAS_SEMANA]
+        proximas_24h = proximas[:24].sum(axis=0) - (proximas[0] - proximas[24]) * transcurrido
+
+        def momento(horas: float) -> Optional[str]:
+            return (ahora + timedelta(hours=float(horas))).strftime("%Y-%m-%d %H:%M:%S") if not np.isnan(horas) else None
+
+        ingredientes = [
+            {
+                "id": row['id'],
+                "nombre": row['nombre'],
+                "unidad_medida": row['unidad_medida'],
+                "cantidad_disponible": float(stock[i]),
+                "cantidad_minima_alerta": float(alerta[i]),
+                "consumo_diario": round(float(tasas[:, i].sum()) / 7, 3),
+                "consumo_proximas_24h": round(float(proximas_24h[i]), 3),
+                "horas_hasta_alerta": None if np.isnan(hasta_alerta[i]) else round(float(hasta_alerta[i]), 1),
+                "alerta_en": momento(hasta_alerta[i]),
+                "horas_hasta_agotarse": None if np.isnan(hasta_agotarse[i]) else round(float(hasta_agotarse[i]), 1),
+                "agotado_en": momento(hasta_agotarse[i])
+            }
+            for i, row in enumerate(inventario)
+        ]
+        # Los que se agotan antes primero; los que no se consumen al final
+        ingredientes.sort(key=lambda p: (p["horas_hasta_agotarse"] is None, p["horas_hasta_agotarse"] or 0, p["nombre"]))
+        return {
+            "generado": ahora.strftime("%Y-%m-%d %H:%M:%S"),
+            "semanas_historia": self.semanas,
+            "historia_desde": (EPOCA + timedelta(hours=self._primera)).strftime("%Y-%m-%d %H:%M:%S") if self._primera is not None else None,
+            "ingredientes": ingredientes
+        }
+
+
+# Instancia única por proceso (backend.py la suscribe al bus de eventos)
+pronostico_inventario = PronosticoInventario(SEMANAS_HISTORIA)
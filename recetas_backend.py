@@ -1,22 +1,15 @@
 # recetas_backend.py
 # Backend API para gestionar recetas e ingredientes de recetas.
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
 from pydantic import BaseModel
-from typing import List
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import List, Optional
 import json
 
-# Configuración directa de PostgreSQL
-DATABASE_URL = "dbname=restaurant_db user=postgres password=postgres host=localhost port=5432"
-
-def get_db():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    try:
-        yield conn
-    finally:
-        conn.close()
+# Pool de conexiones compartido con backend.py
+from database import get_db
+from versiones import etag_tablas, respuesta_no_modificada, agregar_etag
+from recetas_cache import cache_recetas
 
 # Modelos Pydantic para Recetas e Ingredientes de Recetas
 class IngredienteRecetaCreate(BaseModel):
@@ -55,50 +48,65 @@ recetas_app = FastAPI(title="Recetas API")
 
 # --- ENDPOINTS PARA RECETAS ---
 
+# --- CONSULTA DE RECETAS CON SUS INGREDIENTES ---
+# Una sola consulta: los ingredientes de cada receta llegan ya agregados en un array JSON
+# (antes se hacía una consulta de ingredientes por receta).
+SQL_RECETAS_CON_INGREDIENTES = """
+    SELECT r.id, r.nombre_plato, r.descripcion, r.instrucciones, r.fecha_creacion, r.fecha_actualizacion,
+           COALESCE(
+               json_agg(
+                   json_build_object(
+                       'ingrediente_id', ir.ingrediente_id,
+                       'nombre_ingrediente', i.nombre,
+                       'cantidad_necesaria', ir.cantidad_necesaria,
+                       'unidad_medida_necesaria', ir.unidad_medida_necesaria
+                   ) ORDER BY ir.id
+               ) FILTER (WHERE ir.id IS NOT NULL),
+               '[]'::json
+           ) AS ingredientes
+    FROM recetas r
+    LEFT JOIN ingredientes_recetas ir ON ir.receta_id = r.id
+    LEFT JOIN inventario i ON i.id = ir.ingrediente_id
+    WHERE {condicion}
+    GROUP BY r.id
+    ORDER BY r.nombre_plato;
+"""
+
+def receta_a_dict(receta_db) -> dict:
+    return {
+        "id": receta_db['id'],
+        "nombre_plato": receta_db['nombre_plato'],
+        "descripcion": receta_db['descripcion'],
+        "instrucciones": receta_db['instrucciones'],
+        "fecha_creacion": str(receta_db['fecha_creacion']),
+        "fecha_actualizacion": str(receta_db['fecha_actualizacion']),
+        "ingredientes": receta_db['ingredientes']
+    }
+# --- FIN CONSULTA DE RECETAS ---
+
 @recetas_app.get("/", response_model=List[RecetaResponse])
-def obtener_recetas(conn = Depends(get_db)):
+def obtener_recetas(request: Request, response: Response, nombres: Optional[List[str]] = Query(None), conn = Depends(get_db)):
     """
     Obtiene todas las recetas con sus ingredientes.
+    Con ?nombres=Pizza&nombres=Hamburguesa solo devuelve las recetas de esos platos
+    (parámetro repetido: un nombre puede contener comas, p. ej. "Cielo, mar y tierra").
     """
     try:
         with conn.cursor() as cursor:
-            # Obtener recetas
-            cursor.execute("""
-                SELECT id, nombre_plato, descripcion, instrucciones, fecha_creacion, fecha_actualizacion
-                FROM recetas
-                ORDER BY nombre_plato;
-            """)
-            recetas_db = cursor.fetchall()
-
-            resultado = []
-            for receta_db in recetas_db:
-                # Obtener ingredientes para cada receta
-                cursor.execute("""
-                    SELECT ir.ingrediente_id, i.nombre as nombre_ingrediente, ir.cantidad_necesaria, ir.unidad_medida_necesaria
-                    FROM ingredientes_recetas ir
-                    JOIN inventario i ON ir.ingrediente_id = i.id
-                    WHERE ir.receta_id = %s;
-                """, (receta_db['id'],))
-                ingredientes_db = cursor.fetchall()
-
-                resultado.append({
-                    "id": receta_db['id'],
-                    "nombre_plato": receta_db['nombre_plato'],
-                    "descripcion": receta_db['descripcion'],
-                    "instrucciones": receta_db['instrucciones'],
-                    "fecha_creacion": str(receta_db['fecha_creacion']),
-                    "fecha_actualizacion": str(receta_db['fecha_actualizacion']),
-                    "ingredientes": [
-                        {
-                            "ingrediente_id": ing['ingrediente_id'],
-                            "nombre_ingrediente": ing['nombre_ingrediente'],
-                            "cantidad_necesaria": ing['cantidad_necesaria'],
-                            "unidad_medida_necesaria": ing['unidad_medida_necesaria']
-                        }
-                        for ing in ingredientes_db
-                    ]
-                })
-
+            # Depende de los nombres de ingredientes, no del stock (ver trigger_version_inventario_nombres)
+            etag = etag_tablas(cursor, "recetas", "inventario_nombres")
+            no_modificada = respuesta_no_modificada(request, etag)
+            if no_modificada:
+                return no_modificada
+
+            if nombres is not None:
+                lista_nombres = [nombre.strip() for nombre in nombres if nombre.strip()]
+                cursor.execute(SQL_RECETAS_CON_INGREDIENTES.format(condicion="r.nombre_plato = ANY(%s)"), (lista_nombres,))
+            else:
+                cursor.execute(SQL_RECETAS_CON_INGREDIENTES.format(condicion="TRUE"))
+            resultado = [receta_a_dict(receta_db) for receta_db in cursor.fetchall()]
+
+            agregar_etag(response, etag)
             return resultado
     except Exception as e:
         print(f"Error en obtener_recetas: {e}")
@@ -112,43 +120,13 @@ def obtener_receta_por_plato(nombre_plato: str, conn = Depends(get_db)):
     """
     try:
         with conn.cursor() as cursor:
-            # Obtener receta
-            cursor.execute("""
-                SELECT id, nombre_plato, descripcion, instrucciones, fecha_creacion, fecha_actualizacion
-                FROM recetas
-                WHERE nombre_plato = %s;
-            """, (nombre_plato,))
+            cursor.execute(SQL_RECETAS_CON_INGREDIENTES.format(condicion="r.nombre_plato = %s"), (nombre_plato,))
             receta_db = cursor.fetchone()
 
             if not receta_db:
                 raise HTTPException(status_code=404, detail="Receta no encontrada para el plato especificado.")
 
-            # Obtener ingredientes para la receta
-            cursor.execute("""
-                SELECT ir.ingrediente_id, i.nombre as nombre_ingrediente, ir.cantidad_necesaria, ir.unidad_medida_necesaria
-                FROM ingredientes_recetas ir
-                JOIN inventario i ON ir.ingrediente_id = i.id
-                WHERE ir.receta_id = %s;
-            """, (receta_db['id'],))
-            ingredientes_db = cursor.fetchall()
-
-            return {
-                "id": receta_db['id'],
-                "nombre_plato": receta_db['nombre_plato'],
-                "descripcion": receta_db['descripcion'],
-                "instrucciones": receta_db['instrucciones'],
-                "fecha_creacion": str(receta_db['fecha_creacion']),
-                "fecha_actualizacion": str(receta_db['fecha_actualizacion']),
-                "ingredientes": [
-                    {
-                        "ingrediente_id": ing['ingrediente_id'],
-                        "nombre_ingrediente": ing['nombre_ingrediente'],
-                        "cantidad_necesaria": ing['cantidad_necesaria'],
-                        "unidad_medida_necesaria": ing['unidad_medida_necesaria']
-                    }
-                    for ing in ingredientes_db
-                ]
-            }
+            return receta_a_dict(receta_db)
     except HTTPException:
         # Re-raise HTTP exceptions (como 404)
         raise
@@ -191,6 +169,7 @@ def crear_receta(receta: RecetaCreate, conn = Depends(get_db)):
                 """, (receta_id, ing.ingrediente_id, ing.cantidad_necesaria, ing.unidad_medida_necesaria))
 
             conn.commit()
+            cache_recetas.invalidar() # Los demás workers se enteran por el evento 'recetas'
             
             # Retornar la receta creada (opcional: llamar a obtener_receta_por_plato)
             return obtener_receta_por_plato(receta.nombre_plato, conn)
@@ -251,6 +230,7 @@ def actualizar_receta(nombre_plato: str, receta_actualizada: RecetaUpdate, conn
                 """, (receta_id, ing.ingrediente_id, ing.cantidad_necesaria, ing.unidad_medida_necesaria))
 
             conn.commit()
+            cache_recetas.invalidar() # Los demás workers se enteran por el evento 'recetas'
             
             # Retornar la receta actualizada (opcional: llamar a obtener_receta_por_plato)
             nombre_para_retorno = receta_actualizada.nombre_plato if receta_actualizada.nombre_plato is not None else nombre_plato
@@ -283,6 +263,7 @@ def eliminar_receta(nombre_plato: str, conn = Depends(get_db)):
             # La FK con ON DELETE CASCADE hará el resto
             cursor.execute("DELETE FROM recetas WHERE nombre_plato = %s", (nombre_plato,))
             conn.commit()
+            cache_recetas.invalidar() # Los demás workers se enteran por el evento 'recetas'
             return {"status": "ok", "message": "Receta eliminada"}
 
     except HTTPException:
@@ -0,0 +1,88 @@
+# recetas_cache.py
+# Recetas compiladas en memoria (plato -> [(ingrediente_id, cantidad)]) para que crear un pedido
+# no tenga que leer recetas/ingredientes_recetas en cada POST /pedidos. Las recetas cambian muy
+# poco: la copia se invalida al escribirlas en este worker (recetas_backend.py) y, para el resto
+# de workers, con el evento 'recetas' que emiten los triggers notificar_cambio() de SqlPRO.sql.
+
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+SQL_CARGAR_RECETAS = """
+    SELECT r.nombre_plato, ir.ingrediente_id, ir.cantidad_necesaria
+    FROM recetas r
+    JOIN ingredientes_recetas ir ON ir.receta_id = r.id
+    ORDER BY r.nombre_plato, ir.ingrediente_id
+"""
+
+
+# === CLASE: CacheRecetas ===
+class CacheRecetas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recetas: Optional[Dict[str, List[Tuple[int, Decimal]]]] = None # None = hay que cargar
+        self._generacion = 0 # Aumenta en cada invalidación (descarta cargas que empezaron antes)
+        self.cargas = 0
+
+    def cargar(self, cursor) -> Dict[str, List[Tuple[int, Decimal]]]:
+        with self._lock:
+            generacion = self._generacion
+        cursor.execute(SQL_CARGAR_RECETAS)
+        recetas: Dict[str, List[Tuple[int, Decimal]]] = {}
+        for row in cursor.fetchall():
+            recetas.setdefault(row['nombre_plato'], []).append((row['ingrediente_id'], Decimal(row['cantidad_necesaria'])))
+        with self._lock:
+            # Si llegó una invalidación mientras se leía, lo leído puede estar viejo: no se guarda
+            if generacion == self._generacion:
+                self._recetas = recetas
+            self.cargas += 1
+        return recetas
+
+    def invalidar(self):
+        with self._lock:
+            self._recetas = None
+            self._generacion += 1
+
+    def obtener(self, cursor) -> Dict[str, List[Tuple[int, Decimal]]]:
+        """Recetas compiladas; solo consulta la BD si la copia fue invalidada."""
+        with self._lock:
+            recetas = self._recetas
+        if recetas is None:
+            recetas = self.cargar(cursor)
+        return recetas
+
+    def al_recibir_evento(self, evento: Dict[str, Any]):
+        # Oyente del bus de eventos: cambios de recetas en otro worker, o reconexión del LISTEN
+        # (mientras estuvo caído se pudo perder alguna notificación)
+        if evento.get("tabla") == "recetas" or evento.get("operacion") == "RECONECTADO":
+            self.invalidar()
+
+    # === MÉTODO: ingredientes_necesarios ===
+    # Explota los ítems de un pedido en el total necesario de cada ingrediente y los platos que
+    # lo usan. Los platos sin receta no consumen ingredientes.
+    def ingredientes_necesarios(self, cursor, items: List[dict]) -> List[Dict[str, Any]]:
+        recetas = self.obtener(cursor)
+        platos: Dict[str, int] = {}
+        for item in items:
+            nombre = item.get('nombre')
+            if nombre in recetas:
+                platos[nombre] = platos.get(nombre, 0) + 1
+
+        necesarios: Dict[int, Dict[str, Any]] = {}
+        for nombre in sorted(platos):
+            for ingrediente_id, cantidad in recetas[nombre]:
+                necesario = necesarios.setdefault(ingrediente_id, {"ingrediente_id": ingrediente_id, "cantidad_necesaria": Decimal(0), "platos": []})
+                necesario["cantidad_necesaria"] += cantidad * platos[nombre]
+                necesario["platos"].append(nombre)
+        return [
+            {
+                "ingrediente_id": n["ingrediente_id"],
+                "cantidad_necesaria": str(n["cantidad_necesaria"]), # Texto: se pasa a NUMERIC sin perder precisión
+                "platos": ", ".join(n["platos"])
+            }
+            for n in necesarios.values()
+        ]
+
+
+# Instancia única por proceso (backend.py la carga en el startup y la suscribe al bus de eventos)
+cache_recetas = CacheRecetas()
@@ -1,24 +1,28 @@
  # recetas_service.py
 # Cliente HTTP para interactuar con la API de recetas del sistema de restaurante.
 
-import requests
 from typing import List, Dict, Any
 
+from http_client import cliente_http, obtener_json_con_etag
+
 class RecetasService:
     def __init__(self, base_url: str = "http://127.0.0.1:8000"):
         self.base_url = base_url.rstrip("/")
+        self._cache_etag: Dict[str, Any] = {} # url -> (etag, json)
 
     # === MÉTODO: obtener_recetas ===
-    # Obtiene todas las recetas desde el backend.
-    def obtener_recetas(self) -> List[Dict[str, Any]]:
-        r = requests.get(f"{self.base_url}/recetas/")
-        r.raise_for_status()
-        return r.json()
+    # Obtiene todas las recetas desde el backend (o solo las de los platos indicados).
+    def obtener_recetas(self, nombres: List[str] = None) -> List[Dict[str, Any]]:
+        if nombres is not None:
+            r = cliente_http.get(f"{self.base_url}/recetas/", params={"nombres": nombres})
+            r.raise_for_status()
+            return r.json()
+        return obtener_json_con_etag(f"{self.base_url}/recetas/", self._cache_etag)
 
     # === MÉTODO: obtener_receta_por_plato ===
     # Obtiene una receta específica por el nombre del plato.
     def obtener_receta_por_plato(self, nombre_plato: str) -> Dict[str, Any]:
-        r = requests.get(f"{self.base_url}/recetas/{nombre_plato}")
+        r = cliente_http.get(f"{self.base_url}/recetas/{nombre_plato}")
         r.raise_for_status()
         return r.json()
 
@@ -41,7 +45,7 @@ class RecetasService:
             "instrucciones": instrucciones,
             "ingredientes": ingredientes
         }
-        r = requests.post(f"{self.base_url}/recetas/", json=payload)
+        r = cliente_http.post(f"{self.base_url}/recetas/", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -66,7 +70,7 @@ class RecetasService:
             # Suponemos que se reemplazan todos los ingredientes
             payload["ingredientes"] = nuevos_ingredientes
 
-        r = requests.put(f"{self.base_url}/recetas/{nombre_plato}", json=payload)
+        r = cliente_http.put(f"{self.base_url}/recetas/{nombre_plato}", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -79,7 +83,7 @@ class RecetasService:
         Returns:
             Dict[str, Any]: Mensaje de confirmación.
         """
-        r = requests.delete(f"{self.base_url}/recetas/{nombre_plato}")
+        r = cliente_http.delete(f"{self.base_url}/recetas/{nombre_plato}")
         r.raise_for_status()
         return r.json()
 
@@ -91,7 +95,7 @@ def test_recetas_service():
         recetas = service.obtener_recetas()
         print(f"Conexión exitosa con RecetasService. Número de recetas: {len(recetas)}")
         return True
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         print(f"Error al conectar con RecetasService: {e}")
         return False
 
@@ -1,7 +1,8 @@
 # reservas_service.py
-import requests
 from typing import List, Dict, Any
 
+from http_client import cliente_http
+
 class ReservasService:
     def __init__(self, base_url: str = "http://127.0.0.1:8000"):
         self.base_url = base_url.rstrip("/")
@@ -19,22 +20,23 @@ class ReservasService:
         params = {}
         if fecha:
             params["fecha"] = fecha
-        r = requests.get(f"{self.base_url}/reservas/", params=params)
+        r = cliente_http.get(f"{self.base_url}/reservas/", params=params)
         r.raise_for_status()
         return r.json()
 
     # === MÉTODO: crear_reserva ===
     # Crea una nueva reserva.
-    def crear_reserva(self, mesa_numero: int, cliente_id: int, fecha_hora_inicio: str, fecha_hora_fin: str = None) -> Dict[str, Any]:
+    def crear_reserva(self, mesa_numero: int, cliente_id: int, fecha_hora_inicio: str, fecha_hora_fin: str = None, personas: int = None) -> Dict[str, Any]:
         """
         Crea una nueva reserva.
         Args:
-            mesa_numero (int): Número de la mesa a reservar.
+            mesa_numero (int): Número de la mesa a reservar, o None para que el backend la asigne según `personas`.
             cliente_id (int): ID del cliente que hace la reserva.
             fecha_hora_inicio (str): Fecha y hora de inicio de la reserva (formato: 'YYYY-MM-DD HH:MM:SS').
             fecha_hora_fin (str, optional): Fecha y hora de fin de la reserva (formato: 'YYYY-MM-DD HH:MM:SS').
+            personas (int, optional): Tamaño del grupo.
         Returns:
-            Dict[str, Any]: Detalles de la reserva creada.
+            Dict[str, Any]: Detalles de la reserva creada (incluye la mesa asignada).
         """
         payload = {
             "mesa_numero": mesa_numero,
@@ -43,8 +45,10 @@ class ReservasService:
         }
         if fecha_hora_fin:
             payload["fecha_hora_fin"] = fecha_hora_fin
+        if personas:
+            payload["personas"] = personas
 
-        r = requests.post(f"{self.base_url}/reservas/", json=payload)
+        r = cliente_http.post(f"{self.base_url}/reservas/", json=payload)
         r.raise_for_status()
         return r.json()
 
@@ -58,7 +62,7 @@ class ReservasService:
         Returns:
             Dict[str, Any]: Mensaje de confirmación.
         """
-        r = requests.delete(f"{self.base_url}/reservas/{reserva_id}")
+        r = cliente_http.delete(f"{self.base_url}/reservas/{reserva_id}")
         r.raise_for_status()
         return r.json()
 
@@ -86,22 +90,83 @@ class ReservasService:
         if fecha_hora_fin is not None:
             payload["fecha_hora_fin"] = fecha_hora_fin
 
-        r = requests.put(f"{self.base_url}/reservas/{reserva_id}", json=payload)
+        r = cliente_http.put(f"{self.base_url}/reservas/{reserva_id}", json=payload)
         r.raise_for_status()
         return r.json()
 
     # === MÉTODO: obtener_mesas_disponibles ===
-    # Obtiene la lista de mesas disponibles para una fecha y hora específica.
-    def obtener_mesas_disponibles(self, fecha_hora: str) -> List[Dict[str, Any]]:
+    # Obtiene la lista de mesas disponibles para un grupo en una ventana de tiempo.
+    def obtener_mesas_disponibles(self, fecha_hora: str, fecha_hora_fin: str = None, personas: int = 1) -> List[Dict[str, Any]]:
         """
         Obtiene mesas disponibles para una fecha y hora específica.
         Args:
-            fecha_hora (str): Fecha y hora para verificar disponibilidad (formato: 'YYYY-MM-DD HH:MM:SS').
+            fecha_hora (str): Inicio de la ventana (formato: 'YYYY-MM-DD HH:MM:SS').
+            fecha_hora_fin (str, optional): Fin de la ventana; por defecto, 1 hora después del inicio.
+            personas (int, optional): Tamaño del grupo.
+        Returns:
+            List[Dict[str, Any]]: Lista de mesas disponibles, de menor a mayor capacidad.
+        """
+        params = {"fecha_hora": fecha_hora, "personas": personas}
+        if fecha_hora_fin:
+            params["fecha_hora_fin"] = fecha_hora_fin
+        r = cliente_http.get(f"{self.base_url}/mesas/disponibles/", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: obtener_ocupacion ===
+    # Matriz de ocupación por franjas de 15 minutos de uno o varios días.
+    def obtener_ocupacion(self, fecha: str, dias: int = 1) -> Dict[str, Dict[int, List[bool]]]:
+        """
+        Args:
+            fecha (str): Primer día en formato 'YYYY-MM-DD'.
+            dias (int, optional): Cantidad de días (máximo 31).
+        Returns:
+            Dict[str, Dict[int, List[bool]]]: {fecha: {mesa: [reservada por franja]}}; la franja i empieza
+            a las i * 15 minutos del día.
+        """
+        r = cliente_http.get(f"{self.base_url}/reservas/ocupacion", params={"fecha": fecha, "dias": dias})
+        r.raise_for_status()
+        datos = r.json()
+        total = datos["franjas_por_dia"]
+        return {
+            dia["fecha"]: {
+                int(mesa): [bit == "1" for bit in format(int(hexa, 16), f"0{total}b")]
+                for mesa, hexa in dia["franjas"].items()
+            }
+            for dia in datos["dias"]
+        }
+
+    # === MÉTODO: asignar_mesa ===
+    # Pide al backend la mejor mesa libre para un grupo (sin crear nada).
+    def asignar_mesa(self, personas: int, fecha_hora_inicio: str = None, fecha_hora_fin: str = None) -> Dict[str, Any]:
+        """
+        Args:
+            personas (int): Tamaño del grupo.
+            fecha_hora_inicio (str, optional): Inicio (formato: 'YYYY-MM-DD HH:MM:SS'); sin él, ahora (cliente sin reserva).
+            fecha_hora_fin (str, optional): Fin; por defecto, 1 hora después del inicio.
+        Returns:
+            Dict[str, Any]: Mesa propuesta ({numero, capacidad, ...}). Lanza HTTPError 409 si no hay ninguna libre.
+        """
+        payload = {"personas": personas}
+        if fecha_hora_inicio:
+            payload["fecha_hora_inicio"] = fecha_hora_inicio
+        if fecha_hora_fin:
+            payload["fecha_hora_fin"] = fecha_hora_fin
+        r = cliente_http.post(f"{self.base_url}/mesas/asignar", json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    # === MÉTODO: reasignar_dia ===
+    # Reacomoda las reservas pendientes de un día para aprovechar mejor las mesas.
+    def reasignar_dia(self, fecha: str, aplicar: bool = False) -> Dict[str, Any]:
+        """
+        Args:
+            fecha (str): Día en formato 'YYYY-MM-DD'.
+            aplicar (bool, optional): Guardar el plan; si es False solo se devuelve.
         Returns:
-            List[Dict[str, Any]]: Lista de mesas disponibles.
+            Dict[str, Any]: Plan con los cambios de mesa y los asientos sin usar antes y después.
         """
-        params = {"fecha_hora": fecha_hora}
-        r = requests.get(f"{self.base_url}/mesas/disponibles/", params=params)
+        r = cliente_http.post(f"{self.base_url}/reservas/reasignar", params={"fecha": fecha, "aplicar": str(aplicar).lower()})
         r.raise_for_status()
         return r.json()
 
@@ -113,7 +178,7 @@ def test_reservas_service():
         reservas = service.obtener_reservas()
         print(f"Conexión exitosa con ReservasService. Número de reservas: {len(reservas)}")
         return True
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         print(f"Error al conectar con ReservasService: {e}")
         return False
 
@@ -18,16 +18,22 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
     # Dropdown para seleccionar cliente (solo clientes existentes) - CORREGIDO
     cliente_dropdown = ft.Dropdown(label="Cliente", width=300)
 
-    # Dropdown para seleccionar la mesa (1 a 6)
+    # Dropdown para seleccionar la mesa (1 a 6), o "Automática" para que la elija el backend
     mesa_dropdown = ft.Dropdown(
         label="Mesa",
-        options=[ft.dropdown.Option(str(i)) for i in range(1, 7)], # Opciones 1 a 6
+        options=[ft.dropdown.Option(key="auto", text="Automática")] + [ft.dropdown.Option(str(i)) for i in range(1, 7)], # Opciones 1 a 6
+        value="auto",
         width=200
     )
+    personas_field = ft.TextField(label="Personas", width=120, value="2")
 
     hora_inicio = ft.TextField(label="Hora Inicio (HH:MM)", width=150)
     duracion_horas = ft.TextField(label="Duración (Horas)", width=150, value="1")
 
+    # Grilla de ocupación del día (GET /reservas/ocupacion): una fila por mesa, una celda por hora
+    grilla_ocupacion = ft.Column(spacing=4)
+    ocupacion_actual: Dict[str, Dict[int, List[bool]]] = {} # {fecha: {mesa: [reservada por franja de 15 min]}}
+
     # Lista de reservas
     lista_reservas = ft.ListView(
         expand=1,
@@ -49,6 +55,39 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
             cliente_dropdown.options = [ft.dropdown.Option(text="Error al cargar clientes", key="-1")]
 
 
+    def actualizar_ocupacion(fecha: str):
+        """Descarga la ocupación del día (y del siguiente, para reservas que pasan la medianoche) y dibuja la grilla."""
+        try:
+            ocupacion = reservas_service.obtener_ocupacion(fecha, dias=2)
+        except Exception as e:
+            print(f"Error al cargar la ocupación de mesas: {e}")
+            return
+        ocupacion_actual.clear()
+        ocupacion_actual.update(ocupacion)
+        grilla_ocupacion.controls.clear()
+        for mesa, franjas in sorted(ocupacion.get(fecha, {}).items()):
+            celdas = [
+                ft.Container(
+                    width=18,
+                    height=18,
+                    border_radius=3,
+                    bgcolor=ft.Colors.RED_700 if any(franjas[hora * 4:hora * 4 + 4]) else ft.Colors.GREEN_800,
+                    tooltip=f"{hora:02d}:00"
+                )
+                for hora in range(len(franjas) // 4)
+            ]
+            grilla_ocupacion.controls.append(ft.Row([ft.Text(f"Mesa {mesa}", width=70)] + celdas, spacing=2))
+
+    def mesa_ocupada(mesa_numero: int, inicio_dt: datetime, fin_dt: datetime) -> bool:
+        """Consulta la grilla descargada: True si alguna franja de 15 min de la ventana ya está reservada."""
+        momento = inicio_dt.replace(minute=inicio_dt.minute - inicio_dt.minute % 15, second=0, microsecond=0)
+        while momento < fin_dt:
+            franjas = ocupacion_actual.get(momento.strftime("%Y-%m-%d"), {}).get(mesa_numero)
+            if franjas and franjas[(momento.hour * 60 + momento.minute) // 15]:
+                return True
+            momento += timedelta(minutes=15)
+        return False
+
     def actualizar_reservas_fecha(e):
         try:
             fecha_str = fecha_reservas_text.value.split(": ")[1]
@@ -78,6 +117,7 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
                     border_radius=10
                 )
                 lista_reservas.controls.append(item_row)
+            actualizar_ocupacion(fecha)
             page.update()
         except Exception as e:
             print(f"Error al cargar reservas: {e}")
@@ -109,7 +149,11 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
                  return # Salir si el cliente no está en la lista (raro si se seleccionó del dropdown)
 
 
-            mesa_numero = int(mesa_numero_str)
+            mesa_numero = None if mesa_numero_str == "auto" else int(mesa_numero_str)
+            personas = int(personas_field.value) if personas_field.value else None
+            if mesa_numero is None and not personas:
+                print("Indique la cantidad de personas para asignar la mesa automáticamente.")
+                return
             fecha_base_str = fecha_reservas_text.value.split(": ")[1]
             if fecha_base_str == "Hoy":
                 fecha_base = datetime.now().date()
@@ -151,18 +195,25 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
             duracion = timedelta(hours=duracion_horas_float)
             fin_dt = inicio_dt + duracion
 
+            # Mesa elegida a mano: se descarta antes de enviar si la grilla ya la muestra reservada
+            if mesa_numero is not None and mesa_ocupada(mesa_numero, inicio_dt, fin_dt):
+                print(f"La mesa {mesa_numero} ya está reservada en ese horario. Elija otra o use la asignación automática.")
+                return
+
             # Crear reserva
             print(f"Intentando crear reserva para Mesa {mesa_numero}, Cliente ID {cliente_id}, Fecha {fecha_base}, Hora Inicio {hora_inicio_str}, Duración {duracion_horas_float} horas.")
             resultado = reservas_service.crear_reserva(
                 mesa_numero=mesa_numero,
                 cliente_id=cliente_id, # CORREGIDO: Usar el ID obtenido del key del dropdown
                 fecha_hora_inicio=inicio_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                fecha_hora_fin=fin_dt.strftime("%Y-%m-%d %H:%M:%S")
+                fecha_hora_fin=fin_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                personas=personas
             )
+            mesa_numero = resultado.get("mesa_numero", mesa_numero) # La asignada, si era automática
             print(f"Reserva creada exitosamente: {resultado}")
             # Limpiar campos y actualizar vista
             cliente_dropdown.value = "" # Limpiar la selección de cliente
-            mesa_dropdown.value = "" # Limpiar la selección de mesa
+            mesa_dropdown.value = "auto" # Volver a la asignación automática
             hora_inicio.value = ""
             duracion_horas.value = "1" # Reiniciar a valor por defecto
             actualizar_reservas_fecha(None) # Actualizar la lista de esta vista
@@ -175,6 +226,18 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
             print(f"Error inesperado al crear reserva: {ex}") # Este debería capturar el 500 si ocurre aquí
 
 
+    def optimizar_mesas_click(e):
+        # Reacomoda las reservas pendientes de la fecha mostrada (menos asientos vacíos por mesa)
+        try:
+            fecha_str = fecha_reservas_text.value.split(": ")[1]
+            fecha = datetime.now().strftime("%Y-%m-%d") if fecha_str == "Hoy" else fecha_str
+            resultado = reservas_service.reasignar_dia(fecha, aplicar=True)
+            print(f"Reasignación del {fecha}: {len(resultado['cambios'])} cambios, asientos sin usar {resultado['asientos_sin_usar_antes']} -> {resultado['asientos_sin_usar_despues']}")
+            actualizar_reservas_fecha(None)
+            on_update_ui() # Actualizar la vista de mesas también
+        except Exception as ex:
+            print(f"Error al optimizar mesas: {ex}")
+
     def cancelar_reserva_click(reserva_id: int):
         try:
             # Implementar método en ReservasService para eliminar
@@ -204,14 +267,19 @@ def crear_vista_reservas(reservas_service, clientes_service, mesas_service, on_u
             cliente_dropdown,  # Dropdown para cliente existente
             mesa_dropdown,     # Dropdown para seleccionar mesa (1-6)
             # --- FIN CAMPOS MODIFICADOS ---
-            ft.Row([hora_inicio, duracion_horas]),
+            ft.Row([personas_field, hora_inicio, duracion_horas]),
             ft.ElevatedButton(
                 "Crear Reserva",
                 on_click=crear_reserva_click,
                 style=ft.ButtonStyle(bgcolor=ft.Colors.GREEN_700, color=ft.Colors.WHITE)
             ),
             ft.Divider(),
-            ft.Text("Reservas para la Fecha", size=18, weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Text("Reservas para la Fecha", size=18, weight=ft.FontWeight.BOLD),
+                ft.OutlinedButton("Optimizar mesas", icon=ft.Icons.AUTO_FIX_HIGH, on_click=optimizar_mesas_click)
+            ]),
+            ft.Text("Ocupación por hora (rojo: reservada)", size=14),
+            grilla_ocupacion,
             lista_reservas
         ]),
         padding=20,
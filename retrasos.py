@@ -0,0 +1,195 @@
+# retrasos.py
+# Detección de pedidos atrasados en el backend. Sustituye a la revisión que hacía cada terminal
+# cada 60 s (descargar todos los pedidos activos y comparar fechas): el backend guarda en memoria
+# los pedidos Pendiente/En preparacion en un heap ordenado por vencimiento (fecha_hora + umbral)
+# y un hilo duerme hasta el próximo vencimiento. Al vencer se publica el evento SSE
+# 'pedidos_atrasados' a los clientes de este proceso, al segundo.
+# La copia se actualiza con los eventos 'pedidos' del bus, leyendo solo las filas cambiadas con el
+# cursor xid8 de pedidos.version (el mismo mecanismo que /pedidos/cambios).
+
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+ESTADOS_EN_ESPERA = ['Pendiente', 'En preparacion']
+UMBRAL_RETRASO_MINUTOS = float(os.environ.get("UMBRAL_RETRASO_MINUTOS", "20"))
+ESPERA_MAXIMA_SEGUNDOS = 60 # El hilo se despierta al menos así de seguido (cambios de hora del sistema)
+
+
+# === CLASE: MonitorRetrasos ===
+class MonitorRetrasos:
+    def __init__(self, umbral_minutos: float):
+        self.umbral = timedelta(minutes=umbral_minutos)
+        self._condicion = threading.Condition()
+        self._lock_sincronizacion = threading.Lock() # Una sincronización a la vez (hilo o endpoint)
+        self._pedidos: Dict[int, Dict[str, Any]] = {} # id -> pedido en espera
+        self._vencimientos = [] # heap de (vence, id); las entradas de pedidos que ya no esperan se ignoran
+        self._atrasados = set() # ids ya avisados
+        self._cursor: Optional[str] = None # None = cargar todo
+        self._sincronizar = True
+        self._hilo = None
+        self._detener = False
+        self._pool = None
+        self._publicar: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    # --- CICLO ---
+    def iniciar(self, pool, publicar: Callable[[Dict[str, Any]], None]):
+        """Arranca el hilo. `publicar` entrega el evento a los clientes SSE (bus.publicar)."""
+        with self._condicion:
+            self._pool = pool
+            self._publicar = publicar
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener = False
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+
+    def al_recibir_evento(self, evento: Dict[str, Any]):
+        # Oyente del bus de eventos: solo marca que hay que leer cambios (varios eventos seguidos = una lectura)
+        if evento.get("tabla") == "pedidos" or evento.get("operacion") == "RECONECTADO":
+            with self._condicion:
+                self._sincronizar = True
+                self._condicion.notify()
+
+    def _ciclo(self):
+        while True:
+            with self._condicion:
+                if self._detener:
+                    return
+                if not self._sincronizar:
+                    espera = ESPERA_MAXIMA_SEGUNDOS
+                    if self._vencimientos:
+                        espera = min(espera, max(0.0, (self._vencimientos[0][0] - datetime.now()).total_seconds()))
+                    if espera > 0:
+                        self._condicion.wait(espera)
+                sincronizar = self._sincronizar
+            resueltos = []
+            if sincronizar:
+                try:
+                    with self._pool.conexion() as conn:
+                        with conn.cursor() as cursor:
+                            resueltos = self.sincronizar(cursor)
+                except Exception as e:
+                    print(f"Error al leer pedidos para las alertas de retraso: {e}")
+                    with self._condicion:
+                        self._sincronizar = True
+                        self._condicion.wait(5) # Reintentar sin saturar la BD
+            vencidos = self._sacar_vencidos()
+            if vencidos:
+                self._emitir("VENCIDO", vencidos)
+            if resueltos:
+                self._emitir("RESUELTO", resueltos)
+
+    def _emitir(self, operacion: str, pedidos: List[Dict[str, Any]]):
+        if self._publicar is None:
+            return
+        try:
+            self._publicar({"tabla": "pedidos_atrasados", "operacion": operacion, "pedidos": pedidos})
+        except Exception as e:
+            print(f"Error al publicar pedidos atrasados: {e}")
+
+    # --- SINCRONIZACIÓN CON LA BD ---
+    def sincronizar(self, cursor) -> List[Dict[str, Any]]:
+        """
+        Aplica los cambios de pedidos desde la última lectura. Devuelve los pedidos atrasados que
+        dejaron de esperar (pasaron a Listo, se pagaron o se eliminaron).
+        """
+        with self._lock_sincronizacion:
+            with self._condicion:
+                self._sincronizar = False # Un evento que llegue durante la lectura pide otra
+                desde = self._cursor
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS cursor")
+            nuevo_cursor = cursor.fetchone()['cursor']
+            if desde is None:
+                cursor.execute("""
+                    SELECT id, mesa_numero, numero_app, estado, fecha_hora
+                    FROM pedidos
+                    WHERE estado = ANY(%s) AND fecha_hora IS NOT NULL
+                """, (ESTADOS_EN_ESPERA,))
+                filas = cursor.fetchall()
+                eliminados = []
+            else:
+                cursor.execute("""
+                    SELECT id, mesa_numero, numero_app, estado, fecha_hora
+                    FROM pedidos
+                    WHERE version >= %s::xid8
+                """, (desde,))
+                filas = cursor.fetchall()
+                cursor.execute("SELECT DISTINCT pedido_id FROM pedidos_eliminados WHERE version >= %s::xid8", (desde,))
+                eliminados = [row['pedido_id'] for row in cursor.fetchall()]
+
+            with self._condicion:
+                if desde is None:
+                    leidos = {fila['id'] for fila in filas}
+                    eliminados = [pedido_id for pedido_id in self._pedidos if pedido_id not in leidos]
+                resueltos = []
+                for pedido_id in eliminados:
+                    resueltos += self._quitar(pedido_id)
+                for fila in filas:
+                    if fila['estado'] in ESTADOS_EN_ESPERA and fila['fecha_hora'] is not None:
+                        anterior = self._pedidos.get(fila['id'])
+                        self._pedidos[fila['id']] = dict(fila)
+                        if anterior is None or anterior['fecha_hora'] != fila['fecha_hora']:
+                            heapq.heappush(self._vencimientos, (fila['fecha_hora'] + self.umbral, fila['id']))
+                    else:
+                        resueltos += self._quitar(fila['id'])
+                self._cursor = nuevo_cursor
+                self._condicion.notify() # Puede haber un vencimiento más cercano
+            return resueltos
+
+    def _quitar(self, pedido_id: int) -> List[Dict[str, Any]]:
+        # Llamar con self._condicion tomado
+        pedido = self._pedidos.pop(pedido_id, None)
+        if pedido_id in self._atrasados:
+            self._atrasados.discard(pedido_id)
+            return [{"id": pedido_id, "mesa_numero": pedido['mesa_numero'] if pedido else None}]
+        return []
+
+    def _sacar_vencidos(self) -> List[Dict[str, Any]]:
+        ahora = datetime.now()
+        vencidos = []
+        with self._condicion:
+            while self._vencimientos and self._vencimientos[0][0] <= ahora:
+                vence, pedido_id = heapq.heappop(self._vencimientos)
+                pedido = self._pedidos.get(pedido_id)
+                if pedido is None or pedido_id in self._atrasados or pedido['fecha_hora'] + self.umbral != vence:
+                    continue # Entrada vieja: el pedido ya no espera o ya se avisó
+                self._atrasados.add(pedido_id)
+                vencidos.append(self._serializar(pedido, ahora))
+        return vencidos
+
+    # --- CONSULTA ---
+    def atrasados(self, umbral_minutos: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Pedidos en espera desde hace al menos el umbral (el del monitor si no se indica), más antiguos primero."""
+        umbral = self.umbral if umbral_minutos is None else timedelta(minutes=umbral_minutos)
+        ahora = datetime.now()
+        with self._condicion:
+            pedidos = [p for p in self._pedidos.values() if p['fecha_hora'] + umbral <= ahora]
+            resultado = [self._serializar(p, ahora) for p in sorted(pedidos, key=lambda p: (p['fecha_hora'], p['id']))]
+        return resultado
+
+    def pendiente_sincronizar(self) -> bool:
+        with self._condicion:
+            return self._sincronizar
+
+    @staticmethod
+    def _serializar(pedido: Dict[str, Any], ahora: datetime) -> Dict[str, Any]:
+        return {
+            "id": pedido['id'],
+            "mesa_numero": pedido['mesa_numero'],
+            "numero_app": pedido['numero_app'],
+            "estado": pedido['estado'],
+            "fecha_hora": pedido['fecha_hora'].strftime("%Y-%m-%d %H:%M:%S"),
+            "minutos_retraso": round((ahora - pedido['fecha_hora']).total_seconds() / 60, 2)
+        }
+
+
+# Instancia única por proceso (backend.py la arranca en el startup y la suscribe al bus de eventos)
+monitor_retrasos = MonitorRetrasos(UMBRAL_RETRASO_MINUTOS)
@@ -0,0 +1,47 @@
+# versiones.py
+# ETag para los GET que las terminales consultan constantemente pero que casi no cambian
+# (menú, mesas, inventario, recetas, clientes). La versión sale de las secuencias version_<tabla>,
+# que mantienen los triggers de SqlPRO.sql, así que comprobarla no toca las tablas de datos.
+
+from typing import Optional
+from fastapi import Request, Response
+
+
+# === FUNCIÓN: etag_tablas ===
+# Construye el ETag de un recurso a partir de las versiones de las tablas de las que depende.
+# Debe llamarse ANTES de la consulta de datos: si algo se confirma entre ambas, el cliente
+# recibe datos más nuevos que su ETag y simplemente vuelve a descargarlos la próxima vez.
+# `sufijo` sirve para recursos que además dependen de otra cosa (p. ej. la fecha del día).
+# Devuelve None si alguna tabla tiene cambios sin confirmar: la respuesta se envía sin ETag
+# (y sin 304), porque la versión ya subió pero los datos que se van a leer aún no la incluyen.
+def etag_tablas(cursor, *tablas: str, sufijo: Optional[str] = None) -> Optional[str]:
+    cursor.execute("SELECT tabla, version FROM leer_versiones_tablas(%s)", (list(tablas),))
+    versiones = {row['tabla']: row['version'] for row in cursor.fetchall()}
+    if any(versiones.get(tabla) is None for tabla in tablas):
+        return None
+    partes = [f"{tabla}.{versiones[tabla]}" for tabla in tablas]
+    if sufijo:
+        partes.append(sufijo)
+    return '"' + "-".join(partes) + '"'
+
+
+# === FUNCIÓN: respuesta_no_modificada ===
+# Devuelve un 304 si el cliente ya tiene esta versión (If-None-Match), o None para seguir con la consulta.
+def respuesta_no_modificada(request: Request, etag: Optional[str]) -> Optional[Response]:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match or etag is None:
+        return None
+    etags_cliente = [valor.strip() for valor in if_none_match.split(",")]
+    if etag in etags_cliente or "*" in etags_cliente:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+# === FUNCIÓN: agregar_etag ===
+# Marca la respuesta con su ETag. Solo en respuestas correctas: un resultado de respaldo
+# por error no debe quedar cacheado en el cliente.
+def agregar_etag(response: Response, etag: Optional[str]):
+    if etag is None:
+        return
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache" # El cliente puede guardarla pero debe revalidar